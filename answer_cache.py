@@ -0,0 +1,231 @@
+# answer_cache.py
+#
+# Semantic cache for RAGAgent.generate_answer. Entries are looked up by cosine similarity
+# of the question embedding, so "Apple revenue 2023" and "What was Apple's revenue in
+# 2023?" share one Gemini call. Entries are only reused for the same retrieval params and
+# the same extracted company/year/form signature (so 2022 never answers 2023), and are
+# dropped when the index version changes or one of their chunks is deleted.
+#
+# Changes only mark the cache dirty; it is written to disk by a timer at most every
+# RAG_ANSWER_CACHE_FLUSH_INTERVAL seconds and at interpreter exit, never on the request path.
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_FILE = "answer_cache.json"
+CACHE_VERSION = 1
+DEFAULT_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.9"))
+DEFAULT_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", str(24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "512"))
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("RAG_ANSWER_CACHE_FLUSH_INTERVAL", "30"))
+
+
+def _normalize(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    def __init__(self, path=None, threshold=DEFAULT_THRESHOLD, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        Args:
+            path (str): JSON file for persistence; None keeps the cache in memory only.
+            threshold (float): Minimum cosine similarity for a hit.
+            ttl (float): Seconds an entry stays valid.
+            max_entries (int): LRU capacity.
+            flush_interval (float): Seconds between a change and the write to `path`;
+                0 only writes on flush() / at exit.
+        """
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()   # key -> entry dict, least recently used first
+        self._next_key = 0
+        self._matrix = None             # cached stack of normalized embeddings
+        self._lock = threading.Lock()
+        self._save_lock = threading.RLock()   # one writer of `path` at a time
+        self._dirty = False
+        self._timer = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+        if path:
+            self.load()
+            atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    def _purge(self, index_version):
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if now - entry["created"] > self.ttl:
+                self._drop(key)
+                self.expirations += 1
+            elif entry["index_version"] != index_version:
+                self._drop(key)
+                self.invalidations += 1
+
+    def get(self, embedding, index_version, signature):
+        """
+        Return the cached answer for the most similar question, or None.
+
+        Args:
+            embedding: Question embedding.
+            index_version (str): Current index version; entries from other versions are dropped.
+            signature (str): Retrieval params + extracted query filters; must match exactly.
+        """
+        with self._lock:
+            self._purge(index_version)
+            keys = [key for key, entry in self._entries.items() if entry["signature"] == signature]
+            if not keys:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix = (list(self._entries), np.stack([e["vector"] for e in self._entries.values()]))
+            all_keys, matrix = self._matrix
+            similarities = matrix @ _normalize(embedding)
+
+            best_key, best_sim = None, self.threshold
+            wanted = set(keys)
+            for key, sim in zip(all_keys, similarities):
+                if key in wanted and sim >= best_sim:
+                    best_key, best_sim = key, float(sim)
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            entry = self._entries[best_key]
+            return dict(entry["answer"], cached=True, cache_similarity=round(best_sim, 4),
+                        cached_question=entry["question"])
+
+    def put(self, question, embedding, answer, chunk_ids, index_version, signature):
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = {
+                "question": question,
+                "vector": _normalize(embedding),
+                "answer": answer,
+                "chunk_ids": list(chunk_ids),
+                "index_version": index_version,
+                "signature": signature,
+                "created": time.time(),
+            }
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._mark_dirty()
+
+    def invalidate_chunks(self, chunk_ids):
+        """Drop every entry whose answer was built from one of `chunk_ids`."""
+        chunk_ids = set(chunk_ids)
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if chunk_ids.intersection(entry["chunk_ids"]):
+                    self._drop(key)
+                    self.invalidations += 1
+            self._mark_dirty()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._mark_dirty()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _mark_dirty(self):
+        # Called with self._lock held
+        self._dirty = True
+        if self.path and self.flush_interval > 0 and self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except OSError as e:
+            print(f"⚠️ Could not save the answer cache: {e}")
+
+    def flush(self):
+        """Write the cache to disk if it changed since the last save."""
+        # Waits for a save in progress (e.g. from the timer), so the file is complete on return
+        with self._save_lock:
+            if self._dirty:
+                self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                entries = [
+                    dict(entry, vector=[round(float(x), 6) for x in entry["vector"]])
+                    for entry in self._entries.values()
+                ]
+                self._dirty = False
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"version": CACHE_VERSION, "entries": entries}, f)
+                os.replace(tmp, self.path)
+            except BaseException:
+                with self._lock:
+                    self._dirty = True
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != CACHE_VERSION:
+            return
+        with self._lock:
+            for entry in data.get("entries", [])[-self.max_entries:]:
+                entry["vector"] = np.asarray(entry["vector"], dtype=np.float32)
+                self._entries[self._next_key] = entry
+                self._next_key += 1
+            self._matrix = None
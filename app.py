@@ -1,11 +1,59 @@
-from coordinator_agent import coordinator_handle
+import os
+import time
+
+from lazy_init import record_import, warm_up, startup_report
+from instrumentation import start_metrics_server
+from request_scheduler import DeadlineExceeded, Overloaded, get_scheduler
+
+_start = time.perf_counter()
+from coordinator_agent import coordinator_handle, coordinator_handle_stream, route_message
+record_import("coordinator_agent", time.perf_counter() - _start)
+
+_start = time.perf_counter()
 import gradio as gr
+record_import("gradio", time.perf_counter() - _start)
+
+# Komma-getrennte Komponenten, die nach dem Start im Hintergrund gebaut werden,
+# z. B. "gemini_chat_model,web_agent,rag_index" (leer = alles erst bei der ersten Frage)
+WARM_UP = [name.strip() for name in os.getenv("APP_WARM_UP", "").split(",") if name.strip()]
+
+# Gleichzeitige Gradio-Events insgesamt; die Grenzen pro Agent setzt der Scheduler
+APP_CONCURRENCY = int(os.getenv("APP_CONCURRENCY", "16"))
 
-def chat_logic(message, history):
-    response_text = coordinator_handle(message)
+BUSY_MESSAGE = "⏳ Gerade sind zu viele Anfragen in Bearbeitung. Bitte gleich noch einmal versuchen."
+TIMEOUT_MESSAGE = "⌛ Die Anfrage hat zu lange gedauert und wurde abgebrochen."
+
+scheduler = get_scheduler()
+
+def request_lane(message):
+    # Dieselbe (LLM-freie) Entscheidung wie im Koordinator: Web- oder RAG-Lane
+    return route_message(message)["agent"]
+
+async def chat_logic(message, history):
+    try:
+        response_text = await scheduler.run(request_lane(message), coordinator_handle, message)
+    except Overloaded:
+        response_text = BUSY_MESSAGE
+    except DeadlineExceeded:
+        response_text = TIMEOUT_MESSAGE
     history.append((message, response_text))
     return history
 
+async def chat_logic_stream(message, history):
+    # Teilantworten sofort anzeigen, statt auf die komplette Antwort zu warten
+    history.append((message, ""))
+    try:
+        async for partial in scheduler.stream(request_lane(message), coordinator_handle_stream, message):
+            history[-1] = (message, partial)
+            yield history
+    except Overloaded:
+        history[-1] = (message, BUSY_MESSAGE)
+        yield history
+    except DeadlineExceeded:
+        partial = history[-1][1]
+        history[-1] = (message, f"{partial}\n\n{TIMEOUT_MESSAGE}" if partial else TIMEOUT_MESSAGE)
+        yield history
+
 with gr.Blocks() as demo:
     gr.Markdown("## 📊 Markt-Assistent")
     chatbot = gr.Chatbot(label="🧠 Markt-Assistent", height=400)
@@ -16,8 +64,13 @@ with gr.Blocks() as demo:
         return [("👋 Hallo!", "Ich bin dein Markt-Assistent. Frag mich z. B.: \n- Was ist der aktuelle Kurs von Apple?\n- Gibt es aktuelle Nachrichten zu Microsoft?\n- Wie entwickelt sich die Aktie von Nvidia?")]
 
     demo.load(start, outputs=chatbot)
-    msg.submit(chat_logic, [msg, chatbot], chatbot)
+    msg.submit(chat_logic_stream, [msg, chatbot], chatbot, concurrency_limit=APP_CONCURRENCY)
     clear.click(lambda: [], None, chatbot)
 
 if __name__ == "__main__":
-    demo.launch()
+    print(startup_report())
+    if WARM_UP:
+        warm_up(WARM_UP)
+    # Prometheus-Endpunkt /metrics, nur wenn METRICS_PORT gesetzt ist
+    start_metrics_server()
+    demo.queue(max_size=APP_CONCURRENCY * 4).launch()
@@ -0,0 +1,253 @@
+# batch_forecast.py
+#
+# Nightly batch forecasts for every ticker in web_agent.COMPANIES, every model type and
+# several horizons. The ticker x model grid is fanned out over a process pool; each task
+# fits its model once on the full history (forecasting the longest horizon, shorter
+# horizons are prefixes of it) and once on the history minus a holdout for the MAPE.
+#
+# Results go to Parquet files in persist_store/forecasts:
+#   forecasts.parquet  ticker, model, horizon, ds, yhat, yhat_lower, yhat_upper
+#   metrics.parquet    ticker, model, horizon, mape, fit_seconds, n_points, last_ds, fingerprint, run_at, stale
+#   history.parquet    ticker, ds, y   (what the forecasts were fitted on, for the plots)
+#
+# A run only replaces the (ticker, model, horizon) cells it refitted. A cell whose fit failed
+# keeps its previous rows with stale=True, and they age out through MAX_AGE like any other.
+#
+# The Gradio UI serves these instantly via get_precomputed() and only fits on demand for
+# misses. Run:  python batch_forecast.py [--tickers AAPL MSFT] [--models Prophet ARIMA] [--horizons 30 90]
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from forecast_engine import MODEL_TYPES, FORECAST_WORKERS, fingerprint, fit_forecast, get_forecast_engine, load_price_history
+from instrumentation import observe
+
+BATCH_DIR = os.getenv("FORECAST_BATCH_DIR", os.path.join("persist_store", "forecasts"))
+DEFAULT_HORIZONS = [int(h) for h in os.getenv("FORECAST_HORIZONS", "30,90").split(",") if h.strip()]
+# Precomputed forecasts older than this are treated as misses
+MAX_AGE = float(os.getenv("FORECAST_BATCH_MAX_AGE", str(36 * 3600)))
+
+FORECASTS_FILE = "forecasts.parquet"
+METRICS_FILE = "metrics.parquet"
+HISTORY_FILE = "history.parquet"
+
+_loaded = {"mtime": None, "forecasts": None, "metrics": None, "history": None}
+_loaded_lock = threading.Lock()
+
+
+def mape(actual, predicted):
+    actual = np.asarray(actual, dtype=np.float64)
+    predicted = np.asarray(predicted, dtype=np.float64)
+    mask = actual != 0
+    if not mask.any():
+        return float("nan")
+    return float(np.mean(np.abs((actual[mask] - predicted[mask]) / actual[mask])) * 100)
+
+
+def forecast_task(ticker, model_type, df, horizons):
+    """
+    Process-pool worker for one (ticker, model) cell of the grid.
+
+    Returns:
+        dict: "forecast" (DataFrame for max(horizons)), "blob" (serialized model),
+              "fit_seconds", "mape" ({horizon: MAPE in % on the last `horizon` points})
+    """
+    longest = max(horizons)
+    blob, forecast, fit_seconds = fit_forecast(model_type, df, longest)
+
+    errors = {}
+    if len(df) > longest * 2:
+        # Holdout: fit without the last `longest` points, score each horizon on its prefix
+        train, test = df.iloc[:-longest], df["y"].values[-longest:]
+        _, backtest, _ = fit_forecast(model_type, train, longest)
+        for horizon in horizons:
+            errors[horizon] = mape(test[:horizon], backtest["yhat"].values[:horizon])
+    return {"forecast": forecast, "blob": blob, "fit_seconds": fit_seconds, "mape": errors}
+
+
+def _read_parquet(name):
+    path = os.path.join(BATCH_DIR, name)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception as e:
+        print(f"⚠️ Could not read {path}, it is rewritten from this run only: {e}")
+        return None
+
+
+def _merge(existing, fresh, keys, replaced):
+    """Rows of `existing` whose `keys` are not in `replaced`, followed by `fresh`."""
+    if existing is None or existing.empty:
+        return fresh.reset_index(drop=True)
+    kept = existing[~pd.MultiIndex.from_frame(existing[keys]).isin(list(replaced))] if replaced else existing
+    return pd.concat([kept, fresh], ignore_index=True)
+
+
+def _write_parquet(frame, name):
+    path = os.path.join(BATCH_DIR, name)
+    frame.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def run_batch(tickers=None, models=MODEL_TYPES, horizons=None, workers=FORECAST_WORKERS):
+    """
+    Forecast the ticker x model x horizon grid and write it to BATCH_DIR.
+
+    Args:
+        tickers (list[str]): Default: every ticker in web_agent.COMPANIES.
+        models (list[str]): Model types ("Prophet", "ARIMA").
+        horizons (list[int]): Horizons in business days (default: FORECAST_HORIZONS).
+        workers (int): Fit processes.
+
+    Returns:
+        pd.DataFrame: The metrics table (one row per ticker x model x horizon), including
+        stale rows kept from earlier runs for cells that failed this time.
+    """
+    if not tickers:
+        from web_agent import COMPANIES
+        tickers = list(COMPANIES.values())
+    horizons = sorted(set(horizons or DEFAULT_HORIZONS))
+    run_at = pd.Timestamp.now(tz="UTC").tz_localize(None)
+    start = time.perf_counter()
+
+    histories = {}
+    for ticker in tickers:
+        df = load_price_history(ticker)
+        if df.empty:
+            print(f"⚠️ No price history for {ticker}, skipped")
+            continue
+        histories[ticker] = df[["ds", "y"]].reset_index(drop=True)
+
+    engine = get_forecast_engine()
+    forecast_frames, metric_rows = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(forecast_task, ticker, model_type, df, horizons): (ticker, model_type)
+            for ticker, df in histories.items() for model_type in models
+        }
+        for future in as_completed(futures):
+            ticker, model_type = futures[future]
+            df = histories[ticker]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"❌ Forecast {ticker}/{model_type} failed: {e}")
+                continue
+            observe("forecast.fit", result["fit_seconds"], model=model_type, source="batch")
+            fp = fingerprint(df)
+            # Later on-demand requests start from this model (incremental update / predict only)
+            engine.seed(ticker, model_type, df, result["blob"], result["forecast"], horizons)
+            for horizon in horizons:
+                forecast_frames.append(result["forecast"].iloc[:horizon].assign(
+                    ticker=ticker, model=model_type, horizon=horizon))
+                metric_rows.append({
+                    "ticker": ticker, "model": model_type, "horizon": horizon,
+                    "mape": result["mape"].get(horizon, float("nan")),
+                    "fit_seconds": result["fit_seconds"], "n_points": len(df),
+                    "last_ds": df["ds"].iloc[-1], "fingerprint": fp, "run_at": run_at,
+                })
+            print(f"📈 {ticker}/{model_type}: fit {result['fit_seconds']:.2f}s, MAPE "
+                  + ", ".join(f"{h}d={m:.2f}%" for h, m in result["mape"].items()))
+
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    fresh_metrics = pd.DataFrame(metric_rows)
+    cells = set(zip(fresh_metrics["ticker"], fresh_metrics["model"], fresh_metrics["horizon"])) if metric_rows else set()
+    attempted = {(t, m, h) for t in tickers for m in models for h in horizons}
+    refit_tickers = {(t,) for t, _, _ in cells}
+
+    # Previous results of cells that failed this time stay, flagged as stale
+    metrics = _read_parquet(METRICS_FILE)
+    if metrics is not None:
+        if "stale" not in metrics.columns:
+            metrics["stale"] = False
+        failed = pd.MultiIndex.from_frame(metrics[["ticker", "model", "horizon"]]).isin(list(attempted - cells))
+        metrics.loc[failed, "stale"] = True
+    metrics = _merge(metrics, fresh_metrics.assign(stale=False), ["ticker", "model", "horizon"], cells)
+    if cells:
+        forecasts = _merge(_read_parquet(FORECASTS_FILE), pd.concat(forecast_frames, ignore_index=True),
+                           ["ticker", "model", "horizon"], cells)
+        history = pd.concat([df.assign(ticker=t) for t, df in histories.items() if (t,) in refit_tickers],
+                            ignore_index=True)
+        history = _merge(_read_parquet(HISTORY_FILE), history, ["ticker"], refit_tickers)
+        _write_parquet(forecasts, FORECASTS_FILE)
+        _write_parquet(history, HISTORY_FILE)
+    if not metrics.empty:
+        # Written last: readers reload all three files when the metrics file changes
+        _write_parquet(metrics, METRICS_FILE)
+    stale = int(metrics["stale"].sum()) if "stale" in metrics.columns else 0
+    print(f"✅ Batch forecast: {len(metric_rows)} forecasts for {len(histories)} tickers "
+          f"in {time.perf_counter() - start:.1f}s -> {BATCH_DIR}"
+          + (f" ({stale} stale from earlier runs)" if stale else ""))
+    return metrics
+
+
+def _load():
+    path = os.path.join(BATCH_DIR, METRICS_FILE)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _loaded_lock:
+        if _loaded["mtime"] != mtime:
+            _loaded["metrics"] = pd.read_parquet(path)
+            _loaded["forecasts"] = pd.read_parquet(os.path.join(BATCH_DIR, FORECASTS_FILE))
+            _loaded["history"] = pd.read_parquet(os.path.join(BATCH_DIR, HISTORY_FILE))
+            _loaded["mtime"] = mtime
+        return dict(_loaded)
+
+
+def get_precomputed(ticker, model_type, horizon):
+    """
+    Precomputed forecast from the last batch run.
+
+    A batch horizon at least as long as `horizon` is used (its first `horizon` days).
+
+    Returns:
+        tuple | None: (history DataFrame, forecast DataFrame, metrics dict) or None when
+        there is no fresh batch result.
+    """
+    try:
+        data = _load()
+    except Exception as e:
+        print(f"⚠️ Could not read batch forecasts: {e}")
+        return None
+    if data is None:
+        return None
+    metrics = data["metrics"]
+    rows = metrics[(metrics["ticker"] == ticker) & (metrics["model"] == model_type) & (metrics["horizon"] >= horizon)]
+    if rows.empty:
+        return None
+    row = rows.sort_values("horizon").iloc[0]
+    if (pd.Timestamp.now(tz="UTC").tz_localize(None) - row["run_at"]).total_seconds() > MAX_AGE:
+        return None
+
+    forecasts = data["forecasts"]
+    forecast = forecasts[(forecasts["ticker"] == ticker) & (forecasts["model"] == model_type)
+                         & (forecasts["horizon"] == row["horizon"])].iloc[:horizon]
+    history = data["history"]
+    history = history[history["ticker"] == ticker][["ds", "y"]].reset_index(drop=True)
+    columns = [c for c in ("ds", "yhat", "yhat_lower", "yhat_upper") if c in forecast.columns]
+    return history, forecast[columns].reset_index(drop=True), row.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch forecasts for every ticker x model x horizon")
+    parser.add_argument("--tickers", nargs="*", help="Default: all tickers in web_agent.COMPANIES")
+    parser.add_argument("--models", nargs="*", default=list(MODEL_TYPES), choices=MODEL_TYPES)
+    parser.add_argument("--horizons", nargs="*", type=int, default=DEFAULT_HORIZONS)
+    parser.add_argument("--workers", type=int, default=FORECAST_WORKERS)
+    args = parser.parse_args()
+    metrics = run_batch(args.tickers, args.models, args.horizons, args.workers)
+    if not metrics.empty:
+        print(metrics[["ticker", "model", "horizon", "mape", "fit_seconds", "stale"]].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# batch_writer.py
+#
+# Collects chunks across files and writes them to Chroma in bulk: one
+# SentenceTransformer.encode call per batch and one add/upsert per batch,
+# instead of one embedding + one write per chunk.
+
+import os
+import time
+
+from instrumentation import observe
+
+DEFAULT_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "512"))
+DEFAULT_ENCODE_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+
+class BatchWriter:
+    def __init__(self, collection, model, batch_size=DEFAULT_BATCH_SIZE,
+                 encode_batch_size=DEFAULT_ENCODE_BATCH_SIZE, flush_on_file_end=False, upsert=False,
+                 listeners=()):
+        """
+        Args:
+            collection: Chroma collection to write to.
+            model: EmbeddingService (or SentenceTransformer) used to embed the chunks.
+            batch_size (int): Number of buffered chunks that triggers a flush.
+            encode_batch_size (int): Batch size passed to `model.encode`.
+            flush_on_file_end (bool): Also flush at every end_file() call.
+            upsert (bool): Use collection.upsert instead of collection.add.
+            listeners: Objects with an add(ids, documents, metadatas) method, called after
+                every successful write (e.g. the BM25 index), and optionally a
+                discard(ids) method, called when a batch could not be written.
+        """
+        self.collection = collection
+        self.model = model
+        self.batch_size = batch_size
+        self.encode_batch_size = encode_batch_size
+        self.flush_on_file_end = flush_on_file_end
+        self.upsert = upsert
+        self.listeners = list(listeners)
+
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._seen = set()
+        self._sources = set()
+
+        self.chunks_written = 0
+        self.batches_written = 0
+        self.embed_seconds = 0.0
+        self.write_seconds = 0.0
+        self.failed_sources = []
+        self.failed_ids = set()
+
+    def add(self, ids, documents, metadatas, source=None):
+        """Buffer chunks; flushes automatically once batch_size chunks are pending."""
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            # Duplicate ids inside one bulk call are rejected by Chroma, keep the first one
+            if chunk_id in self._seen:
+                continue
+            self._seen.add(chunk_id)
+            self._ids.append(chunk_id)
+            self._documents.append(document)
+            self._metadatas.append(metadata)
+            if source is not None:
+                self._sources.add(source)
+            if len(self._ids) >= self.batch_size:
+                self.flush()
+
+    def end_file(self):
+        if self.flush_on_file_end:
+            self.flush()
+
+    def flush(self):
+        """Embed and write everything buffered. Returns the number of chunks written."""
+        if not self._ids:
+            self._sources.clear()
+            return 0
+
+        ids, documents, metadatas = self._ids, self._documents, self._metadatas
+        sources = self._sources
+        self._ids, self._documents, self._metadatas = [], [], []
+        self._seen = set()
+        self._sources = set()
+
+        try:
+            start = time.perf_counter()
+            embeddings = self.model.encode(documents, batch_size=self.encode_batch_size)
+            if hasattr(embeddings, "tolist"):
+                embeddings = embeddings.tolist()
+            seconds = time.perf_counter() - start
+            self.embed_seconds += seconds
+            observe("ingest.stage", seconds, stage="embed")
+
+            start = time.perf_counter()
+            write = self.collection.upsert if self.upsert else self.collection.add
+            write(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+            for listener in self.listeners:
+                listener.add(ids, documents, metadatas)
+            seconds = time.perf_counter() - start
+            self.write_seconds += seconds
+            observe("ingest.stage", seconds, stage="write")
+        except Exception as e:
+            print(f"❌ Batch write of {len(ids)} chunks failed: {e}")
+            self.failed_sources.extend(sorted(sources))
+            self.failed_ids.update(ids)
+            for listener in self.listeners:
+                if hasattr(listener, "discard"):
+                    listener.discard(ids)
+            return 0
+
+        self.chunks_written += len(ids)
+        self.batches_written += 1
+        return len(ids)
+
+    def close(self):
+        return self.flush()
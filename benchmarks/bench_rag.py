@@ -0,0 +1,305 @@
+# benchmarks/bench_rag.py
+#
+# Offline performance and retrieval-quality benchmark for RAGAgent and coordinator_handle.
+# Replaces test_rag.py (re-index Dataset/ and ask Gemini one question).
+#
+# The fixture corpus (fixtures/rag/corpus.json) is written as placeholder PDFs plus
+# pre-parsed elements in the element cache of a temporary workspace, so indexPDF runs its
+# real chunk / metrics / embed / write stages without partition_pdf. Gemini, the ReAct
+# agents and the news / quote providers are replaced by the stubs in stubs.py; nothing
+# touches the network.
+#
+# Measures:
+#   ingestion   files/min, chunks/s and stage times of indexPDF
+#   embedding   texts/s of EmbeddingService.encode per batch size
+#   retrieval   latency p50/p95/p99 and recall@k / MRR on fixtures/rag/gold.json, per mode
+#   answer      generate_answer latency with the stub LLM (retrieval + context + prompt)
+#   coordinator coordinator_handle latency per route, router stats
+#   spans       instrumentation histograms (embedding, Chroma / BM25 search, LLM, providers, ...)
+#
+#   python benchmarks/bench_rag.py --json rag-bench.json
+#   python benchmarks/bench_rag.py --embedder hash      # no embedding model needed
+#   VECTOR_STORE=faiss python benchmarks/bench_rag.py   # same run against the FAISS store
+#
+# --embedder model uses the locally cached EMBEDDING_MODEL (HF_HUB_OFFLINE is set, so a
+# missing model fails instead of downloading).
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+FIXTURE_DIR = os.path.join(BENCH_DIR, "fixtures", "rag")
+K_VALUES = (1, 3, 5)
+MODES = ("vector", "bm25", "hybrid")
+EMBED_BATCH_SIZES = (8, 32, 64, 128)
+COORDINATOR_MESSAGES = {
+    "web_direct": "Gibt es aktuelle Nachrichten zu Apple?",
+    "rag_direct": "What was Microsoft's revenue in the 2022 10-K?",
+    "ambiguous": "Wie hat sich der Umsatz von Nvidia heute entwickelt?",
+    "no_signal": "Tell me about Meta's Reality Labs.",
+}
+
+
+def latency_summary(seconds):
+    from request_scheduler import percentile
+    ms = [s * 1000 for s in seconds]
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.mean(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+    }
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_workspace(corpus, workspace):
+    """Placeholder PDFs under <workspace>/Dataset plus their elements in the element cache."""
+    from unstructured.staging.base import elements_from_dicts
+    from element_cache import cache_key, store_elements
+    from ingest_manifest import file_sha256
+    from ingest_pipeline import PARTITION_PARAMS
+
+    data_dir = os.path.join(workspace, "Dataset")
+    store_dir = os.path.join(workspace, "persist_store")
+    cache_dir = os.path.join(store_dir, "element_cache")
+    for filing in corpus["filings"]:
+        folder = os.path.join(data_dir, filing["company"], filing["year"])
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, filing["file"])
+        with open(path, "wb") as f:
+            f.write(f"%PDF-1.4\n% benchmark fixture {filing['company']}/{filing['year']}/{filing['file']}\n".encode())
+        elements = elements_from_dicts([
+            {"type": element["type"], "text": element["text"],
+             "metadata": dict({"page_number": element["page"], "filename": filing["file"]},
+                              **({"text_as_html": element["html"]} if "html" in element else {}))}
+            for element in filing["elements"]
+        ])
+        store_elements(cache_dir, cache_key(file_sha256(path), PARTITION_PARAMS), elements)
+    return data_dir, store_dir, cache_dir
+
+
+def bench_ingestion(agent, workers):
+    stats = agent.indexPDF(workers=workers)
+    elapsed = stats.elapsed or 1e-9
+    return {
+        "files": stats.files_indexed,
+        "failed": len(stats.files_failed),
+        "chunks": stats.chunks,
+        "duplicates": stats.duplicates,
+        "metric_rows": stats.metrics,
+        "element_cache_hits": stats.cache_hits,
+        "seconds": round(stats.elapsed, 3),
+        "files_per_min": round(stats.files_indexed / elapsed * 60, 2),
+        "chunks_per_s": round(stats.chunks / elapsed, 2),
+        "stage_seconds": {stage: round(seconds, 3) for stage, seconds in stats.stage_seconds.items()},
+    }
+
+
+def bench_embedding(service, texts, min_texts=256):
+    texts = (texts * (min_texts // max(len(texts), 1) + 1))[:max(min_texts, len(texts))]
+    service.encode(texts[:8])   # warm-up (model load, first-call overhead)
+    results = {}
+    for batch_size in EMBED_BATCH_SIZES:
+        start = time.perf_counter()
+        service.encode(texts, batch_size=batch_size)
+        seconds = time.perf_counter() - start
+        results[str(batch_size)] = {"texts": len(texts), "seconds": round(seconds, 4),
+                                    "texts_per_s": round(len(texts) / seconds, 1) if seconds else None}
+    return results
+
+
+def _is_relevant(document, metadata, target):
+    return metadata.get("source") == target["source"] and target["contains"] in document
+
+
+def score_ranking(documents, metadatas, relevant):
+    """recall@k for K_VALUES and the reciprocal rank of the first relevant chunk."""
+    found_at = {}
+    first = None
+    for rank, (document, metadata) in enumerate(zip(documents, metadatas), start=1):
+        hits = [i for i, target in enumerate(relevant) if _is_relevant(document, metadata, target)]
+        if hits and first is None:
+            first = rank
+        for i in hits:
+            found_at.setdefault(i, rank)
+    scores = {f"recall@{k}": sum(1 for rank in found_at.values() if rank <= k) / len(relevant) for k in K_VALUES}
+    scores["rr"] = 1.0 / first if first else 0.0
+    return scores
+
+
+def bench_retrieval(agent, gold, repeats):
+    top_k = max(K_VALUES)
+    results = {}
+    for mode in MODES:
+        latencies, per_question = [], []
+        for item in gold["questions"]:
+            ranking = agent.query(item["question"], top_k=top_k, mode=mode)
+            for _ in range(repeats):
+                start = time.perf_counter()
+                agent.query(item["question"], top_k=top_k, mode=mode)
+                latencies.append(time.perf_counter() - start)
+            scores = score_ranking(ranking["documents"][0], ranking["metadatas"][0], item["relevant"])
+            per_question.append(dict(scores, question=item["question"]))
+        summary = {f"recall@{k}": round(statistics.mean(q[f"recall@{k}"] for q in per_question), 4) for k in K_VALUES}
+        summary["mrr"] = round(statistics.mean(q["rr"] for q in per_question), 4)
+        summary["latency"] = latency_summary(latencies)
+        summary["misses"] = [q["question"] for q in per_question if q["rr"] == 0.0]
+        results[mode] = summary
+    return results
+
+
+def bench_answers(agent, gold, repeats):
+    latencies, from_metrics = [], 0
+    for item in gold["questions"]:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            answer = agent.generate_answer(item["question"], use_cache=False)
+            latencies.append(time.perf_counter() - start)
+        from_metrics += "metric" in answer
+    return {"latency": latency_summary(latencies), "metric_store_answers": from_metrics,
+            "questions": len(gold["questions"])}
+
+
+def bench_coordinator(agent, repeats, provider_latency):
+    try:
+        import coordinator_agent
+        import rag_no_img
+        import web_agent
+    except ImportError as e:
+        return {"skipped": f"import failed: {e}"}
+    from stubs import install_web_stubs
+
+    # coordinator_handle reaches the RAG agent through the process-wide registry
+    rag_no_img._agent = agent
+    rag_no_img._last_change_check = time.monotonic()
+    install_web_stubs(web_agent, rag_no_img.generateAnswerTool, latency=provider_latency)
+
+    results = {}
+    for name, message in COORDINATOR_MESSAGES.items():
+        route = coordinator_agent.route_message(message)
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            coordinator_agent.coordinator_handle(message)
+            latencies.append(time.perf_counter() - start)
+        results[name] = {"agent": route["agent"], "direct": route["direct"], "latency": latency_summary(latencies)}
+    results["router_stats"] = coordinator_agent.get_router_stats()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline RAG benchmark")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="Locally cached EMBEDDING_MODEL or the deterministic HashEncoder")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions per question")
+    parser.add_argument("--workers", type=int, default=2, help="Parser processes for indexPDF")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated stub LLM latency (s)")
+    parser.add_argument("--provider-latency", type=float, default=0.0, help="Simulated web provider latency (s)")
+    parser.add_argument("--workspace", help="New directory to keep the index in (default: temporary)")
+    parser.add_argument("--skip-coordinator", action="store_true")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    corpus, gold = load_fixture("corpus.json"), load_fixture("gold.json")
+    if args.workspace and os.path.exists(args.workspace):
+        parser.error(f"--workspace {args.workspace} already exists")
+    workspace = args.workspace or tempfile.mkdtemp(prefix="rag-bench-")
+
+    try:
+        data_dir, store_dir, cache_dir = build_workspace(corpus, workspace)
+
+        from embedding_service import get_embedding_service
+        from stubs import StubLLM, install_hash_encoder
+        service = get_embedding_service()
+        if args.embedder == "hash":
+            install_hash_encoder(service)
+
+        from rag_no_img import RAGAgent
+        from vector_store import VECTOR_STORE
+        start = time.perf_counter()
+        agent = RAGAgent(data_dir=data_dir, chroma_dir=store_dir, element_cache_dir=cache_dir)
+        init_seconds = time.perf_counter() - start
+        agent.gemini_model = StubLLM(latency=args.llm_latency)
+
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "git_commit": git_commit(),
+                "python": platform.python_version(),
+                "embedder": args.embedder,
+                "vector_store": VECTOR_STORE,
+                "embedding_model": service.model_name if args.embedder == "model" else "HashEncoder",
+                "repeat": args.repeat,
+                "corpus_filings": len(corpus["filings"]),
+                "gold_questions": len(gold["questions"]),
+                "agent_init_seconds": round(init_seconds, 3),
+            },
+        }
+        report["ingestion"] = bench_ingestion(agent, args.workers)
+        texts = agent.collection.get(include=["documents"])["documents"]
+        report["embedding"] = bench_embedding(service, texts)
+        report["retrieval"] = bench_retrieval(agent, gold, args.repeat)
+        report["answer"] = bench_answers(agent, gold, args.repeat)
+        if not args.skip_coordinator:
+            report["coordinator"] = bench_coordinator(agent, args.repeat, args.provider_latency)
+        # Per-stage breakdown of everything above (instrumentation spans)
+        from instrumentation import snapshot
+        report["spans"] = snapshot()
+    finally:
+        if not args.workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    ingestion = report["ingestion"]
+    print("\n📊 RAG benchmark")
+    print(f"  ingestion: {ingestion['files']} files, {ingestion['chunks']} chunks in {ingestion['seconds']}s "
+          f"({ingestion['files_per_min']} files/min, {ingestion['chunks_per_s']} chunks/s)")
+    print("  embedding: " + ", ".join(f"batch {bs}: {r['texts_per_s']} texts/s" for bs, r in report["embedding"].items()))
+    for mode, r in report["retrieval"].items():
+        print(f"  {mode:>7}: recall@1 {r['recall@1']:.3f}  recall@3 {r['recall@3']:.3f}  recall@5 {r['recall@5']:.3f}  "
+              f"MRR {r['mrr']:.3f}  p50 {r['latency']['p50_ms']:.1f} ms  p95 {r['latency']['p95_ms']:.1f} ms  "
+              f"p99 {r['latency']['p99_ms']:.1f} ms")
+    answer = report["answer"]["latency"]
+    print(f"   answer: p50 {answer['p50_ms']:.1f} ms  p95 {answer['p95_ms']:.1f} ms  p99 {answer['p99_ms']:.1f} ms")
+    for name, r in report.get("coordinator", {}).items():
+        if name in COORDINATOR_MESSAGES:
+            print(f"  coordinator {name:<10} → {r['agent']}{' (direct)' if r['direct'] else ''}: "
+                  f"p50 {r['latency']['p50_ms']:.1f} ms  p95 {r['latency']['p95_ms']:.1f} ms")
+        elif name == "skipped":
+            print(f"  coordinator skipped ({r})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/bench_scrape_parse.py
+#
+# Headline extraction time per HTML backend over the saved pages in fixtures/scrape/.
+# Runs offline:  python benchmarks/bench_scrape_parse.py [--repeat 20] [--json out.json]
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scraper import SCRAPING_SOURCES, available_backends, extract_headlines  # noqa: E402
+
+FIXTURES = {
+    "CNBC": "cnbc.html",
+    "Yahoo": "yahoo.html",
+    "MarketWatch": "marketwatch.html",
+}
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "scrape")
+
+
+def bench_backend(backend, pages, repeat, max_articles):
+    timings = []
+    found = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for name, html in pages.items():
+            found[name] = len(extract_headlines(html, SCRAPING_SOURCES[name], max_articles, backend=backend))
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "headlines": found,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-articles", type=int, default=3)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    pages = {}
+    for name, file in FIXTURES.items():
+        with open(os.path.join(FIXTURE_DIR, file), encoding="utf-8") as f:
+            pages[name] = f.read()
+
+    results = {backend: bench_backend(backend, pages, args.repeat, args.max_articles)
+               for backend in available_backends()}
+    baseline = results["bs4-html.parser"]["median_ms"]
+    for backend, result in results.items():
+        result["speedup_vs_html_parser"] = round(baseline / result["median_ms"], 2) if result["median_ms"] else None
+        print(f"{backend:>16}: {result['median_ms']:8.2f} ms / {len(pages)} pages "
+              f"(x{result['speedup_vs_html_parser']}) {result['headlines']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "scrape_parse", "pages": len(pages), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
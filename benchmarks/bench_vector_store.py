@@ -0,0 +1,346 @@
+# benchmarks/bench_vector_store.py
+#
+# Memory footprint, build time and query latency of the vector store backends in
+# vector_store.py, at 1x, 10x and 100x the corpus size.
+#
+# The 1x corpus is the existing `sec_filings` collection (--chroma-dir, default
+# persist_store): its embeddings, documents and metadata. Without one, --synthetic N
+# clustered unit vectors with company / year metadata stand in. Larger scales add chunks
+# interpolated between random pairs of chunks of the same company (re-normalized), so they
+# keep the corpus's topic structure and company / year mix without piling up near-identical
+# copies whose order would be noise.
+#
+# Every backend and scale runs in fresh subprocesses (one to build, one to open + query),
+# so memory numbers are not polluted by the other stores:
+#   build    seconds to add all chunks in INGEST_BATCH_SIZE batches and persist; size on disk
+#   open     seconds to open the persisted store
+#   memory   RSS growth from opening the store to the end of the queries, and its anonymous
+#            part (memory-mapped index pages are page cache, shared and evictable)
+#   query    top-k latency p50/p95/p99, unfiltered and with a company filter, and recall@k
+#            against exact float32 search
+#
+#   python benchmarks/bench_vector_store.py --json vector-store-bench.json
+#   python benchmarks/bench_vector_store.py --synthetic 5000 --scales 1,10 --backends chroma,faiss-hnsw-int8
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+# Backend name -> environment of the worker process (vector_store reads its config at import)
+BACKENDS = {
+    "chroma": {"VECTOR_STORE": "chroma"},
+    "faiss-hnsw-int8": {"VECTOR_STORE": "faiss", "FAISS_INDEX": "hnsw", "FAISS_STORAGE": "int8"},
+    "faiss-hnsw-float16": {"VECTOR_STORE": "faiss", "FAISS_INDEX": "hnsw", "FAISS_STORAGE": "float16"},
+    "faiss-ivfpq-int8": {"VECTOR_STORE": "faiss", "FAISS_INDEX": "ivfpq", "FAISS_STORAGE": "int8"},
+}
+COMPANIES = ("Apple", "Google", "Meta", "Microsoft", "Nvidia")
+QUERY_NOISE = 0.01
+
+
+# -- corpus ---------------------------------------------------------------------------
+
+def load_collection(chroma_dir, page_size=5000):
+    """(ids, embeddings, documents, metadatas) of the `sec_filings` collection, or None if empty."""
+    if not os.path.exists(os.path.join(chroma_dir, "chroma.sqlite3")):
+        return None
+    import chromadb
+    from vector_store import COLLECTION_NAME
+    client = chromadb.PersistentClient(path=chroma_dir)
+    try:
+        collection = client.get_collection(COLLECTION_NAME)
+    except Exception:
+        return None
+    ids, embeddings, documents, metadatas = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        embeddings.extend(page["embeddings"])
+        documents.extend(page["documents"])
+        metadatas.extend(m or {} for m in page["metadatas"])
+        offset += len(page["ids"])
+    if not ids:
+        return None
+    return ids, np.asarray(embeddings, dtype=np.float32), documents, metadatas
+
+
+def synthetic_corpus(n, dim=384, seed=0):
+    """n unit vectors around per-filing centers, with filing metadata and ~1 KB of text each."""
+    rng = np.random.default_rng(seed)
+    filings = [(company, str(year)) for company in COMPANIES for year in range(2020, 2025)]
+    centers = rng.standard_normal((len(filings) * 8, dim)).astype(np.float32)
+    topic = rng.integers(0, len(centers), n)
+    vectors = centers[topic] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    metadatas = []
+    for i in range(n):
+        company, year = filings[topic[i] // 8]
+        metadatas.append({"company": company, "year": year, "source": f"10-K-{year}-{company.lower()}.pdf",
+                          "page_number": int(i % 120) + 1, "type": "NarrativeText"})
+    documents = [f"Synthetic chunk {i} of {m['source']}. " + "lorem ipsum dolor sit amet " * 36
+                 for i, m in enumerate(metadatas)]
+    return [f"syn-{i}" for i in range(n)], vectors, documents, metadatas
+
+
+def scale_corpus(corpus, factor, seed=1):
+    """
+    The corpus plus factor - 1 generated copies: every chunk moved 10-50% of the way towards
+    a random chunk of the same company (ids suffixed with the copy number, metadata kept).
+    """
+    ids, vectors, documents, metadatas = corpus
+    if factor == 1:
+        return corpus
+    rng = np.random.default_rng(seed)
+    company = np.asarray([m.get("company", "") for m in metadatas])
+    groups = {name: np.flatnonzero(company == name) for name in set(company)}
+    all_ids, all_vectors = list(ids), [vectors]
+    for copy in range(1, factor):
+        partner = np.empty(len(ids), dtype=np.int64)
+        for members in groups.values():
+            partner[members] = rng.choice(members, size=len(members))
+        step = rng.uniform(0.1, 0.5, size=(len(ids), 1)).astype(np.float32)
+        moved = vectors + step * (vectors[partner] - vectors)
+        all_vectors.append(moved / np.linalg.norm(moved, axis=1, keepdims=True))
+        all_ids.extend(f"{chunk_id}#{copy}" for chunk_id in ids)
+    return all_ids, np.concatenate(all_vectors), documents * factor, metadatas * factor
+
+
+def exact_neighbours(vectors, queries, k, allowed=None, block=16384):
+    """Ids (row numbers) of the k nearest vectors per query by squared L2, optionally per-query masks."""
+    best = np.empty((len(queries), k), dtype=np.int64)
+    norms = (vectors ** 2).sum(axis=1)
+    for qi, query in enumerate(queries):
+        distances = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), block):
+            part = vectors[start:start + block]
+            distances[start:start + block] = norms[start:start + block] - 2 * part @ query
+        if allowed is not None:
+            distances[~allowed[qi]] = np.inf
+        top = np.argpartition(distances, k)[:k]
+        best[qi] = top[np.argsort(distances[top])]
+    return best
+
+
+def write_scale(corpus, factor, n_queries, k, directory):
+    """Scaled corpus, queries and exact neighbours as files for the worker processes."""
+    ids, vectors, documents, metadatas = scale_corpus(corpus, factor)
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "vectors.npy"), vectors)
+    with open(os.path.join(directory, "chunks.jsonl"), "w", encoding="utf-8") as f:
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            f.write(json.dumps({"id": chunk_id, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n")
+
+    # Queries: perturbed copies of random base chunks, filtered to the chunk's company
+    rng = np.random.default_rng(2)
+    base = rng.choice(len(corpus[0]), size=min(n_queries, len(corpus[0])), replace=False)
+    queries = corpus[1][base] + QUERY_NOISE * rng.standard_normal((len(base), vectors.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    companies = [corpus[3][i].get("company", "") for i in base]
+    company_of = np.asarray([m.get("company", "") for m in metadatas])
+    allowed = np.stack([company_of == company for company in companies])
+
+    truth = {
+        "unfiltered": [[ids[i] for i in row] for row in exact_neighbours(vectors, queries, k)],
+        "filtered": [[ids[i] for i in row] for row in exact_neighbours(vectors, queries, k, allowed)],
+    }
+    np.save(os.path.join(directory, "queries.npy"), queries)
+    with open(os.path.join(directory, "truth.json"), "w", encoding="utf-8") as f:
+        json.dump({"companies": companies, "truth": truth, "chunks": len(ids)}, f)
+    return len(ids)
+
+
+# -- worker (runs in a subprocess per backend and scale) --------------------------------
+
+def _memory():
+    """(rss, anonymous rss) in bytes from /proc; elsewhere psutil's rss and None."""
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "RssAnon:")):
+                    values[line.split(":")[0]] = int(line.split()[1]) * 1024
+    except OSError:
+        import psutil
+        return psutil.Process().memory_info().rss, None
+    return values["VmRSS"], values.get("RssAnon")
+
+
+def _open_store(backend, store_dir):
+    from vector_store import FaissStore, open_vector_store
+    if BACKENDS[backend]["VECTOR_STORE"] == "chroma":
+        return open_vector_store(store_dir, "chroma")
+    return FaissStore(os.path.join(store_dir, "faiss"))
+
+
+def _dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def worker_build(backend, data_dir, store_dir, batch_size):
+    vectors = np.load(os.path.join(data_dir, "vectors.npy"))
+    with open(os.path.join(data_dir, "chunks.jsonl"), encoding="utf-8") as f:
+        chunks = [json.loads(line) for line in f]
+
+    start = time.perf_counter()
+    store = _open_store(backend, store_dir)
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i:i + batch_size]
+        store.add(ids=[c["id"] for c in batch], embeddings=vectors[i:i + batch_size].tolist(),
+                  documents=[c["document"] for c in batch], metadatas=[c["metadata"] for c in batch])
+    if hasattr(store, "save"):
+        store.save()
+    seconds = time.perf_counter() - start
+    return {"build_s": round(seconds, 3), "chunks_per_s": round(len(chunks) / seconds, 1),
+            "count": store.count(), "disk_bytes": _dir_bytes(store_dir)}
+
+
+def worker_query(backend, data_dir, store_dir, k):
+    from bench_rag import latency_summary
+    import vector_store  # noqa: F401  (imports outside the measured window)
+    if BACKENDS[backend]["VECTOR_STORE"] == "chroma":
+        import chromadb  # noqa: F401
+    else:
+        import faiss  # noqa: F401
+
+    queries = np.load(os.path.join(data_dir, "queries.npy"))
+    with open(os.path.join(data_dir, "truth.json"), encoding="utf-8") as f:
+        truth = json.load(f)
+
+    rss_before, anon_before = _memory()
+    start = time.perf_counter()
+    store = _open_store(backend, store_dir)
+    open_seconds = time.perf_counter() - start
+
+    result = {"open_s": round(open_seconds, 3)}
+    for name in ("unfiltered", "filtered"):
+        latencies, hits = [], 0
+        for qi, query in enumerate(queries):
+            where = {"company": truth["companies"][qi]} if name == "filtered" else None
+            start = time.perf_counter()
+            found = store.query(query_embeddings=[query.tolist()], n_results=k, where=where,
+                                include=["metadatas", "distances"])
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(found["ids"][0]) & set(truth["truth"][name][qi]))
+        result[name] = {"latency": latency_summary(latencies[min(5, len(latencies) // 10):]),   # minus warm-up
+                        f"recall@{k}": round(hits / (k * len(queries)), 4)}
+
+    rss_after, anon_after = _memory()
+    result["rss_delta_bytes"] = rss_after - rss_before
+    result["anon_delta_bytes"] = anon_after - anon_before if anon_before is not None else None
+    return result
+
+
+def run_worker(backend, phase, data_dir, store_dir, args):
+    env = dict(os.environ, **BACKENDS[backend])
+    command = [sys.executable, os.path.abspath(__file__), "--worker", phase, "--backend", backend,
+               "--data-dir", data_dir, "--store-dir", store_dir,
+               "--batch-size", str(args.batch_size), "--top-k", str(args.top_k)]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{backend} {phase} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+# -- main -------------------------------------------------------------------------------
+
+def main():
+    from batch_writer import DEFAULT_BATCH_SIZE
+    parser = argparse.ArgumentParser(description="Vector store backend benchmark")
+    parser.add_argument("--chroma-dir", default=os.path.join(ROOT, "persist_store"),
+                        help="persist_store with the sec_filings collection used as the 1x corpus")
+    parser.add_argument("--synthetic", type=int, default=2000,
+                        help="Synthetic 1x corpus size if the collection is missing or empty")
+    parser.add_argument("--scales", default="1,10,100", help="Comma-separated corpus multipliers")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help=f"Comma-separated, of {', '.join(BACKENDS)}")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per add() call")
+    parser.add_argument("--workspace", help="New directory to keep the stores in (default: temporary)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--worker", choices=["build", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--store-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker == "build":
+        print(json.dumps(worker_build(args.backend, args.data_dir, args.store_dir, args.batch_size)))
+        return
+    if args.worker == "query":
+        print(json.dumps(worker_query(args.backend, args.data_dir, args.store_dir, args.top_k)))
+        return
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = [b for b in backends if b not in BACKENDS]
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(unknown)}")
+    scales = [int(s) for s in args.scales.split(",")]
+    if args.workspace and os.path.exists(args.workspace):
+        parser.error(f"--workspace {args.workspace} already exists")
+    workspace = args.workspace or tempfile.mkdtemp(prefix="vector-store-bench-")
+
+    corpus = load_collection(args.chroma_dir)
+    source = f"collection in {args.chroma_dir}"
+    if corpus is None:
+        corpus = synthetic_corpus(args.synthetic)
+        source = f"synthetic ({args.synthetic} chunks)"
+    print(f"📦 1x corpus: {len(corpus[0])} chunks, {corpus[1].shape[1]} dims, {source}")
+
+    from bench_rag import git_commit
+    report = {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "git_commit": git_commit(),
+                       "corpus": source, "base_chunks": len(corpus[0]), "dim": int(corpus[1].shape[1]),
+                       "queries": args.queries, "top_k": args.top_k, "batch_size": args.batch_size},
+              "results": {}}
+    try:
+        for factor in scales:
+            data_dir = os.path.join(workspace, f"data-{factor}x")
+            chunks = write_scale(corpus, factor, args.queries, args.top_k, data_dir)
+            print(f"\n📐 {factor}x: {chunks} chunks")
+            for backend in backends:
+                store_dir = os.path.join(workspace, f"{backend}-{factor}x")
+                try:
+                    result = run_worker(backend, "build", data_dir, store_dir, args)
+                    result.update(run_worker(backend, "query", data_dir, store_dir, args))
+                except RuntimeError as e:
+                    print(f"❌ {e}")
+                    result = {"error": str(e)[-500:]}
+                report["results"].setdefault(f"{factor}x", {})[backend] = result
+                if "error" not in result:
+                    anon = result["anon_delta_bytes"]
+                    print(f"  {backend:<19} build {result['build_s']:>8.2f}s  disk {result['disk_bytes'] / 2**20:>8.1f} MiB  "
+                          f"RSS +{result['rss_delta_bytes'] / 2**20:>7.1f} MiB"
+                          f"{f' (anon +{anon / 2**20:.1f})' if anon is not None else ''}  "
+                          f"p50 {result['unfiltered']['latency']['p50_ms']:>6.2f} ms  "
+                          f"p95 {result['unfiltered']['latency']['p95_ms']:>6.2f} ms  "
+                          f"filtered p50 {result['filtered']['latency']['p50_ms']:>6.2f} ms  "
+                          f"recall@{args.top_k} {result['unfiltered'][f'recall@{args.top_k}']:.3f} / "
+                          f"{result['filtered'][f'recall@{args.top_k}']:.3f}")
+                if not args.workspace:
+                    shutil.rmtree(store_dir, ignore_errors=True)   # the next scale is 10x larger
+    finally:
+        if not args.workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
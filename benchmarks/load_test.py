@@ -0,0 +1,133 @@
+# benchmarks/load_test.py
+#
+# Throughput and latency of the chat request path at N concurrent sessions. Each session
+# sends its questions one after another (like a user waiting for each answer) through the
+# same RequestScheduler lanes the Gradio app uses.
+#
+#   python benchmarks/load_test.py --sessions 1 4 16 --requests 5
+#   python benchmarks/load_test.py --simulate --sessions 16 64   # offline, sleeps instead of LLM calls
+#
+# --simulate replaces the coordinator with fixed per-lane latencies (--web-latency,
+# --rag-latency), which measures the scheduler itself: lane isolation, queueing and
+# backpressure, without API keys.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from request_scheduler import DeadlineExceeded, Overloaded, RequestScheduler, percentile  # noqa: E402
+
+MESSAGES = [
+    "Was ist der aktuelle Kurs von Apple?",
+    "Gibt es aktuelle Nachrichten zu Microsoft?",
+    "Wie entwickelt sich die Aktie von Nvidia?",
+    "What was Apple's total revenue in the 2023 10-K?",
+    "Summarize the risk factors in Meta's 2022 annual report.",
+    "How did Microsoft's operating income change between 2021 and 2022?",
+]
+
+
+def simulated_handlers(web_latency, rag_latency):
+    web_words = ("aktuell", "kurs", "aktie", "nachrichten")
+
+    def route(message):
+        return "web_agent" if any(word in message.lower() for word in web_words) else "analytics_agent"
+
+    def handle(message):
+        time.sleep(web_latency if route(message) == "web_agent" else rag_latency)
+        return "ok"
+
+    return route, handle
+
+
+def real_handlers():
+    from coordinator_agent import coordinator_handle, route_message
+    return (lambda message: route_message(message)["agent"]), coordinator_handle
+
+
+async def session(scheduler, route, handle, requests, results, rng):
+    for _ in range(requests):
+        message = rng.choice(MESSAGES)
+        lane = route(message)
+        start = time.perf_counter()
+        try:
+            await scheduler.run(lane, handle, message)
+            outcome = "ok"
+        except Overloaded:
+            outcome = "rejected"
+        except DeadlineExceeded:
+            outcome = "timeout"
+        except Exception:
+            outcome = "error"
+        results.append((lane, outcome, time.perf_counter() - start))
+
+
+def summarize(results, seconds):
+    def latency_stats(rows):
+        latencies = [latency for _, outcome, latency in rows if outcome == "ok"]
+        return {
+            "requests": len(rows),
+            "ok": len(latencies),
+            "rejected": sum(1 for _, outcome, _ in rows if outcome == "rejected"),
+            "timeouts": sum(1 for _, outcome, _ in rows if outcome == "timeout"),
+            "errors": sum(1 for _, outcome, _ in rows if outcome == "error"),
+            "p50_s": round(percentile(latencies, 50), 3),
+            "p95_s": round(percentile(latencies, 95), 3),
+            "p99_s": round(percentile(latencies, 99), 3),
+        }
+
+    summary = latency_stats(results)
+    summary["seconds"] = round(seconds, 3)
+    summary["throughput_rps"] = round(summary["ok"] / seconds, 2) if seconds else 0.0
+    summary["lanes"] = {lane: latency_stats([row for row in results if row[0] == lane])
+                        for lane in sorted({row[0] for row in results})}
+    return summary
+
+
+async def run_level(sessions, requests, route, handle, seed):
+    scheduler = RequestScheduler()
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(session(scheduler, route, handle, requests, results, random.Random(seed + i))
+                           for i in range(sessions)))
+    return summarize(results, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the chat request path")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=5, help="Questions per session")
+    parser.add_argument("--simulate", action="store_true", help="Sleep instead of calling the coordinator")
+    parser.add_argument("--web-latency", type=float, default=0.3)
+    parser.add_argument("--rag-latency", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    route, handle = simulated_handlers(args.web_latency, args.rag_latency) if args.simulate else real_handlers()
+    report = {}
+    for sessions in args.sessions:
+        summary = asyncio.run(run_level(sessions, args.requests, route, handle, args.seed))
+        report[sessions] = summary
+        print(f"{sessions:>4} sessions: {summary['throughput_rps']:7.2f} req/s  "
+              f"p50 {summary['p50_s']:.3f}s  p95 {summary['p95_s']:.3f}s  p99 {summary['p99_s']:.3f}s  "
+              f"(ok {summary['ok']}, rejected {summary['rejected']}, timeouts {summary['timeouts']}, "
+              f"errors {summary['errors']})")
+        for lane, stats in summary["lanes"].items():
+            print(f"       {lane:<16} p50 {stats['p50_s']:.3f}s  p95 {stats['p95_s']:.3f}s  "
+                  f"p99 {stats['p99_s']:.3f}s  ok {stats['ok']}/{stats['requests']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"simulate": args.simulate, "requests_per_session": args.requests, "levels": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# benchmarks/stubs.py
+#
+# Offline stand-ins for everything the benchmarks would otherwise reach over the network:
+# Gemini (RAGAgent.gemini_model), the LangGraph ReAct agents, the news / quote providers
+# of web_agent and, optionally, the embedding model (HashEncoder). All of them are
+# deterministic, so two runs on the same tree produce the same retrieval results.
+
+import hashlib
+import re
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+EMBEDDING_DIM = 384   # same width as all-MiniLM-L6-v2
+
+
+class HashEncoder:
+    """
+    SentenceTransformer replacement: hashed bag of words + word bigrams, L2-normalised.
+
+    No model download and no torch; lexical overlap still yields similar vectors, so
+    retrieval quality stays meaningful enough to catch regressions.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = re.findall(r"\w+", text.lower())
+        for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=False,
+               show_progress_bar=False, **kwargs):
+        return np.stack([self._vector(text) for text in texts]) if texts else np.zeros((0, self.dim))
+
+    def parameters(self):
+        return iter(())
+
+
+def install_hash_encoder(service):
+    """Make an EmbeddingService use HashEncoder instead of loading its SentenceTransformer."""
+    service._model = HashEncoder()
+    service.load_seconds = 0.0
+    service.param_bytes = 0
+
+
+class StubLLM:
+    """google.generativeai.GenerativeModel stand-in for RAGAgent.gemini_model."""
+
+    def __init__(self, latency=0.0, tokens_per_second=200.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.calls = 0
+
+    def _answer(self, prompt):
+        # The first source header of the packed context keeps the answer tied to retrieval
+        sources = re.findall(r"^\s*\[1\] (.+)$", prompt, re.MULTILINE)
+        return f"Stub answer based on {sources[0] if sources else 'no context'}. "
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+        time.sleep(self.latency)
+        text = self._answer(prompt)
+        if not stream:
+            return SimpleNamespace(text=text)
+        return self._stream(text)
+
+    def _stream(self, text):
+        for word in text.split(" "):
+            if self.tokens_per_second:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield SimpleNamespace(text=word + " ")
+
+
+class StubReActAgent:
+    """
+    LangGraph ReAct agent stand-in: calls its tool once and restates the result, i.e. the
+    two model turns count_llm_calls expects from a real agent run.
+    """
+
+    def __init__(self, tool, latency=0.0):
+        self.tool = tool
+        self.latency = latency
+
+    def invoke(self, inputs):
+        question = inputs["messages"][-1]["content"]
+        time.sleep(self.latency)
+        result = self.tool(question)
+        text = result["answer"] if isinstance(result, dict) else str(result)
+        time.sleep(self.latency)
+        return {"messages": [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": ""},
+            {"role": "tool", "content": text},
+            {"role": "assistant", "content": text},
+        ]}
+
+    def stream(self, inputs, stream_mode="messages"):
+        text = self.invoke(inputs)["messages"][-1]["content"]
+        for piece in text.split(" "):
+            yield SimpleNamespace(content=piece + " ", id="stub-turn"), {"langgraph_node": "agent"}
+
+
+def stub_providers(latency=0.0):
+    """Replacements for web_agent's provider functions, keyed by attribute name."""
+
+    def get_latest_news(query, ticker, max_articles=5):
+        time.sleep(latency)
+        return [f"📰 {ticker}: stub headline {i + 1} about {query}" for i in range(max_articles)]
+
+    def tavily_search_with_date(query):
+        time.sleep(latency)
+        return f"🗓️ Stub Tavily result for {query}"
+
+    def get_stock_price_yahoo(ticker):
+        time.sleep(latency)
+        return f"💰 {ticker}: 100.00 USD (stub)"
+
+    def get_alpha_vantage_data(symbol):
+        time.sleep(latency)
+        return f"📈 {symbol}: open 99.00, close 100.00 (stub)"
+
+    def scrape_all_sources(query, max_articles=3, total_limit=None):
+        time.sleep(latency)
+        return [(None, f"[CNBC] Stub headline for {query} (https://example.com)")]
+
+    return {
+        "get_latest_news": get_latest_news,
+        "tavily_search_with_date": tavily_search_with_date,
+        "get_stock_price_yahoo": get_stock_price_yahoo,
+        "get_alpha_vantage_data": get_alpha_vantage_data,
+        "scrape_all_sources": scrape_all_sources,
+    }
+
+
+def install_web_stubs(web_agent_module, rag_tool, latency=0.0, agent_latency=0.0):
+    """
+    Replace web_agent's providers and both ReAct agents (web and RAG) with stubs.
+
+    Args:
+        web_agent_module: The imported web_agent module.
+        rag_tool (callable): What the stub RAG agent calls (e.g. rag_no_img.generateAnswerTool).
+    """
+    import coordinator_agent
+
+    for name, func in stub_providers(latency).items():
+        setattr(web_agent_module, name, func)
+    web = StubReActAgent(web_agent_module.handle_company_news, agent_latency)
+    rag = StubReActAgent(rag_tool, agent_latency)
+    for component, agent in ((web_agent_module.web_agent_component, web),
+                             (coordinator_agent.rag_agent_component, rag)):
+        component.reset()
+        component.factory = lambda agent=agent: agent
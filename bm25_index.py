@@ -0,0 +1,295 @@
+# bm25_index.py
+#
+# Compact in-process BM25 inverted index over the same chunk ids / texts that indexPDF
+# writes to the sec_filings collection. Financial questions lean on exact tokens
+# ("diluted EPS", segment names, dollar figures) that dense retrieval handles poorly,
+# so RAGAgent.query fuses BM25 and vector rankings with reciprocal rank fusion.
+#
+# Postings are array-backed (doc index + term frequency per term), document lengths and
+# metadata are flat arrays, and the whole index is pickled next to persist_store.
+
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+import heapq
+
+INDEX_FILE = "bm25_index.pkl"
+INDEX_VERSION = 1
+
+_TOKEN_RE = re.compile(r"\$?\d[\d,]*(?:\.\d+)?%?|[a-z][a-z0-9&'\-]*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "what which who how when where why did do does our we us you your".split()
+)
+_META_FIELDS = ("company", "year", "source")
+
+
+def tokenize(text):
+    """Lower-case word and number tokens; numbers lose '$' and thousands separators."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token[0] == "$" or token[0].isdigit():
+            token = token.lstrip("$").replace(",", "").rstrip(".")
+        else:
+            token = token.strip("-'")
+        if token and token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def matches_where(where, metadata):
+    """Evaluate the subset of Chroma's `where` syntax used by query_filters ($and, $in, equality)."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(c, metadata) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(c, metadata) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            if "$in" in condition and metadata.get(key) not in condition["$in"]:
+                return False
+            if "$eq" in condition and metadata.get(key) != condition["$eq"]:
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class BM25Index:
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.doc_ids = []                 # doc index -> chunk id
+        self.id_to_doc = {}               # chunk id -> doc index (live docs only)
+        self.doc_len = array("I")
+        self.alive = bytearray()
+        self.meta = {field: array("H") for field in _META_FIELDS}
+        self.meta_values = {field: [] for field in _META_FIELDS}   # interned strings
+        self._meta_lookup = {field: {} for field in _META_FIELDS}
+        self.vocab = {}                   # term -> term index
+        self.post_docs = []               # term index -> array("I") of doc indexes
+        self.post_tfs = []                # term index -> array("H") of term frequencies
+        self.total_len = 0
+        self.dead = 0
+        self.version = 0
+
+    def __len__(self):
+        return len(self.id_to_doc)
+
+    # -- building ---------------------------------------------------------------------
+
+    def _intern(self, field, value):
+        value = "" if value is None else str(value)
+        lookup = self._meta_lookup[field]
+        if value not in lookup:
+            lookup[value] = len(self.meta_values[field])
+            self.meta_values[field].append(value)
+        return lookup[value]
+
+    def add(self, ids, documents, metadatas=None):
+        """Index new chunks. Ids that are already indexed are ignored, like collection.add."""
+        metadatas = metadatas or [{}] * len(ids)
+        with self._lock:
+            for chunk_id, text, metadata in zip(ids, documents, metadatas):
+                if chunk_id in self.id_to_doc:
+                    continue
+                doc = len(self.doc_ids)
+                self.doc_ids.append(chunk_id)
+                self.id_to_doc[chunk_id] = doc
+                self.alive.append(1)
+                for field in _META_FIELDS:
+                    self.meta[field].append(self._intern(field, (metadata or {}).get(field)))
+
+                counts = {}
+                tokens = tokenize(text)
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                self.doc_len.append(len(tokens))
+                self.total_len += len(tokens)
+
+                for token, tf in counts.items():
+                    term = self.vocab.get(token)
+                    if term is None:
+                        term = self.vocab[token] = len(self.post_docs)
+                        self.post_docs.append(array("I"))
+                        self.post_tfs.append(array("H"))
+                    self.post_docs[term].append(doc)
+                    self.post_tfs[term].append(min(tf, 65535))
+            self.version += 1
+
+    def remove(self, ids):
+        """Tombstone chunks; postings are compacted once enough of the index is dead."""
+        with self._lock:
+            for chunk_id in ids:
+                doc = self.id_to_doc.pop(chunk_id, None)
+                if doc is None:
+                    continue
+                self.alive[doc] = 0
+                self.total_len -= self.doc_len[doc]
+                self.dead += 1
+            if self.dead and self.dead > 0.2 * len(self.doc_ids):
+                self.compact()
+            self.version += 1
+
+    def compact(self):
+        """Drop tombstoned documents and renumber the survivors."""
+        with self._lock:
+            remap = array("i", [-1]) * len(self.doc_ids)
+            doc_ids, doc_len, alive = [], array("I"), bytearray()
+            meta = {field: array("H") for field in _META_FIELDS}
+            for doc, chunk_id in enumerate(self.doc_ids):
+                if not self.alive[doc]:
+                    continue
+                remap[doc] = len(doc_ids)
+                doc_ids.append(chunk_id)
+                doc_len.append(self.doc_len[doc])
+                alive.append(1)
+                for field in _META_FIELDS:
+                    meta[field].append(self.meta[field][doc])
+
+            vocab, post_docs, post_tfs = {}, [], []
+            for token, term in self.vocab.items():
+                docs, tfs = array("I"), array("H")
+                for doc, tf in zip(self.post_docs[term], self.post_tfs[term]):
+                    if remap[doc] >= 0:
+                        docs.append(remap[doc])
+                        tfs.append(tf)
+                if docs:
+                    vocab[token] = len(post_docs)
+                    post_docs.append(docs)
+                    post_tfs.append(tfs)
+
+            self.doc_ids, self.doc_len, self.alive, self.meta = doc_ids, doc_len, alive, meta
+            self.id_to_doc = {chunk_id: doc for doc, chunk_id in enumerate(doc_ids)}
+            self.vocab, self.post_docs, self.post_tfs = vocab, post_docs, post_tfs
+            self.dead = 0
+
+    # -- querying ---------------------------------------------------------------------
+
+    def _metadata(self, doc):
+        return {field: self.meta_values[field][self.meta[field][doc]] for field in _META_FIELDS}
+
+    def search(self, query, top_k=10, where=None):
+        """
+        Returns:
+            list[tuple[str, float]]: (chunk id, BM25 score), best first.
+        """
+        with self._lock:
+            n_docs = len(self.id_to_doc)
+            if not n_docs:
+                return []
+            avg_len = self.total_len / n_docs or 1.0
+            k1, b = self.k1, self.b
+
+            allowed = {}
+            scores = {}
+            for token in set(tokenize(query)):
+                term = self.vocab.get(token)
+                if term is None:
+                    continue
+                docs, tfs = self.post_docs[term], self.post_tfs[term]
+                df = len(docs)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc, tf in zip(docs, tfs):
+                    if not self.alive[doc]:
+                        continue
+                    if where is not None:
+                        ok = allowed.get(doc)
+                        if ok is None:
+                            ok = allowed[doc] = matches_where(where, self._metadata(doc))
+                        if not ok:
+                            continue
+                    norm = tf + k1 * (1 - b + b * self.doc_len[doc] / avg_len)
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (k1 + 1) / norm
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [(self.doc_ids[doc], score) for doc, score in best]
+
+    # -- persistence ------------------------------------------------------------------
+
+    def save(self, path=None):
+        path = path or self.path
+        with self._lock:
+            if self.dead:
+                self.compact()
+            state = {
+                "version": INDEX_VERSION,
+                "k1": self.k1, "b": self.b,
+                "doc_ids": self.doc_ids,
+                "doc_len": self.doc_len,
+                "meta": self.meta,
+                "meta_values": self.meta_values,
+                "vocab": self.vocab,
+                "post_docs": self.post_docs,
+                "post_tfs": self.post_tfs,
+                "total_len": self.total_len,
+            }
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load the index from `path`; returns an empty index bound to `path` if missing or outdated."""
+        index = cls(path)
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return index
+        if state.get("version") != INDEX_VERSION:
+            return index
+
+        index.k1, index.b = state["k1"], state["b"]
+        index.doc_ids = state["doc_ids"]
+        index.id_to_doc = {chunk_id: doc for doc, chunk_id in enumerate(index.doc_ids)}
+        index.doc_len = state["doc_len"]
+        index.alive = bytearray([1]) * len(index.doc_ids)
+        index.meta = state["meta"]
+        index.meta_values = state["meta_values"]
+        index._meta_lookup = {f: {v: i for i, v in enumerate(vals)} for f, vals in index.meta_values.items()}
+        index.vocab = state["vocab"]
+        index.post_docs = state["post_docs"]
+        index.post_tfs = state["post_tfs"]
+        index.total_len = state["total_len"]
+        return index
+
+    def rebuild_from_collection(self, collection, page_size=5000):
+        """(Re)build the index from every chunk stored in a Chroma collection."""
+        with self._lock:
+            self._reset()
+            offset = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                self.add(page["ids"], page["documents"], page["metadatas"])
+                offset += len(page["ids"])
+
+
+def reciprocal_rank_fusion(rankings, k=60, top_k=None):
+    """
+    Fuse several ranked id lists: score(id) = sum(1 / (k + rank)).
+
+    Returns:
+        list[tuple[str, float]]: (id, fused score), best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return fused[:top_k] if top_k else fused
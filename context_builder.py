@@ -0,0 +1,194 @@
+# context_builder.py
+#
+# Prompt context assembly for RAGAgent.generate_answer. Retrieval over-fetches candidates,
+# which are then
+#
+# - deduplicated (identical texts and near-identical embeddings, e.g. the same table
+#   repeated in a 10-Q and the following 10-K),
+# - reranked with MMR over the chunk embeddings Chroma already stores (relevance to the
+#   question vs. redundancy with the chunks already picked), optionally with a local
+#   cross-encoder as the relevance score,
+# - packed into a token budget, each chunk under a numbered source header; oversized
+#   chunks (big tables) are truncated instead of crowding out everything else.
+#
+# Token counts are estimated (~4 characters per token), which is close enough for Gemini
+# to budget prompt size without a tokenizer round trip.
+
+import hashlib
+import os
+
+import numpy as np
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", "3000"))
+DEFAULT_MAX_CHUNK_TOKENS = int(os.getenv("RAG_MAX_CHUNK_TOKENS", "800"))
+DEFAULT_MAX_CHUNKS = int(os.getenv("RAG_CONTEXT_MAX_CHUNKS", "8"))
+DEFAULT_CANDIDATE_FACTOR = int(os.getenv("RAG_CANDIDATE_FACTOR", "4"))
+DEFAULT_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+DEFAULT_DEDUPE_THRESHOLD = float(os.getenv("RAG_DEDUPE_THRESHOLD", "0.95"))
+# e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"; empty = rank by embedding similarity only
+RERANKER_MODEL = os.getenv("RAG_RERANKER", "")
+
+CHARS_PER_TOKEN = 4
+MIN_PARTIAL_TOKENS = 100   # don't squeeze in a truncated chunk smaller than this
+
+_reranker = None
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _truncate(text, max_tokens):
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    if cut < limit // 2:
+        cut = text.rfind(" ", 0, limit)
+    if cut < limit // 2:
+        cut = limit
+    return text[:cut].rstrip() + " …"
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def get_reranker():
+    """The RAG_RERANKER cross-encoder, loaded on first use; None if not configured."""
+    global _reranker
+    if RERANKER_MODEL and _reranker is None:
+        from sentence_transformers import CrossEncoder
+        _reranker = CrossEncoder(RERANKER_MODEL)
+    return _reranker
+
+
+def source_header(number, metadata):
+    source = metadata.get("source", "Unknown source")
+    details = ", ".join(str(metadata[k]) for k in ("company", "year") if metadata.get(k))
+    # Near-duplicates are stored once (dedup_index); say how many other filings repeat it
+    others = metadata.get("sources", "").count(";")
+    return (f"[{number}] {source}" + (f" ({details})" if details else "")
+            + (f" +{others} more filing{'s' if others > 1 else ''}" if others else ""))
+
+
+class ContextBuilder:
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, max_chunk_tokens=DEFAULT_MAX_CHUNK_TOKENS,
+                 max_chunks=DEFAULT_MAX_CHUNKS, mmr_lambda=DEFAULT_MMR_LAMBDA,
+                 dedupe_threshold=DEFAULT_DEDUPE_THRESHOLD, reranker=None):
+        """
+        Args:
+            token_budget (int): Estimated tokens available for the context (headers included).
+            max_chunk_tokens (int): Longer chunks are truncated to this size.
+            max_chunks (int): Upper bound on the number of chunks in the context.
+            mmr_lambda (float): 1.0 = pure relevance, lower values favour diversity.
+            dedupe_threshold (float): Cosine similarity above which two chunks count as duplicates.
+            reranker: Object with predict([(question, text), ...]) (e.g. a CrossEncoder);
+                None uses the RAG_RERANKER model if configured, else embedding similarity.
+        """
+        self.token_budget = token_budget
+        self.max_chunk_tokens = max_chunk_tokens
+        self.max_chunks = max_chunks
+        self.mmr_lambda = mmr_lambda
+        self.dedupe_threshold = dedupe_threshold
+        self.reranker = reranker
+
+    def signature(self):
+        """Settings that change which context a question gets (for the answer cache)."""
+        return (self.token_budget, self.max_chunk_tokens, self.max_chunks, self.mmr_lambda,
+                self.dedupe_threshold, RERANKER_MODEL if self.reranker is None else type(self.reranker).__name__)
+
+    def _dedupe(self, texts, vectors):
+        keep, seen_hashes = [], set()
+        for i, text in enumerate(texts):
+            digest = hashlib.md5(" ".join(text.split()).lower().encode("utf-8")).hexdigest()
+            if digest in seen_hashes:
+                continue
+            if keep and float(np.max(vectors[keep] @ vectors[i])) >= self.dedupe_threshold:
+                continue
+            seen_hashes.add(digest)
+            keep.append(i)
+        return keep
+
+    def _relevance(self, question, question_vector, texts, vectors):
+        reranker = self.reranker or get_reranker()
+        if reranker is None:
+            return vectors @ question_vector
+        scores = np.asarray(reranker.predict([(question, text) for text in texts]), dtype=np.float32)
+        # Scale to [0, 1] so it is comparable with the cosine redundancy term of MMR
+        span = scores.max() - scores.min()
+        return (scores - scores.min()) / span if span else np.ones_like(scores)
+
+    def _mmr_order(self, relevance, vectors):
+        order, remaining = [], list(range(len(relevance)))
+        redundancy = np.full(len(relevance), -1.0, dtype=np.float32)
+        while remaining:
+            scores = [self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * max(redundancy[i], 0.0)
+                      for i in remaining]
+            best = remaining.pop(int(np.argmax(scores)))
+            order.append(best)
+            redundancy = np.maximum(redundancy, vectors @ vectors[best])
+        return order
+
+    def build(self, question, question_embedding, ids, documents, metadatas, embeddings, max_chunks=None):
+        """
+        Select, order and pack candidate chunks into the prompt context.
+
+        Args:
+            question (str): The user's question.
+            question_embedding: Question embedding.
+            ids, documents, metadatas (list): Candidate chunks, in retrieval order.
+            embeddings: One embedding per candidate.
+            max_chunks (int): Chunk cap for this call (e.g. the caller's top_k); never
+                above the builder's own max_chunks.
+
+        Returns:
+            dict: Shaped like RAGAgent.query results ("ids", "documents", "metadatas", one
+                  list per query) for the packed chunks, plus "context" (the prompt text)
+                  and "context_stats" (tokens used, budget, candidates, duplicates dropped,
+                  truncated chunks and chunks left out by the budget / max_chunks).
+        """
+        max_chunks = self.max_chunks if max_chunks is None else min(max_chunks, self.max_chunks)
+        stats = {"tokens": 0, "budget": self.token_budget, "candidates": len(ids),
+                 "duplicates": 0, "truncated": 0, "skipped": 0, "chunks": 0}
+        packed = {"ids": [[]], "documents": [[]], "metadatas": [[]]}
+        if not ids:
+            packed.update(context="", context_stats=stats)
+            return packed
+
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        question_vector = np.asarray(question_embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(question_vector)
+        question_vector = question_vector / norm if norm else question_vector
+
+        keep = self._dedupe(documents, vectors)
+        stats["duplicates"] = len(ids) - len(keep)
+        vectors = vectors[keep]
+        texts = [documents[i] for i in keep]
+        relevance = self._relevance(question, question_vector, texts, vectors)
+
+        parts = []
+        for position in self._mmr_order(relevance, vectors):
+            index = keep[position]
+            header = source_header(stats["chunks"] + 1, metadatas[index])
+            remaining = self.token_budget - stats["tokens"] - estimate_tokens(header) - 1
+            if stats["chunks"] >= max_chunks or remaining < MIN_PARTIAL_TOKENS:
+                break
+            text = documents[index]
+            limit = min(self.max_chunk_tokens, remaining)
+            if estimate_tokens(text) > limit:
+                text = _truncate(text, limit)
+                stats["truncated"] += 1
+            part = f"{header}\n{text}"
+            parts.append(part)
+            stats["tokens"] += estimate_tokens(part) + 1
+            stats["chunks"] += 1
+            packed["ids"][0].append(ids[index])
+            packed["documents"][0].append(documents[index])
+            packed["metadatas"][0].append(metadatas[index])
+
+        stats["skipped"] = len(keep) - stats["chunks"]
+        packed.update(context="\n\n".join(parts), context_stats=stats)
+        return packed
@@ -1,52 +1,180 @@
-from langchain.chat_models import init_chat_model
-from langgraph_supervisor import create_supervisor
-from web_agent import web_agent
-from langchain_core.tools import Tool
-from langgraph.prebuilt import create_react_agent
 import re
-from rag_no_img import generateAnswerTool
+import threading
 import os
-from langsmith import traceable
+from query_filters import extract_query_filters
+from lazy_init import lazy
+from instrumentation import timed
+from web_agent import get_web_agent, gemini_model_component
 from dotenv import load_dotenv
 load_dotenv()
-os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGCHAIN_API_KEY")
-os.environ["LANGCHAIN_PROJECT"] = "Final Project"
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
 
-# Инициализация модели
-gemini_model = init_chat_model("gemini-2.0-flash", model_provider="google_genai")
+# LangSmith-Tracing nur mit API-Key aktivieren (ohne Key startet die App trotzdem)
+if os.getenv("LANGCHAIN_API_KEY"):
+    os.environ.setdefault("LANGCHAIN_PROJECT", "Final Project")
+    os.environ.setdefault("LANGCHAIN_TRACING_V2", "true")
+else:
+    print("ℹ️ LANGCHAIN_API_KEY fehlt, LangSmith-Tracing ist deaktiviert.")
+
+# Модели, агенты и RAG-индекс создаются лениво, при первом использовании
 
 # Аналитический инструмент
 def analyze_company(query: str) -> str:
     return f"📊 Analytische Auswertung für: {query}"
 
-rag_tool = Tool(
-    name="rag",
-    func=generateAnswerTool,
-    description="Frage,die mit Investorberichte verbunden sind, beantworten."
-)
 
-rag_agent = create_react_agent(
-    model=gemini_model,
-    tools=[rag_tool],
-    name="rag_agent",
-        prompt=(
-            "Du bist ein spezialisierter RAG-Agent im Finanzbereich.\n"
-            "Deine Aufgabe ist es, Fragen zu Marktanalysen, Trends, Vorhersagen und Finanzkennzahlen von  US-Unternehmen,wie Apple,Google,Meta,Microsoft,Nvidia"
-            "zu beantworten – ausschließlich basierend auf offiziellen 10-Q und 10-K SEC-Berichten aus den Jahren 2020 bis 2024.\n"
-            "\n"
-            "Verwende ausschließlich das Tool 'generateAnswerTool'."
-        )
+def _rag_answer(question: str) -> str:
+    from rag_no_img import generateAnswerTool
+    # generateAnswerTool returns the answer dict (answer, sources, cached, ...)
+    return generateAnswerTool(question)["answer"]
+
+
+def _rag_answer_stream(question: str):
+    from rag_no_img import generateAnswerStream
+    return generateAnswerStream(question)
+
+
+def _build_rag_index():
+    from rag_no_img import get_rag_agent
+    return get_rag_agent()
+
+
+RAG_AGENT_PROMPT = (
+    "Du bist ein spezialisierter RAG-Agent im Finanzbereich.\n"
+    "Deine Aufgabe ist es, Fragen zu Marktanalysen, Trends, Vorhersagen und Finanzkennzahlen von  US-Unternehmen,wie Apple,Google,Meta,Microsoft,Nvidia"
+    "zu beantworten – ausschließlich basierend auf offiziellen 10-Q und 10-K SEC-Berichten aus den Jahren 2020 bis 2024.\n"
+    "\n"
+    "Verwende ausschließlich das Tool 'generateAnswerTool'."
 )
 
+
+def _build_rag_agent():
+    from langchain_core.tools import Tool
+    from langgraph.prebuilt import create_react_agent
+
+    rag_tool = Tool(
+        name="rag",
+        func=_rag_answer,
+        description="Frage,die mit Investorberichte verbunden sind, beantworten."
+    )
+
+    return create_react_agent(
+        model=gemini_model_component.get(),
+        tools=[rag_tool],
+        name="rag_agent",
+        prompt=RAG_AGENT_PROMPT
+    )
+
+
+rag_index_component = lazy("rag_index", _build_rag_index)
+rag_agent_component = lazy("rag_agent", _build_rag_agent)
+
+def _keyword_pattern(keywords):
+    # Whole words only ("kurs" must not match "diskurs"), with common plural/inflection
+    # endings ("aktuellen", "reports", "quarters")
+    alternatives = "|".join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)({alternatives})(?:s|e|en|er|es|n)?(?!\w)")
+
+
+def _keyword_hits(pattern, text):
+    return sorted({match.group(1) for match in pattern.finditer(text)})
+
+
+WEB_KEYWORDS = ["aktuell", "heute", "nachrichten", "kurs", "aktie", "aktienkurs", "preis", "schlusspreis"]
+_WEB_KEYWORDS_RE = _keyword_pattern(WEB_KEYWORDS)
+
+
 # Выбор агента по ключевым словам
 def choose_agent(user_message: str) -> str:
-    keywords_for_web = ["aktuell", "heute", "nachrichten", "kurs", "aktie", "preis", "schlusspreis"]
-    if any(kw in user_message.lower() for kw in keywords_for_web):
+    if _keyword_hits(_WEB_KEYWORDS_RE, user_message.lower()):
         return "web_agent"
     else:
         return "analytics_agent"
 
+# Детерминированный роутер: при однозначном вопросе инструмент вызывается напрямую,
+# без ReAct-цикла (экономит LLM-вызовы на выбор инструмента и пересказ его ответа)
+FAST_PATH_ENABLED = os.getenv("COORDINATOR_FAST_PATH", "1") == "1"
+
+# LLM calls a ReAct agent needs around its single tool call (pick the tool + restate the
+# result); used until real agent runs have been observed
+DEFAULT_AGENT_LLM_CALLS = 2
+
+WEB_SIGNALS = ["aktuell", "heute", "nachrichten", "kurs", "aktie", "aktienkurs", "preis", "schlusspreis",
+               "news", "today", "latest", "current", "stock price", "share price", "neueste"]
+RAG_SIGNALS = ["10-k", "10-q", "10k", "10q", "bericht", "report", "filing", "revenue", "umsatz",
+               "gewinn", "net income", "operating income", "margin", "marge", "cash flow",
+               "earnings per share", "risk factor", "risiko", "segment", "geschäftsjahr",
+               "fiscal", "quartal", "quarter", "ausgaben", "expenses", "r&d", "dividend", "dividende"]
+_WEB_SIGNALS_RE = _keyword_pattern(WEB_SIGNALS)
+_RAG_SIGNALS_RE = _keyword_pattern(RAG_SIGNALS)
+
+_router_lock = threading.Lock()
+_router_stats = {
+    agent: {"direct": 0, "agent": 0, "agent_llm_calls": 0, "llm_calls_saved": 0}
+    for agent in ("web_agent", "analytics_agent")
+}
+
+
+@timed("coordinator.route")
+def route_message(user_message: str) -> dict:
+    """
+    Decide which agent answers a message and whether its tool can be called directly.
+
+    Returns:
+        dict: {"agent": "web_agent" | "analytics_agent", "direct": bool, "reason": str}.
+              `direct` is only True when the message carries signals for one side only
+              (and, for the web side, names a known company); everything else goes
+              through the ReAct agent chosen by `choose_agent`.
+    """
+    text = user_message.lower()
+    web_hits = _keyword_hits(_WEB_SIGNALS_RE, text)
+    rag_hits = _keyword_hits(_RAG_SIGNALS_RE, text)
+    filters = extract_query_filters(user_message)
+    if filters["years"]:
+        rag_hits.append("year " + "/".join(filters["years"]))
+    if filters["form"]:
+        rag_hits.append(filters["form"])
+
+    if FAST_PATH_ENABLED:
+        if web_hits and not rag_hits and _find_company(user_message):
+            return {"agent": "web_agent", "direct": True, "reason": ", ".join(web_hits)}
+        if rag_hits and not web_hits:
+            return {"agent": "analytics_agent", "direct": True, "reason": ", ".join(rag_hits)}
+    reason = "ambiguous" if web_hits and rag_hits else "no clear signal"
+    return {"agent": choose_agent(user_message), "direct": False, "reason": reason}
+
+
+def count_llm_calls(response) -> int:
+    """Number of model turns (AI messages) in a LangGraph agent response."""
+    count = 0
+    for msg in response.get("messages", []):
+        role = getattr(msg, "type", None) or (msg.get("role") if isinstance(msg, dict) else None)
+        if role in ("ai", "assistant"):
+            count += 1
+    return count
+
+
+def _record_route(agent: str, direct: bool, llm_calls: int = 0) -> int:
+    """Update the router counters; returns the LLM calls saved by this request."""
+    with _router_lock:
+        stats = _router_stats[agent]
+        if not direct:
+            stats["agent"] += 1
+            stats["agent_llm_calls"] += llm_calls
+            return 0
+        stats["direct"] += 1
+        saved = (stats["agent_llm_calls"] / stats["agent"]) if stats["agent"] else DEFAULT_AGENT_LLM_CALLS
+        stats["llm_calls_saved"] += saved
+        return saved
+
+
+def get_router_stats() -> dict:
+    """Per agent: direct dispatches, agent fallbacks, LLM calls made by the agent and calls saved."""
+    with _router_lock:
+        return {
+            agent: dict(stats, llm_calls_saved=round(stats["llm_calls_saved"], 1))
+            for agent, stats in _router_stats.items()
+        }
+
 # Функция для извлечения текста из сложного объекта ответа
 def extract_text_from_response(response):
     messages = response.get("messages", [])
@@ -82,28 +210,39 @@ def clean_and_format_news(text: str) -> str:
     return "\n\n".join(formatted_lines)
 
 # Обновлённый координатор с форматированием
+@timed("coordinator.handle")
 def coordinator_handle(user_message: str) -> str:
-    chosen = choose_agent(user_message)
+    route = route_message(user_message)
+    chosen = route["agent"]
 
     if chosen == "web_agent":
-        from web_agent import COMPANIES
-        company_name = None
-        for name in COMPANIES.keys():
-            if re.search(rf"\b{name}\b", user_message, re.IGNORECASE):
-                company_name = name.capitalize()
-                break
+        from web_agent import COMPANIES, handle_company_news
+        company_name = _find_company(user_message)
         if not company_name:
             available = ", ".join(c.capitalize() for c in COMPANIES.keys())
             return f"❌ Bitte geben Sie eine bekannte Firma an. Verfügbare Firmen: {available}"
 
-        response = web_agent.invoke({
+        if route["direct"]:
+            saved = _record_route(chosen, True)
+            print(f"⚡ Fast path → get_company_news ({route['reason']}), ~{saved:.1f} LLM calls saved")
+            return clean_and_format_news(handle_company_news(company_name))
+
+        response = get_web_agent().invoke({
             "messages": [{"role": "user", "content": company_name}]
         })
     else:
-        response = rag_agent.invoke({
+        if route["direct"]:
+            saved = _record_route(chosen, True)
+            print(f"⚡ Fast path → rag ({route['reason']}), ~{saved:.1f} LLM calls saved")
+            return _rag_answer(user_message)
+
+        response = rag_agent_component.get().invoke({
             "messages": [{"role": "user", "content": user_message}]
         })
 
+    llm_calls = count_llm_calls(response)
+    _record_route(chosen, False, llm_calls)
+    print(f"🤖 {chosen} via ReAct loop ({route['reason']}), {llm_calls} LLM calls")
     raw_text = extract_text_from_response(response)
 
     # Если web_agent, форматируем новости красиво
@@ -112,19 +251,121 @@ def coordinator_handle(user_message: str) -> str:
     else:
         return raw_text
 
-# (Опционально) создание supervisor-а
-coordinator_agent = create_supervisor(
-    agents=[web_agent, rag_agent],
-    model=gemini_model,
-    prompt=(
-        "Du bist ein Koordinator-Agent, der zwei spezialisierte Agenten verwaltet:\n"
-        "- web_agent für Nachrichten, Aktienkurse, aktuelle Finanzinformationen.\n"
-        "- rag_agent für die Informationen aus Investorenberichten 2020–2024\n"
-        "Wähle den passenden Agenten basierend auf der Nutzerfrage und gib nur die Antwort dieses Agenten zurück."
-    ),
-    add_handoff_back_messages=True,
-    output_mode="full_history",
-).compile()
+def _find_company(user_message: str):
+    from web_agent import COMPANIES
+    for name in COMPANIES.keys():
+        if re.search(rf"\b{name}\b", user_message, re.IGNORECASE):
+            return name.capitalize()
+    return None
+
+# Потоковый вариант координатора: выдаёт накопленный текст ответа по мере генерации
+@timed("coordinator.handle_stream")
+def coordinator_handle_stream(user_message: str):
+    """
+    Streaming variant of coordinator_handle.
+
+    Yields the answer accumulated so far (each value replaces the previous one), so a
+    chat UI can render partial output. Clear RAG questions stream straight from
+    generateAnswerStream: citations arrive as soon as retrieval is done, followed by the
+    Gemini tokens; everything else streams the chosen ReAct agent's tokens (web answers
+    formatted as news), unless route_message allows calling get_company_news directly.
+    """
+    route = route_message(user_message)
+    chosen = route["agent"]
+
+    if chosen == "web_agent":
+        company_name = _find_company(user_message)
+        if not company_name:
+            from web_agent import COMPANIES
+            available = ", ".join(c.capitalize() for c in COMPANIES.keys())
+            yield f"❌ Bitte geben Sie eine bekannte Firma an. Verfügbare Firmen: {available}"
+            return
+
+        if route["direct"]:
+            from web_agent import handle_company_news
+            saved = _record_route(chosen, True)
+            print(f"⚡ Fast path → get_company_news ({route['reason']}), ~{saved:.1f} LLM calls saved")
+            yield clean_and_format_news(handle_company_news(company_name))
+            return
+
+        text = ""
+        message_ids = set()
+        for chunk, metadata in get_web_agent().stream(
+            {"messages": [{"role": "user", "content": company_name}]},
+            stream_mode="messages",
+        ):
+            # Only the model's own tokens, not the raw tool output
+            if metadata.get("langgraph_node") != "agent":
+                continue
+            message_ids.add(getattr(chunk, "id", None))
+            content = chunk.content if isinstance(chunk.content, str) else ""
+            if content:
+                text += content
+                yield clean_and_format_news(text)
+        _record_route(chosen, False, len(message_ids))
+        if not text:
+            yield "Keine Antwort gefunden."
+        return
+
+    if route["direct"]:
+        saved = _record_route(chosen, True)
+        print(f"⚡ Fast path → rag stream ({route['reason']}), ~{saved:.1f} LLM calls saved")
+        text = ""
+        for piece in _rag_answer_stream(user_message):
+            text += piece
+            yield text
+        return
+
+    # No clear signal: the RAG agent decides, its own tokens are streamed
+    text = ""
+    message_ids = set()
+    for chunk, metadata in rag_agent_component.get().stream(
+        {"messages": [{"role": "user", "content": user_message}]},
+        stream_mode="messages",
+    ):
+        if metadata.get("langgraph_node") != "agent":
+            continue
+        message_ids.add(getattr(chunk, "id", None))
+        content = chunk.content if isinstance(chunk.content, str) else ""
+        if content:
+            text += content
+            yield text
+    _record_route(chosen, False, len(message_ids))
+    print(f"🤖 {chosen} via ReAct loop ({route['reason']}), {len(message_ids)} LLM calls")
+    if not text:
+        yield "Keine Antwort gefunden."
+
+# (Опционально) создание supervisor-а — coordinator_handle его не использует,
+# поэтому граф компилируется только по запросу
+def _build_supervisor():
+    from langgraph_supervisor import create_supervisor
+    return create_supervisor(
+        agents=[get_web_agent(), rag_agent_component.get()],
+        model=gemini_model_component.get(),
+        prompt=(
+            "Du bist ein Koordinator-Agent, der zwei spezialisierte Agenten verwaltet:\n"
+            "- web_agent für Nachrichten, Aktienkurse, aktuelle Finanzinformationen.\n"
+            "- rag_agent für die Informationen aus Investorenberichten 2020–2024\n"
+            "Wähle den passenden Agenten basierend auf der Nutzerfrage und gib nur die Antwort dieses Agenten zurück."
+        ),
+        add_handoff_back_messages=True,
+        output_mode="full_history",
+    ).compile()
+
+
+supervisor_component = lazy("supervisor", _build_supervisor)
+
+
+def __getattr__(name):
+    # Old module attributes, now built on first access
+    if name == "coordinator_agent":
+        return supervisor_component.get()
+    if name == "rag_agent":
+        return rag_agent_component.get()
+    if name == "gemini_model":
+        return gemini_model_component.get()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 q_to_web="Was sind die aktuellen Nachrichten über Apple Aktienkurs?"
 q_to_rag="What is revenue of Apple 2023?"
 # Для теста
@@ -1,170 +1,255 @@
-import os
-from dotenv import load_dotenv
-import pandas as pd
-from datetime import datetime
-import plotly.graph_objs as go
-from prophet import Prophet
-import numpy as np
-import gradio as gr
-import pmdarima as pm
-
-from langchain_community.vectorstores import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, GoogleGenerativeAI
-from langchain.chains.question_answering import load_qa_chain
-
-# Load environment variables
-load_dotenv()
-
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-LANGSMITH_API_KEY = os.getenv("LANGSMITH_API_KEY")
-LANGSMITH_TRACING = os.getenv("LANGSMITH_TRACING", "true")
-
-os.environ["LANGSMITH_TRACING"] = LANGSMITH_TRACING
-os.environ["LANGSMITH_API_KEY"] = LANGSMITH_API_KEY
-
-embedding = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001", google_api_key=GOOGLE_API_KEY
-)
-vectorstore = Chroma(
-    persist_directory="persist_store", embedding_function=embedding
-)
-retriever = vectorstore.as_retriever()
-
-llm = GoogleGenerativeAI(model="models/gemini-1.5-flash", google_api_key=GOOGLE_API_KEY)
-chain = load_qa_chain(llm=llm, chain_type="stuff")
-
-
-def answer_financial_query(company_name: str, user_question: str) -> str:
-    query = (
-        f"Provide financial data, stock prices, earnings, and recent performance for {company_name}. "
-        f"User question: {user_question}"
-    )
-    docs = retriever.get_relevant_documents(query)
-    if not docs:
-        return f"Sorry, no financial information found related to your query about {company_name}."
-    return chain.run(input_documents=docs, question=user_question)
-
-
-def extract_time_series_from_docs(docs) -> pd.DataFrame:
-    # Placeholder for future implementation:
-    # Extract stock prices or earnings data from retrieved IR documents (PDF, HTML, etc.)
-    return None
-
-
-def generate_synthetic_stock_data(periods=365):
-    today = datetime.today()
-    dates = pd.date_range(end=today, periods=periods)
-    prices = 300 + (np.arange(periods) * 0.1) + (5 * np.random.randn(periods))
-    return pd.DataFrame({'ds': dates, 'y': prices})
-
-
-def forecast_with_prophet(df: pd.DataFrame, forecast_period: int = 90):
-    model = Prophet(daily_seasonality=True)
-    model.fit(df)
-    future = model.make_future_dataframe(periods=forecast_period)
-    forecast = model.predict(future)
-    return forecast
-
-
-def forecast_with_arima(df: pd.DataFrame, forecast_period: int = 90):
-    df_arima = df.copy()
-    df_arima.set_index("ds", inplace=True)
-    model = pm.auto_arima(df_arima['y'], seasonal=False, stepwise=True, suppress_warnings=True)
-    forecast = model.predict(n_periods=forecast_period)
-    future_dates = pd.date_range(start=df["ds"].iloc[-1] + pd.Timedelta(days=1), periods=forecast_period)
-    forecast_df = pd.DataFrame({'ds': future_dates, 'yhat': forecast})
-    full_df = pd.concat([df[['ds', 'y']], forecast_df], ignore_index=True)
-    return full_df
-
-
-def create_stock_forecast_plot(df: pd.DataFrame, forecast: pd.DataFrame, company_name: str):
-    fig = go.Figure()
-
-    fig.add_trace(go.Scatter(
-        x=df["ds"], y=df["y"], mode='lines', name="Historical", line=dict(color="blue")
-    ))
-
-    fig.add_trace(go.Scatter(
-        x=forecast["ds"], y=forecast["yhat"], mode='lines', name="Forecast", line=dict(color="green")
-    ))
-
-    # Prophet confidence intervals if available
-    if "yhat_lower" in forecast.columns and "yhat_upper" in forecast.columns:
-        fig.add_trace(go.Scatter(
-            x=forecast["ds"], y=forecast["yhat_upper"],
-            mode='lines', name="Upper Bound", line=dict(width=0), showlegend=False
-        ))
-        fig.add_trace(go.Scatter(
-            x=forecast["ds"], y=forecast["yhat_lower"],
-            mode='lines', name="Lower Bound", fill='tonexty', line=dict(width=0),
-            fillcolor='rgba(0,255,0,0.2)', showlegend=True
-        ))
-
-    fig.update_layout(
-        title=f"{company_name} Stock Price Forecast",
-        xaxis_title="Date",
-        yaxis_title="Price",
-        legend=dict(x=0, y=1),
-        hovermode="x unified"
-    )
-    return fig
-
-
-def generate_custom_forecast_explanation(company_name: str, forecast: pd.DataFrame, prompt: str, forecast_period: int) -> str:
-    recent = forecast.tail(forecast_period)[["ds", "yhat"]].copy()
-    recent["ds"] = recent["ds"].dt.strftime('%Y-%m-%d')
-    recent_str = recent.to_string(index=False)
-
-    full_prompt = (
-        f"Here is the {forecast_period}-day forecast for {company_name}:\n{recent_str}\n\n"
-        f"Now, using this data, respond to the following explanation prompt:\n{prompt}"
-    )
-    
-    response = llm.generate([full_prompt]).generations[0][0].text
-    return response.strip()
-
-
-def analyze_and_forecast_stock(company_name: str, user_question: str, explanation_prompt: str, model_choice: str):
-    summary = answer_financial_query(company_name, user_question)
-    docs = retriever.get_relevant_documents(f"Historical stock prices and earnings for {company_name}")
-    df = extract_time_series_from_docs(docs)
-    if df is None or df.empty:
-        df = generate_synthetic_stock_data()
-
-    forecast_period = 90  # you can change this default or make it a user input
-    if model_choice == "Prophet":
-        forecast = forecast_with_prophet(df, forecast_period)
-    elif model_choice == "ARIMA":
-        forecast = forecast_with_arima(df, forecast_period)
-    else:
-        raise ValueError("Unsupported model type")
-
-    # Normalize yhat
-    if "yhat" not in forecast.columns:
-        forecast["yhat"] = forecast.get("y")
-
-    plot = create_stock_forecast_plot(df, forecast, company_name)
-    explanation = generate_custom_forecast_explanation(company_name, forecast, explanation_prompt, forecast_period)
-    return summary, plot, explanation
-
-
-# Gradio Interface
-iface = gr.Interface(
-    fn=analyze_and_forecast_stock,
-    inputs=[
-        gr.Textbox(label="Company Name", placeholder="e.g., Microsoft, Google, Nvidia"),
-        gr.Textbox(label="Financial Query", placeholder="e.g., Analyze Microsoft’s stock performance over the past year and forecast its performance next quarter."),
-        gr.Textbox(label="Forecast Explanation Prompt", placeholder="e.g., Explain this forecast focusing on market risks and opportunities.", lines=3),
-        gr.Dropdown(choices=["Prophet", "ARIMA"], label="Forecasting Model", value="Prophet")
-    ],
-    outputs=[
-        gr.Textbox(label="Financial Summary and Insights"),
-        gr.Plot(label="Stock Price Forecast"),
-        gr.Textbox(label="Forecast Explanation")
-    ],
-    title="📈 Financial Analytics & Forecasting (Prophet & ARIMA)",
-    description="Conduct advanced market analytics, generate forecasts with Prophet or ARIMA, visualize trends, and receive AI-generated narrative insights."
-)
-
-if __name__ == "__main__":
-    iface.launch()
+import os
+from dotenv import load_dotenv
+import pandas as pd
+import plotly.graph_objs as go
+import gradio as gr
+
+from lazy_init import lazy
+from batch_forecast import get_precomputed
+from forecast_engine import MODEL_TYPES, fit_forecast, get_forecast_engine, resolve_ticker
+from metrics_store import MetricsStore, METRICS_FILE
+from query_filters import extract_query_filters
+
+# Load environment variables
+load_dotenv()
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+LANGSMITH_API_KEY = os.getenv("LANGSMITH_API_KEY")
+LANGSMITH_TRACING = os.getenv("LANGSMITH_TRACING", "true")
+
+# Tracing only when a key is configured; the agent still starts without one
+if LANGSMITH_API_KEY:
+    os.environ["LANGSMITH_TRACING"] = LANGSMITH_TRACING
+    os.environ["LANGSMITH_API_KEY"] = LANGSMITH_API_KEY
+
+
+# Embeddings, vector store, LLM and QA chain are built on first use
+def _build_retriever():
+    from langchain_community.vectorstores import Chroma
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    embedding = GoogleGenerativeAIEmbeddings(
+        model="models/embedding-001", google_api_key=GOOGLE_API_KEY
+    )
+    vectorstore = Chroma(
+        persist_directory="persist_store", embedding_function=embedding
+    )
+    return vectorstore.as_retriever()
+
+
+def _build_llm():
+    from langchain_google_genai import GoogleGenerativeAI
+    return GoogleGenerativeAI(model="models/gemini-1.5-flash", google_api_key=GOOGLE_API_KEY)
+
+
+def _build_chain():
+    from langchain.chains.question_answering import load_qa_chain
+    return load_qa_chain(llm=llm.get(), chain_type="stuff")
+
+
+def _build_metrics_store():
+    return MetricsStore(os.path.join("persist_store", METRICS_FILE))
+
+
+retriever = lazy("ds_retriever", _build_retriever)
+metrics_store = lazy("ds_metrics_store", _build_metrics_store)
+llm = lazy("ds_llm", _build_llm)
+chain = lazy("ds_qa_chain", _build_chain)
+
+
+def answer_financial_query(company_name: str, user_question: str) -> str:
+    query = (
+        f"Provide financial data, stock prices, earnings, and recent performance for {company_name}. "
+        f"User question: {user_question}"
+    )
+    docs = retriever.get().get_relevant_documents(query)
+    if not docs:
+        return f"Sorry, no financial information found related to your query about {company_name}."
+    return chain.get().run(input_documents=docs, question=user_question)
+
+
+def extract_time_series_from_docs(docs, company_name: str = None, metric: str = "revenue") -> pd.DataFrame:
+    """
+    Time series of a reported metric, read from the financial metrics store that indexPDF
+    fills from the filing tables.
+
+    The company is taken from `company_name`, or else from the metadata of the retrieved
+    docs. Quarterly values are used when there are enough of them, annual values otherwise.
+
+    Returns:
+        pd.DataFrame | None: Columns "ds" (approximate period end) and "y"; None if the
+        store has fewer than two values.
+    """
+    companies = extract_query_filters(company_name)["companies"] if company_name else []
+    if not companies:
+        companies = [doc.metadata["company"] for doc in docs or [] if doc.metadata.get("company")]
+    if not companies:
+        return None
+
+    store = metrics_store.get()
+    for period_type in ("Q", "FY"):
+        series = store.time_series(companies[0], metric, period_type=period_type)
+        if len(series) >= 4 or (period_type == "FY" and len(series) >= 2):
+            return pd.DataFrame({"ds": pd.to_datetime([ds for ds, _ in series]), "y": [y for _, y in series]})
+    return None
+
+
+# One-off, uncached fits in the current process; the UI goes through the ForecastEngine
+def forecast_with_prophet(df: pd.DataFrame, forecast_period: int = 90):
+    return fit_forecast("Prophet", df, forecast_period)[1]
+
+
+def forecast_with_arima(df: pd.DataFrame, forecast_period: int = 90):
+    return fit_forecast("ARIMA", df, forecast_period)[1]
+
+
+def create_stock_forecast_plot(df: pd.DataFrame, forecast: pd.DataFrame, company_name: str):
+    fig = go.Figure()
+
+    fig.add_trace(go.Scatter(
+        x=df["ds"], y=df["y"], mode='lines', name="Historical", line=dict(color="blue")
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=forecast["ds"], y=forecast["yhat"], mode='lines', name="Forecast", line=dict(color="green")
+    ))
+
+    # Prophet confidence intervals if available
+    if "yhat_lower" in forecast.columns and "yhat_upper" in forecast.columns:
+        fig.add_trace(go.Scatter(
+            x=forecast["ds"], y=forecast["yhat_upper"],
+            mode='lines', name="Upper Bound", line=dict(width=0), showlegend=False
+        ))
+        fig.add_trace(go.Scatter(
+            x=forecast["ds"], y=forecast["yhat_lower"],
+            mode='lines', name="Lower Bound", fill='tonexty', line=dict(width=0),
+            fillcolor='rgba(0,255,0,0.2)', showlegend=True
+        ))
+
+    fig.update_layout(
+        title=f"{company_name} Stock Price Forecast",
+        xaxis_title="Date",
+        yaxis_title="Price",
+        legend=dict(x=0, y=1),
+        hovermode="x unified"
+    )
+    return fig
+
+
+def create_reported_metric_plot(df: pd.DataFrame, company_name: str, metric: str = "revenue"):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=df["ds"], y=df["y"], mode='lines+markers', name="Reported", line=dict(color="blue")
+    ))
+    fig.update_layout(
+        title=f"{company_name} Reported {metric.replace('_', ' ').title()} (SEC filings)",
+        xaxis_title="Period End",
+        yaxis_title=metric.replace("_", " ").title(),
+        hovermode="x unified"
+    )
+    return fig
+
+
+def generate_custom_forecast_explanation(company_name: str, forecast: pd.DataFrame, prompt: str, forecast_period: int) -> str:
+    recent = forecast.tail(forecast_period)[["ds", "yhat"]].copy()
+    recent["ds"] = recent["ds"].dt.strftime('%Y-%m-%d')
+    recent_str = recent.to_string(index=False)
+
+    # Reported revenue from the filings gives the price forecast its fundamentals context
+    reported = extract_time_series_from_docs(None, company_name)
+    reported_str = ""
+    if reported is not None:
+        reported = reported.assign(ds=reported["ds"].dt.strftime('%Y-%m-%d'))
+        reported_str = f"Reported revenue per period (SEC filings):\n{reported.to_string(index=False)}\n\n"
+
+    full_prompt = (
+        f"Here is the {forecast_period}-day forecast for {company_name}:\n{recent_str}\n\n"
+        f"{reported_str}"
+        f"Now, using this data, respond to the following explanation prompt:\n{prompt}"
+    )
+    
+    response = llm.get().generate([full_prompt]).generations[0][0].text
+    return response.strip()
+
+
+def _await_forecast(pending, ticker, model_choice, forecast_period):
+    """
+    Result of the forecast started with forecast_async; if that model fails (fit error,
+    no or unreachable price data, broken worker), the other model is tried once.
+
+    Returns:
+        tuple: (history DataFrame, forecast DataFrame, model type that produced it)
+    """
+    try:
+        df, forecast, _ = pending.result()
+        return df, forecast, model_choice
+    except Exception as e:
+        fallback = next(model for model in MODEL_TYPES if model != model_choice)
+        print(f"⚠️ {model_choice} forecast for {ticker} failed ({type(e).__name__}: {e}), trying {fallback}")
+        df, forecast, _ = get_forecast_engine().forecast(ticker, fallback, forecast_period)
+        return df, forecast, fallback
+
+
+def analyze_and_forecast_stock(company_name: str, user_question: str, explanation_prompt: str, model_choice: str):
+    """
+    Gradio handler; yields (summary, plot, explanation) as the parts become available, so
+    the summary is shown while the forecast is still being fitted.
+    """
+    forecast_period = 90  # business days; you can change this default or make it a user input
+    ticker = resolve_ticker(company_name)
+    if ticker is None:
+        # No listed ticker: show the reported revenue from the filings instead of prices
+        reported = extract_time_series_from_docs(None, company_name)
+        plot = create_reported_metric_plot(reported, company_name) if reported is not None else None
+        yield (answer_financial_query(company_name, user_question), plot,
+               f"No price history available for {company_name}.")
+        return
+
+    # Nightly batch_forecast.py results first; only a miss fits on demand
+    precomputed = get_precomputed(ticker, model_choice, forecast_period)
+    if precomputed is not None:
+        print(f"📦 Forecast {ticker}/{model_choice}/{forecast_period}d from batch run")
+        summary = answer_financial_query(company_name, user_question)
+        df, forecast, _ = precomputed
+        model_used = model_choice
+    else:
+        # The fit runs in the engine's process pool while the summary is generated
+        pending = get_forecast_engine().forecast_async(ticker, model_choice, forecast_period)
+        summary = answer_financial_query(company_name, user_question)
+        if not pending.done():
+            yield summary, None, f"⏳ {model_choice} forecast for {ticker} is being computed..."
+        try:
+            df, forecast, model_used = _await_forecast(pending, ticker, model_choice, forecast_period)
+        except Exception as e:
+            reported = extract_time_series_from_docs(None, company_name)
+            plot = create_reported_metric_plot(reported, company_name) if reported is not None else None
+            yield summary, plot, f"❌ Forecast for {ticker} failed with Prophet and ARIMA: {e}"
+            return
+
+    plot = create_stock_forecast_plot(df, forecast, company_name)
+    note = f"ℹ️ {model_choice} failed, forecast made with {model_used}.\n\n" if model_used != model_choice else ""
+    yield summary, plot, f"{note}⏳ Generating the forecast explanation..."
+    explanation = generate_custom_forecast_explanation(company_name, forecast, explanation_prompt, forecast_period)
+    yield summary, plot, note + explanation
+
+
+# Gradio Interface
+iface = gr.Interface(
+    fn=analyze_and_forecast_stock,
+    inputs=[
+        gr.Textbox(label="Company Name", placeholder="e.g., Microsoft, Google, Nvidia"),
+        gr.Textbox(label="Financial Query", placeholder="e.g., Analyze Microsoft’s stock performance over the past year and forecast its performance next quarter."),
+        gr.Textbox(label="Forecast Explanation Prompt", placeholder="e.g., Explain this forecast focusing on market risks and opportunities.", lines=3),
+        gr.Dropdown(choices=["Prophet", "ARIMA"], label="Forecasting Model", value="Prophet")
+    ],
+    outputs=[
+        gr.Textbox(label="Financial Summary and Insights"),
+        gr.Plot(label="Stock Price Forecast"),
+        gr.Textbox(label="Forecast Explanation")
+    ],
+    title="📈 Financial Analytics & Forecasting (Prophet & ARIMA)",
+    description="Conduct advanced market analytics, generate forecasts with Prophet or ARIMA, visualize trends, and receive AI-generated narrative insights."
+)
+
+if __name__ == "__main__":
+    iface.launch()
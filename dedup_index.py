@@ -0,0 +1,278 @@
+# dedup_index.py
+#
+# Near-duplicate detection for ingested chunks. 10-Qs repeat risk factors, legal
+# proceedings and forward-looking-statement boilerplate almost verbatim from quarter to
+# quarter; storing each copy costs embedding time, collection size and search time, and
+# fills the prompt context with the same paragraph several times.
+#
+# Every chunk gets a MinHash signature over its word 5-gram shingles. Signatures are split
+# into LSH bands, so candidates are found with a few dict lookups; a candidate counts as a
+# duplicate when the estimated Jaccard similarity reaches DEDUP_THRESHOLD. Matching is
+# scoped to one company and fiscal year (the <company>/<year> folder), so every file that
+# references a chunk shares its company and year metadata and the company / year
+# pre-filter sees shared chunks. Boilerplate repeated across years is stored once per year.
+#
+# A duplicate is not stored again: the existing chunk gains a reference to the new file,
+# and its metadata carries all of them in "sources" (manifest keys joined by ";",
+# e.g. "Apple/2023/10-Q-2023-apple.pdf;Apple/2023/10-Q2-2023-apple.pdf"). source stays
+# the file of the first reference, so a form / quarter filter only matches a shared chunk
+# through that file.
+#
+# New chunks stay pending until the BatchWriter has written them (the index is one of its
+# listeners); a failed batch discards them, so a retried file is not matched against
+# chunks that never reached the collection.
+
+import os
+import pickle
+import re
+import threading
+import zlib
+
+import numpy as np
+
+DEDUP_ENABLED = os.getenv("INGEST_DEDUP", "1") != "0"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+INDEX_FILE = "dedup_index.pkl"
+INDEX_VERSION = 2
+
+NUM_PERM = 128
+BANDS = 16                   # 16 bands x 8 rows: ~99% recall at Jaccard 0.85, few candidates below 0.6
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+SOURCES_SEPARATOR = ";"
+_PRIME = (1 << 31) - 1
+_MAX_HASH = np.uint64(_PRIME)
+_WORD_RE = re.compile(r"\w+")
+
+_rng = np.random.RandomState(1)   # fixed permutations: signatures must be stable across runs
+_PERM_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.uint64)
+
+
+def shingles(text):
+    """Hashes of the word 5-grams of `text` (of the whole text if it is shorter)."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) % _PRIME for g in grams), dtype=np.uint64)
+
+
+def minhash(text):
+    """MinHash signature (NUM_PERM uint32 values) of the shingle set of `text`."""
+    values = shingles(text)
+    if not len(values):
+        return np.full(NUM_PERM, _PRIME, dtype=np.uint32)
+    # (a * x + b) mod p for every permutation and shingle; a, x < 2^31 so nothing overflows
+    hashed = (np.outer(values, _PERM_A) + _PERM_B) % _MAX_HASH
+    return hashed.min(axis=0).astype(np.uint32)
+
+
+def key_metadata(key):
+    """Chunk metadata (source, company, year) for a manifest key "<company>/<year>/<file>"."""
+    company, year, file = (key.split("/", 2) + ["", ""])[:3]
+    return {"source": file, "company": company, "year": year}
+
+
+def _scope(key):
+    metadata = key_metadata(key)
+    return metadata["company"], metadata["year"]
+
+
+def source_refs(metadata):
+    """
+    Every filing a stored chunk stands for, as key_metadata() dicts.
+
+    Chunks stored before deduplication (no "sources") stand for their own source only.
+    """
+    sources = metadata.get("sources")
+    if not sources:
+        return [{k: metadata.get(k, "") for k in ("source", "company", "year")}]
+    return [key_metadata(key) for key in sources.split(SOURCES_SEPARATOR) if key]
+
+
+class DedupIndex:
+    def __init__(self, path=None, threshold=DEDUP_THRESHOLD):
+        """
+        Args:
+            path (str): Pickle file the index is saved to.
+            threshold (float): Estimated Jaccard similarity from which chunks are duplicates.
+        """
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.signatures = {}      # chunk id -> uint32 signature
+        self.scope = {}           # chunk id -> (company, year) (LSH scope)
+        self.refs = {}            # chunk id -> manifest keys of the files containing it
+        self.buckets = {}         # (company, year, band, band bytes) -> [chunk ids]
+        self.dirty = set()        # chunk ids whose refs changed since pop_dirty()
+        self.pending = set()      # chunk ids assigned but not written yet
+
+    def __len__(self):
+        return len(self.signatures) - len(self.pending)
+
+    def _bands(self, signature):
+        return [(band, signature[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+    def _insert(self, chunk_id, signature, scope, refs):
+        self.signatures[chunk_id] = signature
+        self.scope[chunk_id] = scope
+        self.refs[chunk_id] = list(refs)
+        for band, value in self._bands(signature):
+            self.buckets.setdefault(scope + (band, value), []).append(chunk_id)
+
+    def find(self, signature, scope):
+        """Most similar chunk of `scope` ((company, year)) at or above the threshold, or None."""
+        with self._lock:
+            candidates = set()
+            for band, value in self._bands(signature):
+                candidates.update(self.buckets.get(scope + (band, value), ()))
+            best, best_score = None, self.threshold
+            for chunk_id in candidates:
+                score = float(np.mean(self.signatures[chunk_id] == signature))
+                if score >= best_score:
+                    best, best_score = chunk_id, score
+            return best
+
+    def assign(self, text, key, make_id):
+        """
+        Id under which the chunk `text` of file `key` is stored.
+
+        A new chunk is pending until add() reports it written, or discard() drops it.
+
+        Returns:
+            tuple: (chunk id, True if the chunk is new and has to be written)
+        """
+        scope = _scope(key)
+        signature = minhash(text)
+        with self._lock:
+            match = self.find(signature, scope)
+            if match is None:
+                chunk_id = make_id(text)
+                if chunk_id in self.signatures and self.scope[chunk_id] != scope:
+                    # Identical text of another company / year is stored under its own id
+                    chunk_id = make_id("/".join(scope) + "\n" + text)
+                if chunk_id not in self.signatures:
+                    self._insert(chunk_id, signature, scope, [key])
+                    self.pending.add(chunk_id)
+                    return chunk_id, True
+                match = chunk_id
+            if key not in self.refs[match]:
+                self.refs[match].append(key)
+                self.dirty.add(match)
+            return match, False
+
+    def add(self, ids, documents, metadatas):
+        """BatchWriter listener: the chunks `ids` were written, commit their signatures."""
+        with self._lock:
+            self.pending.difference_update(ids)
+
+    def discard(self, ids):
+        """BatchWriter listener: the write of `ids` failed, forget those still pending."""
+        with self._lock:
+            self.remove([chunk_id for chunk_id in ids if chunk_id in self.pending])
+
+    def discard_pending(self):
+        """Forget every chunk that was assigned but never written (e.g. an aborted run)."""
+        with self._lock:
+            self.remove(list(self.pending))
+
+    def metadata(self, chunk_id):
+        """Collection metadata: first reference as source / company / year, all in "sources"."""
+        with self._lock:
+            refs = self.refs[chunk_id]
+            return dict(key_metadata(refs[0]), sources=SOURCES_SEPARATOR.join(refs))
+
+    def remove_refs(self, keys):
+        """
+        Drop the references of files that changed or were deleted.
+
+        Returns:
+            list: Ids still referenced by other files whose metadata must be rewritten.
+        """
+        keys = set(keys)
+        changed = []
+        with self._lock:
+            for chunk_id, refs in self.refs.items():
+                if keys.intersection(refs):
+                    refs[:] = [key for key in refs if key not in keys]
+                    if refs:
+                        changed.append(chunk_id)
+        return changed
+
+    def remove(self, ids):
+        """Forget chunks that were deleted from the collection."""
+        with self._lock:
+            for chunk_id in ids:
+                signature = self.signatures.pop(chunk_id, None)
+                if signature is None:
+                    continue
+                scope = self.scope.pop(chunk_id)
+                self.refs.pop(chunk_id, None)
+                self.dirty.discard(chunk_id)
+                self.pending.discard(chunk_id)
+                for band, value in self._bands(signature):
+                    bucket = self.buckets.get(scope + (band, value))
+                    if bucket is not None and chunk_id in bucket:
+                        bucket.remove(chunk_id)
+                        if not bucket:
+                            del self.buckets[scope + (band, value)]
+
+    def pop_dirty(self):
+        """Ids that gained references since the last call (their "sources" need an update)."""
+        with self._lock:
+            dirty, self.dirty = self.dirty, set()
+            return sorted(chunk_id for chunk_id in dirty if chunk_id in self.refs)
+
+    def rebuild_from_collection(self, collection, page_size=5000):
+        """(Re)build the index from every chunk stored in a Chroma collection."""
+        with self._lock:
+            self._reset()
+            offset = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    metadata = metadata or {}
+                    refs = metadata.get("sources", "").split(SOURCES_SEPARATOR) if metadata.get("sources") else \
+                        ["/".join(str(metadata.get(k, "")) for k in ("company", "year", "source"))]
+                    self._insert(chunk_id, minhash(text), _scope(refs[0]), refs)
+                offset += len(page["ids"])
+
+    def save(self, path=None):
+        path = path or self.path
+        with self._lock:
+            ids = [chunk_id for chunk_id in self.signatures if chunk_id not in self.pending]
+            state = {
+                "version": INDEX_VERSION,
+                "threshold": self.threshold,
+                "ids": ids,
+                "signatures": np.stack([self.signatures[i] for i in ids]) if ids else np.zeros((0, NUM_PERM), np.uint32),
+                "scope": [self.scope[i] for i in ids],
+                "refs": [self.refs[i] for i in ids],
+            }
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, threshold=DEDUP_THRESHOLD):
+        """Load the index from `path`; returns an empty index bound to `path` if missing or outdated."""
+        index = cls(path, threshold)
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return index
+        if state.get("version") != INDEX_VERSION:
+            return index
+        for chunk_id, signature, scope, refs in zip(state["ids"], state["signatures"], state["scope"], state["refs"]):
+            index._insert(chunk_id, signature, tuple(scope), refs)
+        return index
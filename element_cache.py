@@ -0,0 +1,76 @@
+# element_cache.py
+#
+# On-disk cache of partition_pdf output. partition_pdf (with table extraction) is by far
+# the most expensive ingestion step, so its elements are stored as gzip-compressed JSON
+# lines keyed by the PDF's sha256 plus the partition parameters. Changing the chunking,
+# the length filter or the embedding model then re-uses the cached elements instead of
+# parsing every filing again.
+
+import gzip
+import hashlib
+import json
+import os
+
+from unstructured.staging.base import elements_to_dicts, elements_from_dicts
+
+CACHE_FORMAT_VERSION = 1
+
+
+def _unstructured_version():
+    try:
+        from unstructured.__version__ import __version__
+        return __version__
+    except ImportError:
+        return "unknown"
+
+
+def cache_key(sha256, params):
+    """Key for one PDF + partition parameters (+ unstructured version, since its output changes between releases)."""
+    signature = json.dumps(
+        {"params": params, "unstructured": _unstructured_version(), "format": CACHE_FORMAT_VERSION},
+        sort_keys=True,
+    )
+    return f"{sha256}-{hashlib.md5(signature.encode()).hexdigest()[:12]}"
+
+
+def cache_path(cache_dir, key):
+    # Two-character fan-out keeps directory listings small
+    return os.path.join(cache_dir, key[:2], key + ".jsonl.gz")
+
+
+def load_elements(cache_dir, key):
+    """Return the cached elements for `key`, or None on a miss or unreadable entry."""
+    path = cache_path(cache_dir, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return elements_from_dicts([json.loads(line) for line in f if line.strip()])
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Ignoring broken element cache entry {path}: {e}")
+        return None
+
+
+def store_elements(cache_dir, key, elements):
+    path = cache_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+        for element in elements_to_dicts(elements):
+            f.write(json.dumps(element, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+    os.replace(tmp, path)
+
+
+def prune(cache_dir, keep_keys):
+    """Delete cache entries that are not in `keep_keys`. Returns the number of files removed."""
+    keep = {key + ".jsonl.gz" for key in keep_keys}
+    removed = 0
+    if not os.path.isdir(cache_dir):
+        return removed
+    for root, _, files in os.walk(cache_dir):
+        for file in files:
+            if file.endswith(".jsonl.gz") and file not in keep:
+                os.remove(os.path.join(root, file))
+                removed += 1
+    return removed
@@ -0,0 +1,156 @@
+# embedding_service.py
+#
+# One SentenceTransformer per process. RAGAgent, its Chroma collection, the query path
+# and the ingestion BatchWriter all embed through the same EmbeddingService instead of
+# loading all-MiniLM-L6-v2 once per consumer.
+
+import os
+import threading
+import time
+
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+from instrumentation import observe
+
+DEFAULT_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+DEFAULT_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+DEFAULT_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = leave torch's default
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+
+def _rss_bytes():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class EmbeddingService:
+    def __init__(self, model_name=DEFAULT_MODEL, device=DEFAULT_DEVICE, threads=DEFAULT_THREADS,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.model_name = model_name
+        self.device = device
+        self.threads = threads
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+        self.load_seconds = None
+        self.param_bytes = None
+        self.rss_delta_bytes = None
+        self.texts_encoded = 0
+        self.encode_calls = 0
+        self.encode_seconds = 0.0
+
+    @property
+    def model(self):
+        """The SentenceTransformer, loaded on first access."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._load()
+        return self._model
+
+    def _load(self):
+        # Imported on first use so the module loads without sentence_transformers (e.g. hash embedder)
+        from sentence_transformers import SentenceTransformer
+
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        model = SentenceTransformer(self.model_name, device=self.device)
+        self.load_seconds = time.perf_counter() - start
+        rss_after = _rss_bytes()
+
+        self.param_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        if rss_before is not None and rss_after is not None:
+            self.rss_delta_bytes = rss_after - rss_before
+        self._model = model
+        print(f"🧠 Loaded embedding model {self.model_name} on {self.device} "
+              f"in {self.load_seconds:.2f}s ({self.param_bytes / 2**20:.1f} MiB of weights)")
+
+    def encode(self, texts, batch_size=None, normalize=False, **kwargs):
+        """
+        Embed `texts` in batches.
+
+        Returns:
+            list[list[float]]: One embedding per input text.
+        """
+        if not texts:
+            return []
+        model = self.model
+        start = time.perf_counter()
+        embeddings = model.encode(
+            list(texts),
+            batch_size=batch_size or self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=normalize,
+            show_progress_bar=False,
+        ).tolist()
+        seconds = time.perf_counter() - start
+        self.encode_seconds += seconds
+        observe("embedding.encode", seconds)
+        self.encode_calls += 1
+        self.texts_encoded += len(embeddings)
+        return embeddings
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "device": self.device,
+            "threads": self.threads,
+            "loaded": self._model is not None,
+            "load_seconds": self.load_seconds,
+            "param_bytes": self.param_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "encode_calls": self.encode_calls,
+            "texts_encoded": self.texts_encoded,
+            "encode_seconds": round(self.encode_seconds, 3),
+        }
+
+    def report(self):
+        s = self.stats()
+        if not s["loaded"]:
+            return f"🧠 {s['model']}: not loaded"
+        rss = f", RSS +{s['rss_delta_bytes'] / 2**20:.1f} MiB" if s["rss_delta_bytes"] is not None else ""
+        return (f"🧠 {s['model']} on {s['device']}: load {s['load_seconds']:.2f}s, "
+                f"weights {s['param_bytes'] / 2**20:.1f} MiB{rss}, "
+                f"{s['texts_encoded']} texts in {s['encode_calls']} calls ({s['encode_seconds']:.1f}s)")
+
+
+class SharedEmbeddingFunction(SentenceTransformerEmbeddingFunction):
+    """
+    Chroma embedding function backed by an EmbeddingService.
+
+    Subclasses SentenceTransformerEmbeddingFunction so existing `sec_filings` collections keep
+    their embedding function config, but never loads a model of its own.
+    """
+
+    def __init__(self, service):
+        # The parent __init__ would import sentence_transformers and load a model of its own;
+        # only the attributes behind get_config() are needed, the model stays with the service
+        self.model_name = service.model_name
+        self.device = service.device
+        self.normalize_embeddings = False
+        self.kwargs = {}
+        self.service = service
+
+    def __call__(self, input):
+        return self.service.encode(list(input))
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_embedding_service(model_name=DEFAULT_MODEL, device=DEFAULT_DEVICE):
+    """Process-wide EmbeddingService for (model_name, device)."""
+    key = (model_name, device)
+    with _services_lock:
+        if key not in _services:
+            _services[key] = EmbeddingService(model_name=model_name, device=device)
+        return _services[key]
@@ -0,0 +1,304 @@
+# forecast_engine.py
+#
+# Forecasting engine behind data_Sceince_agent: real daily closes from yfinance instead of
+# synthetic data, and fitted Prophet / ARIMA models cached per (ticker, model type) together
+# with the fingerprint of the series they were fitted on.
+#
+# - same series again            -> cached forecast, no fit at all
+# - series extended by new days  -> incremental update (ARIMA: model.update with the new
+#                                   points; Prophet: refit warm-started from the previous
+#                                   parameters, which converges in a fraction of the time)
+# - anything else                -> full fit
+#
+# Fits run in a process pool, so neither the Gradio worker thread nor the GIL is tied up by
+# Stan / statsmodels. Models are persisted under persist_store/forecast_models.
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import observe
+from query_filters import extract_query_filters
+from ttl_cache import ttl_cached, DISK_DIR as CACHE_DIR
+
+MODEL_TYPES = ("Prophet", "ARIMA")
+FORECAST_CACHE_DIR = os.getenv("FORECAST_CACHE_DIR", os.path.join("persist_store", "forecast_models"))
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", "2"))
+# Fixed start, so a newer download only appends points and the fit can be incremental
+HISTORY_START = os.getenv("FORECAST_HISTORY_START", "2020-01-01")
+HISTORY_TTL = float(os.getenv("FORECAST_HISTORY_TTL", "3600"))
+FORECAST_CACHE_SIZE = 64
+
+_pool = None
+_pool_lock = threading.Lock()
+# Waits on the process pool on behalf of callers that want a Future (see forecast_async)
+_waiters = ThreadPoolExecutor(max_workers=4, thread_name_prefix="forecast")
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=FORECAST_WORKERS)
+        return _pool
+
+
+def resolve_ticker(company_name):
+    """Ticker for a company name, alias or ticker ("Alphabet" -> "GOOG"); None if unknown."""
+    from web_agent import COMPANIES
+    text = company_name.lower().strip()
+    for name, ticker in COMPANIES.items():
+        if name in text or ticker.lower() == text:
+            return ticker
+    for folder in extract_query_filters(company_name)["companies"]:
+        name = "google" if folder == "Goolge" else folder.lower()
+        if name in COMPANIES:
+            return COMPANIES[name]
+    return None
+
+
+@ttl_cached("price_history", HISTORY_TTL, max_entries=32, disk_dir=CACHE_DIR,
+            should_cache=lambda df: df is not None and not df.empty)
+def load_price_history(ticker, start=HISTORY_START):
+    """
+    Daily closing prices of `ticker` since `start`.
+
+    Returns:
+        pd.DataFrame: Columns "ds" (tz-naive date) and "y" (close); empty if yfinance has no data.
+    """
+    import yfinance as yf
+    hist = yf.Ticker(ticker).history(start=start, auto_adjust=True)
+    if hist.empty:
+        return pd.DataFrame({"ds": pd.Series(dtype="datetime64[ns]"), "y": pd.Series(dtype=float)})
+    index = hist.index.tz_localize(None) if hist.index.tz is not None else hist.index
+    return pd.DataFrame({"ds": index.normalize(), "y": hist["Close"].astype(float).values}).reset_index(drop=True)
+
+
+def fingerprint(df):
+    """Content hash of a ds / y series."""
+    digest = hashlib.sha1()
+    digest.update(pd.to_datetime(df["ds"]).values.astype("datetime64[ns]").tobytes())
+    digest.update(np.asarray(df["y"], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def _future_dates(last_ds, horizon):
+    return pd.bdate_range(start=pd.Timestamp(last_ds) + pd.Timedelta(days=1), periods=horizon)
+
+
+def _prophet_init(model):
+    # Warm start from a fitted model's parameters (Prophet docs, "Updating fitted models")
+    init = {name: model.params[name][0][0] for name in ("k", "m", "sigma_obs")}
+    init.update({name: model.params[name][0] for name in ("delta", "beta")})
+    return init
+
+
+def _fit_prophet(df, horizon, previous=None, new_points=None):
+    from prophet import Prophet
+    from prophet.serialize import model_from_json, model_to_json
+
+    if previous is not None and new_points is not None and not len(new_points):
+        model = model_from_json(previous)   # fitted on exactly this series
+    else:
+        # Daily closes: weekly + yearly seasonality, no intra-day component
+        model = Prophet(daily_seasonality=False)
+        if previous is not None:
+            model.fit(df, init=_prophet_init(model_from_json(previous)))
+        else:
+            model.fit(df)
+    future = pd.DataFrame({"ds": _future_dates(df["ds"].iloc[-1], horizon)})
+    forecast = model.predict(future)[["ds", "yhat", "yhat_lower", "yhat_upper"]]
+    return model_to_json(model), forecast
+
+
+def _fit_arima(df, horizon, previous=None, new_points=None):
+    if previous is not None and new_points is not None:
+        model = pickle.loads(previous)
+        if len(new_points):
+            model.update(new_points)
+    else:
+        import pmdarima as pm
+        model = pm.auto_arima(df["y"].values, seasonal=False, stepwise=True, suppress_warnings=True)
+    values, interval = model.predict(n_periods=horizon, return_conf_int=True)
+    forecast = pd.DataFrame({
+        "ds": _future_dates(df["ds"].iloc[-1], horizon),
+        "yhat": np.asarray(values),
+        "yhat_lower": interval[:, 0],
+        "yhat_upper": interval[:, 1],
+    })
+    return pickle.dumps(model), forecast
+
+
+def fit_forecast(model_type, df, horizon, previous=None, new_points=None):
+    """
+    Process-pool worker: fit (or update) one model and forecast `horizon` business days.
+
+    Args:
+        model_type (str): "Prophet" or "ARIMA".
+        df (pd.DataFrame): Full ds / y history.
+        horizon (int): Business days to forecast.
+        previous: Serialized model fitted on a prefix of `df`, if any.
+        new_points (np.ndarray): Values appended since `previous` was fitted; empty when
+            `previous` was fitted on `df` itself (predict only).
+
+    Returns:
+        tuple: (serialized model, forecast DataFrame with ds / yhat / yhat_lower / yhat_upper,
+                fit seconds)
+    """
+    start = time.perf_counter()
+    if model_type == "Prophet":
+        blob, forecast = _fit_prophet(df, horizon, previous, new_points)
+    elif model_type == "ARIMA":
+        blob, forecast = _fit_arima(df, horizon, previous, new_points)
+    else:
+        raise ValueError(f"Unsupported model type: {model_type}")
+    return blob, forecast, time.perf_counter() - start
+
+
+class ForecastEngine:
+    def __init__(self, cache_dir=FORECAST_CACHE_DIR):
+        """
+        Args:
+            cache_dir (str): Directory for the fitted models; None keeps them in memory only.
+        """
+        self.cache_dir = cache_dir
+        self._models = {}                 # (ticker, model_type) -> entry
+        self._forecasts = OrderedDict()   # (ticker, model_type, horizon, fingerprint) -> DataFrame
+        self._lock = threading.Lock()
+        self.stats = {"forecast_hits": 0, "model_hits": 0, "full_fits": 0, "incremental_fits": 0, "fit_seconds": 0.0}
+
+    # -- model cache ------------------------------------------------------------------
+
+    def _model_path(self, ticker, model_type):
+        return os.path.join(self.cache_dir, f"{ticker}-{model_type.lower()}.pkl")
+
+    def _load_entry(self, ticker, model_type):
+        key = (ticker, model_type)
+        with self._lock:
+            if key in self._models:
+                return self._models[key]
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._model_path(ticker, model_type), "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        with self._lock:
+            self._models[key] = entry
+        return entry
+
+    def _store_entry(self, ticker, model_type, entry):
+        with self._lock:
+            self._models[(ticker, model_type)] = entry
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._model_path(ticker, model_type)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def _remember_forecast(self, key, forecast):
+        with self._lock:
+            self._forecasts[key] = forecast
+            self._forecasts.move_to_end(key)
+            while len(self._forecasts) > FORECAST_CACHE_SIZE:
+                self._forecasts.popitem(last=False)
+
+    # -- public API -------------------------------------------------------------------
+
+    def forecast(self, ticker, model_type, horizon=90, df=None, timeout=None):
+        """
+        Forecast `horizon` business days of `ticker`'s close.
+
+        Args:
+            ticker (str): e.g. "AAPL".
+            model_type (str): "Prophet" or "ARIMA".
+            horizon (int): Business days to forecast.
+            df (pd.DataFrame): ds / y history; default: load_price_history(ticker).
+            timeout (float): Longest wait for the fit in the process pool.
+
+        Returns:
+            tuple: (history DataFrame, forecast DataFrame with ds / yhat / yhat_lower /
+                    yhat_upper, info dict with "source" and "fit_seconds"); source is
+                    "cache" (forecast reused), "model" (same data, new horizon),
+                    "incremental" (new points appended) or "full"
+        """
+        if model_type not in MODEL_TYPES:
+            raise ValueError(f"Unsupported model type: {model_type}")
+        df = load_price_history(ticker) if df is None else df
+        if df.empty:
+            raise ValueError(f"No price history for {ticker}")
+        df = df[["ds", "y"]].reset_index(drop=True)
+        print_key = f"{ticker}/{model_type}/{horizon}d"
+
+        fp = fingerprint(df)
+        key = (ticker, model_type, horizon, fp)
+        with self._lock:
+            cached = self._forecasts.get(key)
+        if cached is not None:
+            self.stats["forecast_hits"] += 1
+            print(f"📦 Forecast {print_key} from cache")
+            return df, cached, {"source": "cache", "fit_seconds": 0.0}
+
+        previous, new_points, source = None, None, "full"
+        entry = self._load_entry(ticker, model_type)
+        if entry is not None and entry["fingerprint"] == fp:
+            # Same data, other horizon: Prophet/ARIMA still have to predict, but from the
+            # previous state (an ARIMA update with no points is a plain predict)
+            previous, new_points, source = entry["model"], np.empty(0), "model"
+        elif entry is not None and len(df) > entry["n_points"] and fingerprint(df.iloc[:entry["n_points"]]) == entry["fingerprint"]:
+            previous, new_points, source = entry["model"], df["y"].values[entry["n_points"]:], "incremental"
+
+        future = _get_pool().submit(fit_forecast, model_type, df, horizon, previous, new_points)
+        blob, forecast, seconds = future.result(timeout=timeout)
+
+        self._store_entry(ticker, model_type, {
+            "fingerprint": fp, "n_points": len(df), "model": blob, "fitted_at": time.time(),
+        })
+        self._remember_forecast(key, forecast)
+        self.stats[{"model": "model_hits", "incremental": "incremental_fits", "full": "full_fits"}[source]] += 1
+        self.stats["fit_seconds"] += seconds
+        observe("forecast.fit", seconds, model=model_type, source=source)
+        print(f"📈 Forecast {print_key}: {source} in {seconds:.2f}s ({len(df)} points)")
+        return df, forecast, {"source": source, "fit_seconds": seconds}
+
+    def forecast_async(self, ticker, model_type, horizon=90, df=None):
+        """forecast() without blocking the caller; returns a concurrent.futures.Future."""
+        return _waiters.submit(self.forecast, ticker, model_type, horizon, df)
+
+    def seed(self, ticker, model_type, df, blob, forecast, horizons):
+        """
+        Adopt a model fitted elsewhere (batch_forecast) on `df`.
+
+        Args:
+            forecast (pd.DataFrame): Its forecast for max(horizons); shorter horizons are prefixes.
+        """
+        df = df[["ds", "y"]].reset_index(drop=True)
+        fp = fingerprint(df)
+        self._store_entry(ticker, model_type, {
+            "fingerprint": fp, "n_points": len(df), "model": blob, "fitted_at": time.time(),
+        })
+        for horizon in horizons:
+            self._remember_forecast((ticker, model_type, horizon, fp), forecast.iloc[:horizon].reset_index(drop=True))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_forecast_engine():
+    """Process-wide ForecastEngine (model cache shared by every request)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ForecastEngine()
+        return _engine
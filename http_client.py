@@ -0,0 +1,166 @@
+# http_client.py
+#
+# Shared HTTP layer for every outbound call of the web agent:
+#
+# - one requests.Session with per-host connection pools (keep-alive, no TLS handshake per call)
+# - default timeouts
+# - retries with exponential backoff + jitter on connection errors and 429/5xx,
+#   honoring Retry-After
+# - client-side token-bucket rate limiters per provider (Alpha Vantage 5/min,
+#   NewsAPI daily quota, ...)
+#
+# Provider URLs can be overridden through the environment (e.g. NEWSAPI_URL), so the
+# helpers in web_agent can be pointed at a local stub HTTP server.
+
+import email.utils
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = float(os.getenv("WEB_REQUEST_TIMEOUT", "5"))
+DEFAULT_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+PROVIDER_URLS = {
+    "newsapi": os.getenv("NEWSAPI_URL", "https://newsapi.org/v2/everything"),
+    "alphavantage": os.getenv("ALPHA_VANTAGE_URL", "https://www.alphavantage.co/query"),
+}
+
+# (requests per period, period in seconds) per provider
+RATE_LIMITS = {
+    "alphavantage": (int(os.getenv("ALPHA_VANTAGE_RATE_PER_MIN", "5")), 60.0),
+    "newsapi": (int(os.getenv("NEWSAPI_DAILY_QUOTA", "100")), 86400.0),
+    "scrape": (int(os.getenv("SCRAPE_RATE_PER_MIN", "30")), 60.0),
+}
+
+
+class RateLimited(requests.RequestException):
+    """The client-side rate limiter has no token available within the allowed wait."""
+
+
+class TokenBucket:
+    def __init__(self, capacity, period):
+        """`capacity` tokens, refilled continuously over `period` seconds."""
+        self.capacity = float(capacity)
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, max_wait=0.0):
+        """Take one token, waiting up to `max_wait` seconds. Returns False if none became available."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+_session = None
+_session_lock = threading.Lock()
+_buckets = {name: TokenBucket(capacity, period) for name, (capacity, period) in RATE_LIMITS.items()}
+
+
+def get_session():
+    """Process-wide requests.Session with pooled, keep-alive connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"User-Agent": "Mozilla/5.0"})
+            _session = session
+        return _session
+
+
+def _retry_after(response):
+    """Seconds to wait according to a Retry-After header, or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _backoff(attempt):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def request(method, url, provider=None, timeout=None, retries=DEFAULT_RETRIES, max_wait=None, **kwargs):
+    """
+    Send a request through the shared session.
+
+    Args:
+        method (str): HTTP method.
+        url (str): Target URL.
+        provider (str): Rate-limit bucket name (see RATE_LIMITS); None = not rate limited.
+        timeout (float): Per-attempt timeout (default: WEB_REQUEST_TIMEOUT).
+        retries (int): Extra attempts after the first one.
+        max_wait (float): Longest time to wait for a rate-limit token or a Retry-After
+            (default: the timeout).
+
+    Returns:
+        requests.Response: The last response (may still be a 429/5xx once retries are used up).
+
+    Raises:
+        RateLimited: No rate-limit token within `max_wait`.
+        requests.RequestException: Connection errors / timeouts after all retries.
+    """
+    timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+    max_wait = timeout if max_wait is None else max_wait
+    bucket = _buckets.get(provider)
+    session = get_session()
+
+    for attempt in range(retries + 1):
+        if bucket is not None and not bucket.acquire(max_wait):
+            raise RateLimited(f"Rate limit for {provider} reached")
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUS or attempt == retries:
+            return response
+
+        wait = _retry_after(response)
+        if wait is None:
+            wait = _backoff(attempt)
+        if wait > max_wait:
+            # The server asks for a longer pause than we are willing to block for
+            return response
+        response.close()
+        time.sleep(wait)
+    return response
+
+
+def http_get(url, provider=None, **kwargs):
+    return request("GET", url, provider=provider, **kwargs)
@@ -0,0 +1,162 @@
+# ingest_manifest.py
+#
+# Persistent record of what indexPDF has ingested, stored next to the Chroma data
+# (persist_store/ingest_manifest.json). Each PDF is keyed by its path relative to the
+# Dataset dir and stores size, mtime, a sha256 of the content and the chunk ids it produced.
+#
+# Unchanged files are detected with a stat() call only, so re-running indexPDF on an
+# indexed Dataset costs no model or vector store call at all.
+
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_FILE = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestPlan:
+    def __init__(self):
+        self.new = []          # IngestJob, never seen before
+        self.changed = []      # IngestJob, content differs from the manifest
+        self.unchanged = []    # IngestJob
+        self.removed = []      # manifest keys whose file is gone
+
+    @property
+    def to_ingest(self):
+        return self.new + self.changed
+
+
+class IngestManifest:
+    def __init__(self, chroma_dir, data_dir):
+        self.path = os.path.join(chroma_dir, MANIFEST_FILE)
+        self.data_dir = data_dir
+        self.files = {}
+        self.load()
+
+    def key(self, path):
+        return os.path.relpath(path, self.data_dir).replace(os.sep, "/")
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get("version") == MANIFEST_VERSION:
+            self.files = data.get("files", {})
+        else:
+            self.files = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f)
+        os.replace(tmp, self.path)
+
+    def plan(self, jobs, retry_failed=False, rebuild=False):
+        """
+        Sort discovered jobs into new / changed / unchanged and find removed files.
+
+        The content hash is only computed when size or mtime differ, and stored on the
+        job (job.sha256) so record() does not hash the file twice. Files that failed to
+        ingest are only retried once they change, or when `retry_failed` is set.
+        With `rebuild`, every known file is treated as changed (re-chunk / re-embed).
+        """
+        plan = IngestPlan()
+        seen = set()
+        for job in jobs:
+            key = self.key(job.path)
+            seen.add(key)
+            stat = os.stat(job.path)
+            job.size, job.mtime = stat.st_size, int(stat.st_mtime)
+            job.sha256 = None
+
+            entry = self.files.get(key)
+            if entry is None:
+                plan.new.append(job)
+                continue
+            if rebuild or (retry_failed and entry.get("error")):
+                # A failed file may own partially written chunks: treat it as changed
+                plan.changed.append(job)
+                continue
+            if entry["size"] == job.size and entry["mtime"] == job.mtime:
+                plan.unchanged.append(job)
+                continue
+
+            job.sha256 = file_sha256(job.path)
+            if entry["sha256"] == job.sha256:
+                # Touched but identical: refresh the stat fields, keep the chunks
+                entry["mtime"] = job.mtime
+                entry["size"] = job.size
+                plan.unchanged.append(job)
+            else:
+                plan.changed.append(job)
+
+        plan.removed = [key for key in self.files if key not in seen]
+        return plan
+
+    def stale_chunk_ids(self, keys):
+        """
+        Chunk ids owned by `keys` that no other manifest entry still references.
+        Identical chunk texts share one id, so they must survive while any file uses them.
+        """
+        keys = set(keys)
+        owned = set()
+        for key in keys:
+            owned.update(self.files.get(key, {}).get("chunk_ids", []))
+        for key, entry in self.files.items():
+            if key not in keys:
+                owned.difference_update(entry.get("chunk_ids", []))
+        return sorted(owned)
+
+    def forget(self, keys):
+        for key in keys:
+            self.files.pop(key, None)
+
+    def record(self, job, chunk_ids):
+        self.files[self.key(job.path)] = {
+            "size": job.size,
+            "mtime": job.mtime,
+            "sha256": job.sha256 or file_sha256(job.path),
+            "chunk_ids": list(chunk_ids),
+            "indexed_at": int(time.time()),
+        }
+
+    def record_failure(self, job, error):
+        """
+        Mark a file as failed. The chunk ids it got so far are kept: a partially written
+        file owns chunks in the collection, which are deleted when it is retried or changes.
+        """
+        self.files[self.key(job.path)] = {
+            "size": job.size,
+            "mtime": job.mtime,
+            "sha256": job.sha256 or file_sha256(job.path),
+            "chunk_ids": list(job.chunk_ids),
+            "error": str(error),
+            "indexed_at": int(time.time()),
+        }
+
+    def has_changes(self, jobs):
+        """Stat-only check used on the warm path: any new, modified or deleted PDF?"""
+        seen = set()
+        for job in jobs:
+            key = self.key(job.path)
+            seen.add(key)
+            entry = self.files.get(key)
+            if entry is None:
+                return True
+            stat = os.stat(job.path)
+            if entry["size"] != stat.st_size or entry["mtime"] != int(stat.st_mtime):
+                return True
+        return seen != set(self.files)
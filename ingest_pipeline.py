@@ -0,0 +1,359 @@
+# ingest_pipeline.py
+#
+# Staged ingestion pipeline for the SEC filings in Dataset/:
+#
+#   discover -> parse (process pool) -> chunk (+ table metrics) -> dedup -> embed -> write
+#
+# Embedding and writing are batched across files by batch_writer.BatchWriter. The dedup
+# step (dedup_index.DedupIndex) drops near-duplicates of chunks that are already stored.
+#
+# Stages are connected by bounded queues so a slow stage applies backpressure instead
+# of buffering the whole corpus in memory. Files leave the pipeline in discovery order,
+# so the collection ends up with the same contents as the old sequential loop.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_writer import BatchWriter, DEFAULT_BATCH_SIZE, DEFAULT_ENCODE_BATCH_SIZE
+from element_cache import cache_key, load_elements, store_elements
+from ingest_manifest import file_sha256
+from metrics_store import extract_metrics
+from instrumentation import observe
+
+MIN_CHUNK_CHARS = 30
+PARTITION_PARAMS = {"extract_tables": True, "strategy": "auto"}
+DEFAULT_WORKERS = int(os.getenv("INGEST_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+
+_DONE = object()
+
+
+class IngestJob:
+    def __init__(self, company, year, file, path):
+        self.company = company
+        self.year = year
+        self.file = file
+        self.path = path
+        self.elements = None
+        self.chunks = []
+        self.chunk_ids = []
+        self.metrics = []      # rows for metrics_store, from the table elements
+        # Filled in by ingest_manifest.IngestManifest.plan()
+        self.size = None
+        self.mtime = None
+        self.sha256 = None
+
+
+class IngestStats:
+    def __init__(self):
+        self.files_discovered = 0
+        self.files_skipped = 0
+        self.files_indexed = 0
+        self.files_failed = []
+        self.indexed_jobs = []
+        self.cache_hits = 0
+        self.chunks = 0
+        self.duplicates = 0
+        self.metrics = 0
+        self.stage_seconds = {"parse": 0.0, "chunk": 0.0, "dedup": 0.0, "embed": 0.0, "write": 0.0}
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def fail(self, job, stage, error):
+        print(f"❌ {stage} failed for {job.path}: {error}")
+        self.files_failed.append((job.path, stage, str(error)))
+
+    def report(self):
+        elapsed = self.elapsed or (time.perf_counter() - self.started)
+        files_per_min = self.files_indexed / elapsed * 60 if elapsed else 0.0
+        chunks_per_s = self.chunks / elapsed if elapsed else 0.0
+        lines = [
+            "📊 Ingestion report",
+            f"  files: {self.files_indexed} indexed, {self.files_skipped} skipped, "
+            f"{len(self.files_failed)} failed (of {self.files_discovered} discovered)",
+            f"  chunks: {self.chunks} written, {self.duplicates} near-duplicates stored once",
+            f"  financial metrics: {self.metrics} rows",
+            f"  element cache hits: {self.cache_hits}",
+            f"  wall time: {elapsed:.1f}s",
+            f"  throughput: {files_per_min:.1f} files/min, {chunks_per_s:.1f} chunks/s",
+            "  stage time: " + ", ".join(f"{k}={v:.1f}s" for k, v in self.stage_seconds.items()),
+        ]
+        return "\n".join(lines)
+
+
+def discover(data_dir):
+    """Yield an IngestJob for every Dataset/<company>/<year>/*.pdf, in a stable order."""
+    for company in sorted(os.listdir(data_dir)):
+        company_path = os.path.join(data_dir, company)
+        if not os.path.isdir(company_path):
+            continue
+
+        for year in sorted(os.listdir(company_path)):
+            year_path = os.path.join(company_path, year)
+            if not os.path.isdir(year_path):
+                continue
+
+            for file in sorted(os.listdir(year_path)):
+                if file.lower().endswith(".pdf"):
+                    yield IngestJob(company, year, file, os.path.join(year_path, file))
+
+
+def _partition(path):
+    # Imported here: partition_pdf pulls in the PDF/OCR stack (pi_heif, pdfminer, ...),
+    # which element-cache hits and the hash-embedder benchmark never need
+    from unstructured.partition.pdf import partition_pdf
+    return partition_pdf(filename=path, **PARTITION_PARAMS)
+
+
+def parse_pdf(path, cache_dir=None, sha256=None):
+    """
+    Process-pool worker: parse one PDF into unstructured elements.
+
+    With a `cache_dir`, elements are loaded from / stored in the element cache.
+
+    Returns:
+        tuple: (elements, sha256 of the file or None, True on a cache hit)
+    """
+    if cache_dir is None:
+        return _partition(path), sha256, False
+
+    sha256 = sha256 or file_sha256(path)
+    key = cache_key(sha256, PARTITION_PARAMS)
+    elements = load_elements(cache_dir, key)
+    if elements is not None:
+        return elements, sha256, True
+
+    elements = _partition(path)
+    try:
+        store_elements(cache_dir, key, elements)
+    except Exception as e:
+        print(f"⚠️ Could not cache elements of {path}: {e}")
+    return elements, sha256, False
+
+
+def chunk_elements(elements, file=""):
+    """Chunk parsed elements by title and return the chunk texts worth indexing."""
+    from unstructured.chunking.title import chunk_by_title
+    from unstructured.documents.elements import CompositeElement
+
+    texts = []
+    for chunk in chunk_by_title(elements):
+        try:
+            if isinstance(chunk, CompositeElement):
+                chunk_text = chunk.text
+            else:
+                chunk_text = "\n\n".join(
+                    el.text for el in chunk
+                    if hasattr(el, 'text') and el.text and len(el.text) > MIN_CHUNK_CHARS
+                )
+
+            if chunk_text and len(chunk_text) > MIN_CHUNK_CHARS:
+                texts.append(chunk_text)
+        except Exception as e:
+            print(f"⚠️ Failed to process a chunk in {file}: {e}")
+    return texts
+
+
+def _stage(name, stats, inbox, outbox, work, stop=None):
+    """Run `work(job)` for every job in `inbox`, isolating failures per file; drops jobs once `stop` is set."""
+    while True:
+        job = inbox.get()
+        if job is _DONE:
+            outbox.put(_DONE)
+            return
+        if stop is not None and stop.is_set():
+            continue
+        start = time.perf_counter()
+        try:
+            work(job)
+        except Exception as e:
+            stats.fail(job, name, e)
+            continue
+        finally:
+            seconds = time.perf_counter() - start
+            stats.stage_seconds[name] += seconds
+            observe("ingest.stage", seconds, stage=name)
+        outbox.put(job)
+
+
+def run_ingestion(collection, data_dir, model, make_id, jobs=None,
+                  workers=None, queue_size=None, batch_size=DEFAULT_BATCH_SIZE,
+                  encode_batch_size=DEFAULT_ENCODE_BATCH_SIZE, flush_on_file_end=False,
+                  cache_dir=None, listeners=(), dedup=None):
+    """
+    Ingest every PDF under `data_dir` into `collection`.
+
+    Args:
+        collection: Chroma collection to write to.
+        data_dir (str): Dataset root (<company>/<year>/*.pdf).
+        model: EmbeddingService used to embed the chunks.
+        make_id (callable): chunk text -> chunk id.
+        jobs (iterable): IngestJobs to ingest; defaults to everything discover() finds.
+        workers (int): Number of parser processes.
+        queue_size (int): Capacity of each inter-stage queue.
+        batch_size (int): Chunks per bulk embed + write (see BatchWriter).
+        encode_batch_size (int): Batch size for SentenceTransformer.encode.
+        flush_on_file_end (bool): Flush the batch writer after every file.
+        cache_dir (str): Element cache directory; None parses every PDF from scratch.
+        listeners: Passed to the BatchWriter, notified of every written batch.
+        dedup (DedupIndex): Near-duplicate index; chunks it already knows are not written
+            again, only referenced (see dedup_index). None writes every chunk.
+
+    Returns:
+        IngestStats: Counters and timings for the run.
+    """
+    workers = workers or DEFAULT_WORKERS
+    queue_size = queue_size or workers * 2
+    stats = IngestStats()
+    # The dedup index commits new signatures once their batch is written
+    writer = BatchWriter(collection, model, batch_size=batch_size,
+                         encode_batch_size=encode_batch_size, flush_on_file_end=flush_on_file_end,
+                         listeners=([dedup] if dedup is not None else []) + list(listeners))
+
+    parsed_q = queue.Queue(maxsize=queue_size)
+    chunked_q = queue.Queue(maxsize=queue_size)
+    # Set when the write loop aborts: the stages drop their jobs and wind down
+    stop = threading.Event()
+
+    def chunk(job):
+        job.chunks = chunk_elements(job.elements, job.file)
+        try:
+            job.metrics = extract_metrics(job.elements, job.company, job.year, job.file)
+        except Exception as e:
+            print(f"⚠️ Could not extract table metrics from {job.file}: {e}")
+        job.elements = None
+        print(f"✅ Found {len(job.chunks)} semantic chunks in {job.file}")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = queue.Queue(maxsize=queue_size)
+
+        def feed():
+            # discover + submit; the bounded `pending` queue caps the parses in flight
+            try:
+                for job in (discover(data_dir) if jobs is None else jobs):
+                    if stop.is_set():
+                        break
+                    stats.files_discovered += 1
+                    print(f"📄 Processing: {job.path}")
+                    pending.put((job, pool.submit(parse_pdf, job.path, cache_dir, job.sha256)))
+            finally:
+                pending.put(_DONE)
+
+        def collect():
+            # Wait on parses in submission order, so output order matches discovery order
+            while True:
+                item = pending.get()
+                if item is _DONE:
+                    parsed_q.put(_DONE)
+                    return
+                job, future = item
+                if stop.is_set():
+                    future.cancel()
+                    continue
+                start = time.perf_counter()
+                try:
+                    job.elements, sha256, hit = future.result()
+                    job.sha256 = job.sha256 or sha256
+                    stats.cache_hits += hit
+                except Exception as e:
+                    stats.fail(job, "parse", e)
+                    continue
+                finally:
+                    seconds = time.perf_counter() - start
+                    stats.stage_seconds["parse"] += seconds
+                    # Wait for the parse result, not the parse time in the worker
+                    observe("ingest.stage", seconds, stage="parse")
+                parsed_q.put(job)
+
+        threads = [
+            threading.Thread(target=feed, name="ingest-discover", daemon=True),
+            threading.Thread(target=collect, name="ingest-parse", daemon=True),
+            threading.Thread(target=_stage, args=("chunk", stats, parsed_q, chunked_q, chunk, stop),
+                             name="ingest-chunk", daemon=True),
+        ]
+        for t in threads:
+            t.start()
+
+        # Embed + write run on the calling thread, batched across files by the BatchWriter
+        written = []
+        job = None
+        try:
+            while True:
+                job = chunked_q.get()
+                if job is _DONE:
+                    break
+                if dedup is None:
+                    try:
+                        ids = [make_id(text) for text in job.chunks]
+                    except Exception as e:
+                        stats.fail(job, "chunk", e)
+                        continue
+                    job.chunk_ids = list(dict.fromkeys(ids))
+                    writer.add(
+                        ids=ids,
+                        documents=job.chunks,
+                        metadatas=[{
+                            "source": job.file,
+                            "company": job.company,
+                            "year": job.year
+                        } for _ in job.chunks],
+                        source=job.path,
+                    )
+                else:
+                    start = time.perf_counter()
+                    key = os.path.relpath(job.path, data_dir).replace(os.sep, "/")
+                    ids, documents = [], []
+                    try:
+                        for text in job.chunks:
+                            chunk_id, is_new = dedup.assign(text, key, make_id)
+                            job.chunk_ids.append(chunk_id)
+                            if is_new:
+                                ids.append(chunk_id)
+                                documents.append(text)
+                    except Exception as e:
+                        # Forget this file's new chunks before another file can reference them
+                        dedup.discard(ids)
+                        dedup.remove_refs([key])
+                        stats.fail(job, "dedup", e)
+                        continue
+                    finally:
+                        seconds = time.perf_counter() - start
+                        stats.stage_seconds["dedup"] += seconds
+                        observe("ingest.stage", seconds, stage="dedup")
+                    job.chunk_ids = list(dict.fromkeys(job.chunk_ids))
+                    stats.duplicates += len(job.chunks) - len(ids)
+                    writer.add(ids=ids, documents=documents, metadatas=[dedup.metadata(i) for i in ids],
+                               source=job.path)
+                writer.end_file()
+                written.append(job)
+            writer.close()
+        finally:
+            if job is not _DONE:
+                # Aborted: stop feeding, let every stage run dry so no thread stays blocked
+                # on a full queue, and drop the parses that have not started
+                stop.set()
+                pool.shutdown(wait=False, cancel_futures=True)
+                while chunked_q.get() is not _DONE:
+                    pass
+            if dedup is not None:
+                dedup.discard_pending()
+
+        for t in threads:
+            t.join()
+
+    failed = set(writer.failed_sources)
+    for job in written:
+        # A file also fails when a chunk it only references was in a failed batch
+        if job.path in failed or writer.failed_ids.intersection(job.chunk_ids):
+            stats.files_failed.append((job.path, "write", "batch write failed"))
+        else:
+            stats.files_indexed += 1
+            stats.indexed_jobs.append(job)
+            stats.metrics += len(job.metrics)
+    stats.chunks = writer.chunks_written
+    stats.stage_seconds["embed"] = writer.embed_seconds
+    stats.stage_seconds["write"] = writer.write_seconds
+    stats.elapsed = time.perf_counter() - stats.started
+    return stats
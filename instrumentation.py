@@ -0,0 +1,194 @@
+# instrumentation.py
+#
+# In-process timing spans aggregated into histograms, independent of LangSmith (no network,
+# works with tracing disabled). A span costs two perf_counter() calls, a lock and a
+# bisect; nothing is kept per call except the histogram counters.
+#
+#   with span("rag.query", mode="hybrid"):
+#       ...
+#   @timed("coordinator.handle")
+#   def coordinator_handle(...): ...
+#   observe("ingest.stage", seconds, stage="embed")   # durations measured elsewhere
+#
+# Export: render_prometheus() (Prometheus text format), dump(path), or the HTTP endpoint
+# started by start_metrics_server() (METRICS_PORT, /metrics). INSTRUMENTATION=0 turns
+# spans into no-ops.
+
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.getenv("INSTRUMENTATION", "1") != "0"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))   # 0 = no HTTP endpoint
+METRIC_NAME = "app_span_seconds"
+# Seconds; covers sub-millisecond BM25 lookups up to multi-minute ingestion runs
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_histograms = {}
+_lock = threading.Lock()
+_server = None
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # last slot: above the largest bucket
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bucket bound containing the q-quantile (the histogram's resolution)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+
+def _key(name, labels):
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items()))) if labels else (name, ())
+
+
+def observe(name, seconds, **labels):
+    """Record a duration measured elsewhere (e.g. in a worker process)."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.add(seconds)
+
+
+@contextmanager
+def span(name, **labels):
+    """Time the enclosed block; a block left by an exception is recorded with status="error"."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        observe(name, time.perf_counter() - start, status="error", **labels)
+        raise
+    observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """Decorator form of span(); for generator functions the span covers the whole iteration."""
+    def decorate(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(name, **labels):
+                    yield from func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(name, **labels):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """Per span and label set: count, total / max seconds and approximate p50 / p95 / p99."""
+    with _lock:
+        items = [(key, h.count, h.sum, h.max, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                 for key, h in _histograms.items()]
+    return [
+        {"span": name, "labels": dict(labels), "count": count, "sum_s": round(total, 6),
+         "max_s": round(peak, 6), "p50_s": p50, "p95_s": p95, "p99_s": p99}
+        for (name, labels), count, total, peak, p50, p95, p99 in sorted(items)
+    ]
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    escaped = ('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+               for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus():
+    """All histograms in the Prometheus text exposition format (one family, `span` label)."""
+    with _lock:
+        items = sorted((key, list(h.counts), h.count, h.sum) for key, h in _histograms.items())
+    lines = [f"# HELP {METRIC_NAME} Duration of instrumented spans in seconds.",
+             f"# TYPE {METRIC_NAME} histogram"]
+    for (name, labels), counts, count, total in items:
+        labels = (("span", name),) + labels
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f"{METRIC_NAME}_bucket{_label_text(labels, [('le', repr(bound))])} {cumulative}")
+        lines.append(f"{METRIC_NAME}_bucket{_label_text(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{METRIC_NAME}_sum{_label_text(labels)} {total:.6f}")
+        lines.append(f"{METRIC_NAME}_count{_label_text(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def dump(path):
+    """Write render_prometheus() to `path` (e.g. for the node_exporter textfile collector)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass   # no access log per scrape
+
+
+def start_metrics_server(port=METRICS_PORT, host="127.0.0.1"):
+    """
+    Serve /metrics on host:port from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer | None: The server, or None if port is 0.
+    """
+    global _server
+    if not port:
+        return None
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"📈 Metrics endpoint: http://{host}:{port}/metrics")
+    return _server
@@ -0,0 +1,118 @@
+# lazy_init.py
+#
+# Lazily built, process-wide components (Gemini chat models, the Tavily client, LangGraph
+# agents, the RAG agent, ...). Nothing heavy is constructed at import time: each component
+# is built on its first get(), exactly once even under concurrent requests, and its
+# construction time is recorded for the startup report. warm_up() can build them in a
+# background thread while the UI is already serving.
+
+import threading
+import time
+
+_components = {}
+_import_timings = {}
+
+
+class Lazy:
+    def __init__(self, name, factory):
+        """
+        Args:
+            name (str): Component name shown in the startup report.
+            factory (callable): Builds the component; called once, on first use.
+        """
+        self.name = name
+        self.factory = factory
+        self.seconds = None
+        self.error = None
+        self._value = None
+        self._built = False
+        self._lock = threading.Lock()
+        _components[name] = self
+
+    @property
+    def initialized(self):
+        return self._built
+
+    def get(self):
+        if self._built:
+            return self._value
+        with self._lock:
+            if not self._built:
+                start = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                except Exception as e:
+                    self.error = e
+                    raise
+                finally:
+                    self.seconds = time.perf_counter() - start
+                self.error = None
+                self._built = True
+        return self._value
+
+    def reset(self):
+        with self._lock:
+            self._value = None
+            self._built = False
+
+
+def lazy(name, factory):
+    """Register a lazily built component; returns its Lazy handle (call .get())."""
+    return Lazy(name, factory)
+
+
+def record_import(name, seconds):
+    """Record how long importing a module took (for modules the app imports eagerly)."""
+    _import_timings[name] = seconds
+
+
+def init_timings():
+    """Seconds spent building each component so far, None if it has not been built yet."""
+    return {name: component.seconds for name, component in _components.items()}
+
+
+def warm_up(names=None, background=True):
+    """
+    Build components ahead of the first request.
+
+    Args:
+        names (list[str]): Components to build, in order (default: all registered).
+        background (bool): Build in a daemon thread and return it immediately.
+
+    Returns:
+        threading.Thread | None: The warm-up thread when running in the background.
+    """
+    def run():
+        for name in names or list(_components):
+            component = _components.get(name)
+            if component is None:
+                print(f"⚠️ Warm-up: unknown component {name}")
+                continue
+            try:
+                component.get()
+            except Exception as e:
+                print(f"⚠️ Warm-up of {name} failed: {e}")
+        print(startup_report())
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_report():
+    """Import and init cost per component as printable text."""
+    lines = ["⏱️ Startup timing"]
+    for name, seconds in _import_timings.items():
+        lines.append(f"  import {name:<24} {seconds * 1000:8.1f} ms")
+    for name, component in _components.items():
+        if component.error is not None:
+            state = f"failed after {component.seconds * 1000:.1f} ms ({component.error})"
+        elif component.seconds is None:
+            state = "not built yet"
+        else:
+            state = f"{component.seconds * 1000:.1f} ms"
+        lines.append(f"  init   {name:<24} {state:>8}")
+    return "\n".join(lines)
@@ -0,0 +1,450 @@
+# metrics_store.py
+#
+# Structured financial metrics extracted from the table elements of the SEC filings at
+# ingest, stored in SQLite next to the Chroma data (persist_store/financial_metrics.sqlite).
+#
+# One row per (filing, metric, period): company, fiscal year, period ("2023" or "2023-Q2"),
+# period type (FY / Q / YTD), form, canonical metric name, value, unit and source page.
+# Numeric questions ("What is revenue of Apple 2023?") are answered from an indexed lookup
+# instead of vector search + LLM, and data_Sceince_agent reads time series from here.
+#
+# Tables are parsed from `metadata.text_as_html` when partition_pdf inferred the table
+# structure, otherwise from the flat table text (row label followed by its numbers).
+
+import calendar
+import os
+import re
+import sqlite3
+import threading
+from html.parser import HTMLParser
+
+from query_filters import COMPANY_ALIASES, extract_query_filters, parse_filing_name
+
+METRICS_FILE = "financial_metrics.sqlite"
+
+# Canonical metric -> row labels as they appear in the statements (lower case, most specific first)
+METRIC_ALIASES = {
+    "revenue": ["total net sales", "total net revenues", "total revenues", "net revenues",
+                "total revenue", "net sales", "revenues", "revenue"],
+    "cost_of_revenue": ["total cost of sales", "total cost of revenues", "cost of revenues",
+                        "cost of revenue", "cost of sales"],
+    "gross_margin": ["total gross margin", "gross margin", "gross profit"],
+    "research_and_development": ["research and development"],
+    "operating_expenses": ["total operating expenses", "total costs and expenses"],
+    "operating_income": ["operating income", "income from operations"],
+    "net_income": ["net income"],
+    "eps_diluted": ["diluted net income per share", "diluted earnings per share", "diluted"],
+    "eps_basic": ["basic net income per share", "basic earnings per share", "basic"],
+    "total_assets": ["total assets"],
+    "total_liabilities": ["total liabilities"],
+    "cash_and_equivalents": ["cash and cash equivalents"],
+}
+
+# Words used in questions -> canonical metric (English and German)
+QUESTION_METRICS = {
+    "revenue": ["revenue", "revenues", "net sales", "umsatz", "umsätze", "erlöse"],
+    "net_income": ["net income", "net profit", "nettogewinn", "reingewinn", "jahresüberschuss"],
+    "operating_income": ["operating income", "operating profit", "income from operations",
+                         "betriebsergebnis", "operatives ergebnis", "operativer gewinn"],
+    "gross_margin": ["gross margin", "gross profit", "bruttomarge", "bruttogewinn"],
+    "research_and_development": ["research and development", "r&d", "forschung und entwicklung"],
+    "operating_expenses": ["operating expenses", "betriebsausgaben", "betriebskosten"],
+    "cost_of_revenue": ["cost of revenue", "cost of sales", "herstellungskosten", "umsatzkosten"],
+    "eps_diluted": ["earnings per share", "eps", "gewinn je aktie", "gewinn pro aktie"],
+    "total_assets": ["total assets", "bilanzsumme", "gesamtvermögen"],
+    "total_liabilities": ["total liabilities", "verbindlichkeiten"],
+    "cash_and_equivalents": ["cash and cash equivalents", "liquide mittel"],
+}
+
+# Question words that ask for more than one reported number (explanations, comparisons, trends)
+NON_LOOKUP_WORDS = (
+    "why", "how", "explain", "describe", "compare", "compared", "versus", "vs", "trend", "driver",
+    "drivers", "reason", "reasons", "impact", "growth", "grow", "increase", "decrease", "decline",
+    "change", "changed", "warum", "wieso", "weshalb", "erkläre", "erklären", "beschreibe",
+    "vergleiche", "vergleich", "entwicklung", "grund", "gründe", "wachstum", "anstieg", "rückgang",
+)
+# Phrases that still ask for the number itself
+LOOKUP_PHRASES = ("how much", "how high", "wie hoch", "wie viel", "wieviel")
+# Words a plain lookup may contain besides company, period and metric. Anything else
+# ("iPhone revenue", "services revenue", "cloud") qualifies the metric, which the store
+# only holds company-wide, so those questions go to retrieval instead.
+LOOKUP_FILLER = {
+    "what", "whats", "was", "were", "is", "are", "the", "a", "an", "of", "for", "in", "at", "during",
+    "did", "do", "does", "have", "has", "had", "fiscal", "year", "financial", "company", "companys",
+    "total", "reported", "report", "reports", "value", "amount", "figure", "usd", "dollars", "s",
+    "inc", "corp", "corporation", "tell", "me", "please", "show", "give", "quarter", "quarterly",
+    "annual", "full", "k", "q", "10", "fy",
+    "wie", "was", "war", "ist", "sind", "der", "die", "das", "des", "dem", "den", "im", "in", "für",
+    "von", "vom", "geschäftsjahr", "jahr", "betrug", "beträgt", "hatte", "hat", "nenne", "zeige",
+    "mir", "bitte", "gesamt", "insgesamt", "quartal", "jahresbericht", "geschäftsbericht",
+    "gesamtjahr", "erste", "ersten", "zweite", "zweiten", "dritte", "dritten", "vierte", "vierten",
+    "first", "second", "third", "fourth",
+}
+
+PER_SHARE_METRICS = {"eps_diluted", "eps_basic"}
+# Month in which the fiscal year ends (Dataset folder name); calendar year for the others.
+# The stored year is the fiscal year, so Apple's 2023-Q1 ends in December 2022.
+FISCAL_YEAR_END_MONTH = {"Apple": 9, "Microsoft": 6, "Nvidia": 1}
+
+_NUMBER = r"\(?\$?\s*\d[\d,]*(?:\.\d+)?\s*\)?"
+_NUMBER_RE = re.compile(_NUMBER)
+_YEAR_RE = re.compile(r"\b(20[0-3]\d)\b")
+
+
+class _TableHTMLParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._row is not None and self._cell is not None:
+            self._row.append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def parse_number(text):
+    """'$ 383,285' -> 383285.0, '(1,234)' -> -1234.0, '—' / '' -> None."""
+    text = text.strip()
+    if not re.search(r"\d", text):
+        return None
+    negative = "(" in text and ")" in text
+    digits = re.sub(r"[^\d.]", "", text)
+    try:
+        value = float(digits)
+    except ValueError:
+        return None
+    return -value if negative else value
+
+
+def _match_metric(label):
+    label = " ".join(label.lower().replace("’", "'").split()).rstrip(":")
+    for metric, aliases in METRIC_ALIASES.items():
+        for alias in aliases:
+            if label == alias or label.startswith(alias + " ") or label.startswith(alias + ","):
+                if metric in PER_SHARE_METRICS and "shares" in label and "per share" not in label:
+                    return None   # "Diluted weighted-average shares" is a share count
+                return metric
+    return None
+
+
+def _unit(table_text, metric):
+    if metric in PER_SHARE_METRICS:
+        return "USD/share"
+    text = table_text.lower()
+    if "in billions" in text:
+        return "USD billions"
+    if "in thousands" in text:
+        return "USD thousands"
+    if "in millions" in text:
+        return "USD millions"
+    return "USD"
+
+
+def _column_periods(header_text, n_values, filing_year, form, quarter):
+    """
+    Period label and type for each value column of a table.
+
+    Years in the header are mapped to the value columns in order. 10-Q tables usually
+    hold "Three Months Ended" columns followed by "Six/Nine Months Ended" (year-to-date)
+    columns. Without years in the header the only column is the filing's own period.
+    """
+    header = header_text.lower()
+    years = _YEAR_RE.findall(header_text)
+    if len(years) < n_values:
+        years = [filing_year] if n_values == 1 else []
+    years = years[:n_values]
+    if not years:
+        return []
+
+    periods = []
+    if form == "10-Q":
+        has_ytd = any(w in header for w in ("six months", "nine months"))
+        has_quarter = "three months" in header or not has_ytd
+        n_quarter = len(years) // 2 if has_ytd and has_quarter else (len(years) if has_quarter else 0)
+        for i, year in enumerate(years):
+            if i < n_quarter:
+                periods.append((f"{year}-{quarter or 'Q1'}", "Q", year))
+            else:
+                periods.append((f"{year}-YTD-{quarter or 'Q1'}", "YTD", year))
+    else:
+        periods = [(year, "FY", year) for year in years]
+    return periods
+
+
+def _rows_from_html(html):
+    parser = _TableHTMLParser()
+    parser.feed(html)
+    return parser.rows
+
+
+def _rows_from_text(text):
+    """(label, numbers) pairs from flat table text, for every known row label."""
+    rows = []
+    lowered = text.lower()
+    for aliases in METRIC_ALIASES.values():
+        for alias in aliases:
+            for match in re.finditer(rf"\b{re.escape(alias)}\b[^\d$(]{{0,40}}((?:{_NUMBER}\s*){{1,8}})", lowered):
+                numbers = _NUMBER_RE.findall(match.group(1))
+                rows.append([alias] + numbers)
+            if rows and rows[-1][0] == alias:
+                break
+    return rows
+
+
+def extract_metrics(elements, company, year, file):
+    """
+    Metric rows from the table elements of one filing.
+
+    Returns:
+        list[dict]: company, year, period, period_type, form, quarter, metric, value, unit,
+                    page and label (the raw row label).
+    """
+    form, quarter = parse_filing_name(file)
+    rows_out = []
+    seen = set()
+    for element in elements:
+        if getattr(element, "category", None) != "Table":
+            continue
+        metadata = getattr(element, "metadata", None)
+        html = getattr(metadata, "text_as_html", None)
+        page = getattr(metadata, "page_number", None)
+        text = getattr(element, "text", "") or ""
+
+        if html:
+            rows = _rows_from_html(html)
+        else:
+            rows = _rows_from_text(text)
+        if not rows:
+            continue
+
+        header_parts = []
+        for row in rows:
+            if any("%" in cell for cell in row):
+                continue   # margins / growth rates in percent, not amounts
+            position = next((i for i, cell in enumerate(row) if cell and not _NUMBER_RE.fullmatch(cell.strip())), None)
+            label = row[position] if position is not None else ""
+            cells = row[position + 1:] if position is not None else row
+            values = [value for value in map(parse_number, cells) if value is not None]
+            metric = _match_metric(label) if label else None
+            if metric is None or not values:
+                if not values or _YEAR_RE.search(" ".join(row)):
+                    header_parts.append(" ".join(row))
+                continue
+
+            header = " ".join(header_parts) or text[:300]
+            for (period, period_type, period_year), value in zip(
+                    _column_periods(header, len(values), year, form, quarter), values):
+                key = (metric, period)
+                if key in seen:
+                    continue
+                seen.add(key)
+                rows_out.append({
+                    "company": company,
+                    "year": period_year,
+                    "period": period,
+                    "period_type": period_type,
+                    "form": form,
+                    "quarter": quarter,
+                    "metric": metric,
+                    "value": value,
+                    "unit": _unit(text, metric),
+                    "page": page,
+                    "label": label,
+                })
+    return rows_out
+
+
+def _period_date(period, period_type, company=None):
+    """
+    Approximate period end for a time series: the last day of the month in which the
+    fiscal year or fiscal quarter of `company` ends (Apple's fiscal 2023 ends in
+    September 2023, its first quarter in December 2022).
+    """
+    year = int(period[:4])
+    months_before_end = 0
+    if period_type == "Q" and re.fullmatch(r"Q[1-4]", period[-2:]):
+        months_before_end = 3 * (4 - int(period[-1]))
+    end_month = FISCAL_YEAR_END_MONTH.get(company, 12)
+    year, month = divmod(year * 12 + end_month - 1 - months_before_end, 12)
+    month += 1
+    return f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+
+
+def _is_plain_lookup(text, metric_word):
+    """
+    True when the lower-case question asks for nothing but one reported number: no
+    explanation / comparison wording and no words that qualify the metric (segments,
+    products, regions) once company, period, form and the metric phrase are removed.
+    """
+    text = text.replace("’", "'")
+    for phrase in LOOKUP_PHRASES:
+        text = re.sub(rf"\b{phrase}\b", " ", text)
+    if any(re.search(rf"(?<!\w){re.escape(word)}(?!\w)", text) for word in NON_LOOKUP_WORDS):
+        return False
+    text = re.sub(rf"(?<!\w){re.escape(metric_word)}(?!\w)", " ", text)
+    for aliases in COMPANY_ALIASES.values():
+        for alias in aliases:
+            text = re.sub(rf"\b{re.escape(alias)}\b", " ", text)
+    text = re.sub(r"\b20\d{2}\b|\bfy\s?'?\d{2}\b|\bq[1-4]\b", " ", text)
+    words = re.findall(r"\w+", text.replace("'", ""))
+    return all(word in LOOKUP_FILLER for word in words)
+
+
+class MetricsStore:
+    def __init__(self, path):
+        """
+        Args:
+            path (str): SQLite file; created with its schema on first use.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS metrics (
+                source TEXT NOT NULL,
+                company TEXT NOT NULL,
+                year TEXT NOT NULL,
+                period TEXT NOT NULL,
+                period_type TEXT NOT NULL,
+                form TEXT,
+                quarter TEXT,
+                metric TEXT NOT NULL,
+                value REAL NOT NULL,
+                unit TEXT,
+                page INTEGER,
+                label TEXT
+            );
+            CREATE INDEX IF NOT EXISTS metrics_lookup ON metrics (company, metric, period_type, period);
+            CREATE INDEX IF NOT EXISTS metrics_source ON metrics (source);
+        """)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM metrics").fetchone()[0]
+
+    def sources(self):
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT DISTINCT source FROM metrics")}
+
+    def replace_source(self, source, rows):
+        """Replace every metric of one filing (manifest key) with `rows`."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM metrics WHERE source = ?", (source,))
+            self._conn.executemany(
+                "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(source, r["company"], r["year"], r["period"], r["period_type"], r["form"], r["quarter"],
+                  r["metric"], r["value"], r["unit"], r["page"], r["label"]) for r in rows],
+            )
+
+    def remove_sources(self, sources):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM metrics WHERE source = ?", [(s,) for s in sources])
+
+    def lookup(self, company, metric, period=None, period_type=None):
+        """
+        Values of one metric, the original filing first.
+
+        A period is reported again (as comparison column) in later filings; the row from
+        the filing of the same fiscal year is preferred, then the most recent restatement.
+
+        Returns:
+            list[dict]: Matching rows (period, period_type, value, unit, form, source, page).
+        """
+        query = ("SELECT period, period_type, value, unit, form, source, page, year FROM metrics "
+                 "WHERE company = ? AND metric = ?")
+        params = [company, metric]
+        if period is not None:
+            query += " AND period = ?"
+            params.append(period)
+        if period_type is not None:
+            query += " AND period_type = ?"
+            params.append(period_type)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        keys = ("period", "period_type", "value", "unit", "form", "source", "page", "year")
+        rows = [dict(zip(keys, row)) for row in rows]
+        # Filing year is the directory name: <company>/<year>/<file>
+        for row in rows:
+            parts = row["source"].replace("\\", "/").split("/")
+            row["filing_year"] = parts[1] if len(parts) > 2 else ""
+        rows.sort(key=lambda r: (r["period"], r["filing_year"] != r["year"], -int(r["filing_year"] or 0)))
+        return rows
+
+    def time_series(self, company, metric="revenue", period_type="FY"):
+        """
+        One value per period, oldest first.
+
+        Returns:
+            list[tuple[str, float]]: (approximate period end date "YYYY-MM-DD", value)
+        """
+        series = {}
+        for row in self.lookup(company, metric, period_type=period_type):
+            series.setdefault(row["period"], row["value"])
+        return [(_period_date(period, period_type, company), value) for period, value in sorted(series.items())]
+
+    def answer(self, question):
+        """
+        Answer a single-metric question ("What is revenue of Apple 2023?") from the store.
+
+        Only used when the question names exactly one company, one fiscal year and a
+        known metric, asks for nothing else (see `_is_plain_lookup`) and the store has
+        that value; returns None otherwise.
+
+        Returns:
+            dict | None: {"answer": text, "metric", "company", "period", "value", "unit",
+                          "source", "page"}
+        """
+        filters = extract_query_filters(question)
+        if len(filters["companies"]) != 1 or len(filters["years"]) != 1:
+            return None
+        text = question.lower()
+        found = [(metric, word) for metric, words in QUESTION_METRICS.items() for word in words
+                 if re.search(rf"(?<!\w){re.escape(word)}(?!\w)", text)]
+        # "gewinn je aktie" also contains "gewinn": keep only the longest matching phrases
+        found = [(metric, word) for metric, word in found
+                 if not any(word != other and word in other for _, other in found)]
+        metrics = {metric for metric, _ in found}
+        if len(metrics) != 1 or len(found) != 1 or not _is_plain_lookup(text, found[0][1]):
+            return None
+
+        company, year, metric = filters["companies"][0], filters["years"][0], metrics.pop()
+        if filters["quarter"]:
+            period, period_type = f"{year}-{filters['quarter']}", "Q"
+        else:
+            period, period_type = year, "FY"
+        rows = self.lookup(company, metric, period=period, period_type=period_type)
+        if not rows:
+            return None
+
+        row = rows[0]
+        value = row["value"]
+        shown = f"{value:,.2f}" if row["unit"] == "USD/share" else f"{value:,.0f}"
+        label = metric.replace("_", " ")
+        page = f", page {row['page']}" if row["page"] else ""
+        return {
+            "answer": (f"{company if company != 'Goolge' else 'Google'} {label} ({period}): "
+                       f"{shown} {row['unit']}\nSources:- {os.path.basename(row['source'])}{page}"),
+            "metric": metric,
+            "company": company,
+            "period": period,
+            "value": value,
+            "unit": row["unit"],
+            "source": row["source"],
+            "page": row["page"],
+        }
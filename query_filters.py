@@ -0,0 +1,133 @@
+# query_filters.py
+#
+# Query-side metadata extraction for RAGAgent.query. Company, fiscal year and form type
+# (10-K / 10-Q + quarter) are read from the question and turned into a Chroma `where`
+# filter over the `company` / `year` / `source` metadata written at ingest, so a question
+# about "Apple 2023" only searches Apple's 2023 filings instead of the whole corpus.
+
+import re
+
+# Dataset folder name -> lower-case aliases used in questions (the Google folder is "Goolge")
+COMPANY_ALIASES = {
+    "Apple": ["apple", "aapl"],
+    "Goolge": ["google", "alphabet", "goog", "googl", "goolge"],
+    "Meta": ["meta", "facebook", "fb"],
+    "Microsoft": ["microsoft", "msft"],
+    "Nvidia": ["nvidia", "nvda"],
+}
+
+_ORDINAL_QUARTERS = {
+    "first": "Q1", "second": "Q2", "third": "Q3", "fourth": "Q4",
+    "erste": "Q1", "zweite": "Q2", "dritte": "Q3", "vierte": "Q4",
+}
+
+_ANNUAL_WORDS = ("10-k", "10k", "annual", "jahresbericht", "geschäftsbericht", "full year", "gesamtjahr")
+_QUARTERLY_WORDS = ("10-q", "10q", "quarterly", "quarter", "quartal")
+
+
+def parse_filing_name(file):
+    """
+    Form type and quarter from a Dataset file name.
+
+    "10-K-2023-apple.pdf" -> ("10-K", ""), "_10-Q-Q2-2022-apple.pdf" -> ("10-Q", "Q2"),
+    "10-Q-2020-apple.pdf" -> ("10-Q", "Q1") (the first 10-Q of a year carries no number).
+    """
+    name = file.lower()
+    if re.search(r"10-?k", name):
+        return "10-K", ""
+    if re.search(r"10-?q", name):
+        match = re.search(r"10-?q-?q?([1-4])(?!\d)", name)
+        return "10-Q", f"Q{match.group(1)}" if match else "Q1"
+    return "", ""
+
+
+def extract_query_filters(question):
+    """
+    Returns:
+        dict: {"companies": [folder names], "years": [str], "form": "10-K"/"10-Q"/None,
+               "quarter": "Q1".."Q3"/None}
+    """
+    text = question.lower()
+
+    companies = [
+        folder for folder, aliases in COMPANY_ALIASES.items()
+        if any(re.search(rf"\b{re.escape(alias)}\b", text) for alias in aliases)
+    ]
+
+    years = re.findall(r"\b(20\d{2})\b", text)
+    years += ["20" + y for y in re.findall(r"\bfy\s?'?(\d{2})\b", text)]
+    years = sorted(set(years))
+
+    quarter = None
+    match = re.search(r"\bq([1-4])\b", text)
+    if match:
+        quarter = f"Q{match.group(1)}"
+    else:
+        for word, q in _ORDINAL_QUARTERS.items():
+            if re.search(rf"\b{word}[sn]?\s+(quarter|quartal)", text):
+                quarter = q
+                break
+
+    form = None
+    if quarter == "Q4":
+        # There is no 10-Q for the fourth quarter, it is covered by the 10-K
+        form, quarter = "10-K", None
+    elif quarter:
+        form = "10-Q"
+    elif any(word in text for word in _ANNUAL_WORDS):
+        form = "10-K"
+    elif any(word in text for word in _QUARTERLY_WORDS):
+        form = "10-Q"
+
+    return {"companies": companies, "years": years, "form": form, "quarter": quarter}
+
+
+def _condition(field, values):
+    return {field: values[0]} if len(values) == 1 else {field: {"$in": values}}
+
+
+def build_where(filters, sources=None, use_form=True, use_year=True):
+    """
+    Chroma `where` clause for `filters`, or None when nothing was extracted.
+
+    Form type and quarter live only in the file name, so they are applied as a
+    `source $in [...]` condition over the known `sources` ((company, year, file) tuples).
+    """
+    conditions = []
+    if filters["companies"]:
+        conditions.append(_condition("company", filters["companies"]))
+    if use_year and filters["years"]:
+        conditions.append(_condition("year", filters["years"]))
+    if use_form and filters["form"] and sources:
+        matching = [
+            (company, file) for company, year, file in sources
+            if (not filters["companies"] or company in filters["companies"])
+            and (not use_year or not filters["years"] or year in filters["years"])
+            and parse_filing_name(file)[0] == filters["form"]
+            and (not filters["quarter"] or parse_filing_name(file)[1] == filters["quarter"])
+        ]
+        # Skip the form filter if it would silently drop one of the requested companies
+        covered = {company for company, _ in matching}
+        if matching and all(company in covered for company in filters["companies"]):
+            conditions.append(_condition("source", sorted({file for _, file in matching})))
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def where_candidates(filters, sources=None):
+    """
+    Filters to try in order, from most to least specific, always ending with None
+    (unfiltered search) so a question never comes back empty because of a bad guess.
+    """
+    candidates = []
+    for use_form, use_year in ((True, True), (False, True), (False, False)):
+        where = build_where(filters, sources, use_form=use_form, use_year=use_year)
+        if where not in candidates:
+            candidates.append(where)
+    if None not in candidates:
+        candidates.append(None)
+    return candidates
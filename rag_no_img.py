@@ -1,18 +1,26 @@
 import os
 from pathlib import Path
-from unstructured.partition.pdf import partition_pdf
-from sentence_transformers import SentenceTransformer
 import chromadb
 import google.generativeai as genai
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
 #from langchain.text_splitter import RecursiveCharacterTextSplitter
 from chromadb.config import Settings
 from dotenv import load_dotenv
-from unstructured.chunking.title import chunk_by_title
-from unstructured.partition.pdf import partition_pdf
-from unstructured.chunking.title import chunk_by_title
-from unstructured.documents.elements import CompositeElement
+from embedding_service import get_embedding_service, SharedEmbeddingFunction
+from ingest_pipeline import run_ingestion, discover, PARTITION_PARAMS
+from element_cache import cache_key, load_elements, prune as prune_element_cache
+from ingest_manifest import IngestManifest
+from query_filters import extract_query_filters, where_candidates
+from answer_cache import SemanticAnswerCache, CACHE_FILE as ANSWER_CACHE_FILE
+from bm25_index import BM25Index, INDEX_FILE as BM25_INDEX_FILE, reciprocal_rank_fusion
+from dedup_index import DedupIndex, DEDUP_ENABLED, INDEX_FILE as DEDUP_INDEX_FILE, key_metadata, source_refs
+from vector_store import FaissStore, VECTOR_STORE, open_vector_store
+from batch_writer import DEFAULT_BATCH_SIZE, DEFAULT_ENCODE_BATCH_SIZE
+from context_builder import ContextBuilder, DEFAULT_CANDIDATE_FACTOR
+from metrics_store import MetricsStore, extract_metrics, METRICS_FILE
+from instrumentation import observe, span, timed
 import hashlib
+import threading
+import time
 
 os.environ["PATH"] += os.pathsep + r"C:\Program Files\Tesseract-OCR"
 
@@ -23,6 +31,15 @@ api_key = os.getenv("API_KEY")
 # Directories
 DATASET_DIR = "Dataset"
 CHROMA_DIR = "persist_store"
+ELEMENT_CACHE_DIR = os.getenv("ELEMENT_CACHE_DIR", os.path.join(CHROMA_DIR, "element_cache"))
+# "vector", "bm25" or "hybrid" (reciprocal rank fusion of both)
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+ANSWER_CACHE_ENABLED = os.getenv("RAG_ANSWER_CACHE", "1") != "0"
+# Minimum number of seconds between two scans of the Dataset tree on the warm path
+CHANGE_CHECK_INTERVAL = float(os.getenv("RAG_CHANGE_CHECK_INTERVAL", "60"))
+# Answer plain single-metric questions ("Apple revenue 2023") from the metrics store, without
+# Gemini. Opt-in (RAG_METRIC_ANSWERS=1): the store only holds company-wide statement rows.
+METRIC_ANSWERS_ENABLED = os.getenv("RAG_METRIC_ANSWERS", "0") == "1"
 
 
 
@@ -31,128 +48,385 @@ def generate_id(text):
 
 
 class RAGAgent:
-    def __init__(self, data_dir="./Dataset", collection_name="ir_chunks",chroma_dir=CHROMA_DIR,gen_model="models/gemini-1.5-flash"):
+    def __init__(self, data_dir="./Dataset", collection_name="ir_chunks",chroma_dir=CHROMA_DIR,gen_model="models/gemini-1.5-flash",
+                 element_cache_dir=ELEMENT_CACHE_DIR, vector_store=VECTOR_STORE):
         self.data_dir = data_dir
+        self.chroma_dir = chroma_dir
+        self.element_cache_dir = element_cache_dir
         #self.splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+        # One shared model for ingestion, the collection and queries (see embedding_service)
+        self.embedding_service = get_embedding_service()
+        self.embedding_function = SharedEmbeddingFunction(self.embedding_service)
         genai.configure(api_key=api_key)
         self.gemini_model = genai.GenerativeModel(gen_model)
+        # Chroma `sec_filings` collection or the quantized FAISS store (VECTOR_STORE, see vector_store)
         self.chroma_client = chromadb.PersistentClient(
             path=chroma_dir, settings=Settings(allow_reset=True)
-        )
-        self.collection = self.chroma_client.get_or_create_collection(
-                                                    name="sec_filings",
-                                                    embedding_function=SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2"))
+        ) if vector_store == "chroma" else None
+        self.collection = open_vector_store(chroma_dir, vector_store, self.embedding_function, self.chroma_client)
         #self.text_collection = self.chroma_client.get_or_create_collection(collection_name + "_text")
         #self.table_collection = self.chroma_client.get_or_create_collection(collection_name + "_table")
 
-        
-        
-        self.embedding_function=SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2") 
+        # Lexical index over the same chunks, rebuilt from Chroma if missing or out of sync
+        self.bm25 = BM25Index.load(os.path.join(chroma_dir, BM25_INDEX_FILE))
+        if len(self.bm25) != self.collection.count():
+            print("🔤 Building BM25 index from the collection...")
+            self.bm25.rebuild_from_collection(self.collection)
+            self.bm25.save()
+
+        # MinHash/LSH index of the stored chunks; near-duplicates are only referenced
+        self.dedup = DedupIndex.load(os.path.join(chroma_dir, DEDUP_INDEX_FILE)) if DEDUP_ENABLED else None
+        if self.dedup is not None and len(self.dedup) != self.collection.count():
+            print("🧬 Building near-duplicate index from the collection...")
+            self.dedup.rebuild_from_collection(self.collection)
+            self.dedup.save()
+
+        self.answer_cache = (
+            SemanticAnswerCache(os.path.join(chroma_dir, ANSWER_CACHE_FILE)) if ANSWER_CACHE_ENABLED else None
+        )
+        self.index_version = self.compute_index_version()
+        self.reindexing = threading.Event()   # set while indexPDF runs
+        self.filter_sources = self.load_filter_sources()
+        self.context_builder = ContextBuilder()
+        # Financial figures from the filing tables, filled by indexPDF
+        self.metrics_store = MetricsStore(os.path.join(chroma_dir, METRICS_FILE))
+
+    def compute_index_version(self):
+        """Fingerprint of what is indexed (file hashes + chunk counts), used to invalidate cached answers."""
+        manifest = IngestManifest(self.chroma_dir, self.data_dir)
+        state = sorted((key, entry["sha256"], len(entry["chunk_ids"])) for key, entry in manifest.files.items())
+        return hashlib.md5(repr(state).encode()).hexdigest()
+
+    def load_filter_sources(self, manifest=None):
+        """(company, year, file) of every indexed filing, the vocabulary of the query pre-filter."""
+        manifest = manifest or IngestManifest(self.chroma_dir, self.data_dir)
+        return sorted(
+            (meta["company"], meta["year"], meta["source"])
+            for meta in map(key_metadata, (key for key, entry in manifest.files.items() if not entry.get("error")))
+        )
     
 
-    
-    def indexPDF(self):
-        doc_count=0
-        for company in os.listdir(self.data_dir):
-            company_path = os.path.join(self.data_dir, company)
-            if not os.path.isdir(company_path):
-                continue
+    def needs_indexing(self):
+        """
+        True if the collection is empty or a PDF was added, modified or deleted since the
+        last indexPDF run. Only stats files, nothing is opened or parsed.
+        """
+        if self.collection.count() == 0:
+            return True
+        manifest = IngestManifest(self.chroma_dir, self.data_dir)
+        return manifest.has_changes(discover(self.data_dir))
+
+    def delete_chunks(self, ids, batch_size=5000):
+        for i in range(0, len(ids), batch_size):
+            self.collection.delete(ids=ids[i:i + batch_size])
+        self.bm25.remove(ids)
+        if self.dedup is not None:
+            self.dedup.remove(ids)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_chunks(ids)
+
+    def refresh_sources(self, ids, batch_size=5000):
+        """
+        Rewrite the metadata of shared chunks whose file references changed (dedup_index):
+        "sources" in Chroma, and source / company / year in BM25 when the first reference
+        went away.
+        """
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i:i + batch_size]
+            metadatas = [self.dedup.metadata(chunk_id) for chunk_id in batch]
+            self.collection.update(ids=batch, metadatas=metadatas)
+            documents = self.collection.get(ids=batch, include=["documents"])
+            by_id = dict(zip(documents["ids"], documents["documents"]))
+            self.bm25.remove(batch)
+            self.bm25.add(batch, [by_id.get(chunk_id, "") for chunk_id in batch], metadatas)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_chunks(ids)
+
+    @timed("ingest.index_pdf")
+    def indexPDF(self, workers=None, batch_size=DEFAULT_BATCH_SIZE, encode_batch_size=DEFAULT_ENCODE_BATCH_SIZE,
+                 retry_failed=False, rebuild=False):
+        """
+        Incrementally ingest the PDFs under data_dir through the staged pipeline in ingest_pipeline.
 
-            for year in os.listdir(company_path):
-                year_path = os.path.join(company_path, year)
-                if not os.path.isdir(year_path):
-                    continue
-
-                for file in os.listdir(year_path):
-                    if file.lower().endswith(".pdf"):
-                        pdf_path = os.path.join(year_path, file)
-                        print(f"📄 Processing: {pdf_path}")
-                        existing = self.collection.query(
-                        query_texts=["placeholder"],
-                        n_results=1,
-                        where={"source": file}
-                         )
-
-                        # Check if the first list inside `ids` has any results
-                        if existing and existing["ids"] and existing["ids"][0]:
-                            print(f"⏭️ Skipping already indexed file: {file}")
-                            continue
-
-                        try:
-                            # Step 1: Parse the PDF using
-                            elements = partition_pdf(
-                                filename=pdf_path,
-                                extract_tables=True,
-                                strategy="auto"
-                            )
-                        except Exception as e:
-                            print(f"❌ Failed to parse PDF {pdf_path}: {e}")
-                            continue
-
-                        try:
-                            # Step 2: Chunk by title
-                            title_chunks = chunk_by_title(elements)
-                            print(f"✅ Found {len(title_chunks)} semantic chunks")
-
-                            for chunk in title_chunks:
-                                try:
-                                    if isinstance(chunk, CompositeElement):
-                                        chunk_text = chunk.text
-                                    else:
-                                        chunk_text = "\n\n".join(
-                                            el.text for el in chunk
-                                            if hasattr(el, 'text') and el.text and len(el.text) > 30
-                                        )
-
-                                    if chunk_text and len(chunk_text) > 30:
-                                        self.collection.add(
-                                            documents=[chunk_text],
-                                            metadatas=[{
-                                                "source": file,
-                                                "company": company,
-                                                "year": year
-                                            }],
-                                            ids=[generate_id(chunk_text)]
-                                        )
-                                        doc_count+=1
-                                        
-                                except Exception as e:
-                                    print(f"⚠️ Failed to process a chunk in {file}: {e}")
-                        except Exception as e:
-                            print(f"❌ Chunking failed for {pdf_path}: {e}")
-
-        print(f"✅ Indexed {doc_count} document chunks total.")
+        The ingest manifest decides what to do with each file: unchanged files are skipped,
+        changed files get their old chunks deleted and are re-ingested, and chunks of deleted
+        files are pruned. Files that failed before are skipped until they change (or
+        `retry_failed` is set); the chunks they had written are then deleted like a changed file's.
+        Parsed elements come from the element cache when possible, so `rebuild=True`
+        (re-chunk and re-embed everything) does not re-run partition_pdf.
+
+        Args:
+            workers (int): Number of parser processes (default: INGEST_WORKERS or cpu_count - 1).
+            batch_size (int): Chunks per bulk embed + Chroma write (default: INGEST_BATCH_SIZE).
+            encode_batch_size (int): SentenceTransformer.encode batch size (default: EMBED_BATCH_SIZE).
+            retry_failed (bool): Also retry files that failed in an earlier run.
+            rebuild (bool): Re-ingest every file, e.g. after changing chunking or the embedding model.
+
+        Returns:
+            IngestStats: Counters and timings, also printed as a throughput report.
+        """
+        # The collection, BM25 and dedup index change under running requests; answers
+        # generated meanwhile are not cached (see _use_cache)
+        self.reindexing.set()
+        try:
+            manifest = IngestManifest(self.chroma_dir, self.data_dir)
+            plan = manifest.plan(discover(self.data_dir), retry_failed=retry_failed, rebuild=rebuild)
+            for job in plan.unchanged:
+                print(f"⏭️ Skipping already indexed file: {job.file}")
+
+            stale_keys = [manifest.key(job.path) for job in plan.changed] + plan.removed
+            stale_ids = manifest.stale_chunk_ids(stale_keys)
+            if stale_ids:
+                print(f"🧹 Removing {len(stale_ids)} chunks of {len(stale_keys)} changed/deleted files")
+                self.delete_chunks(stale_ids)
+            # Forget stale entries now, so a file whose re-ingest fails is retried next time
+            manifest.forget(stale_keys)
+            self.metrics_store.remove_sources(stale_keys)
+            shared = self.dedup.remove_refs(stale_keys) if self.dedup is not None else []
+
+            stats = run_ingestion(
+                self.collection,
+                self.data_dir,
+                model=self.embedding_service,
+                make_id=generate_id,
+                jobs=plan.to_ingest,
+                workers=workers,
+                batch_size=batch_size,
+                encode_batch_size=encode_batch_size,
+                cache_dir=self.element_cache_dir,
+                listeners=[self.bm25],
+                dedup=self.dedup,
+            )
+            if self.dedup is not None:
+                touched = sorted(set(shared) | set(self.dedup.pop_dirty()))
+                if touched:
+                    print(f"🧬 Updating the sources of {len(touched)} shared chunks")
+                    self.refresh_sources(touched)
+                self.dedup.save()
+            if isinstance(self.collection, FaissStore):
+                self.collection.save()
+            for job in stats.indexed_jobs:
+                manifest.record(job, job.chunk_ids)
+                self.metrics_store.replace_source(manifest.key(job.path), job.metrics)
+            self._backfill_metrics(manifest, plan.unchanged)
+            jobs_by_path = {job.path: job for job in plan.to_ingest}
+            for path, stage, error in stats.files_failed:
+                manifest.record_failure(jobs_by_path[path], f"{stage}: {error}")
+            manifest.save()
+            self.bm25.save()
+            if self.answer_cache is not None:
+                self.answer_cache.flush()
+            self.index_version = self.compute_index_version()
+            self.filter_sources = self.load_filter_sources(manifest)
+            if self.element_cache_dir:
+                keep = [cache_key(entry["sha256"], PARTITION_PARAMS) for entry in manifest.files.values()]
+                removed = prune_element_cache(self.element_cache_dir, keep)
+                if removed:
+                    print(f"🧹 Pruned {removed} stale element cache entries")
+
+            stats.files_discovered += len(plan.unchanged)
+            stats.files_skipped = len(plan.unchanged)
+            print(f"✅ Indexed {stats.chunks} document chunks total.")
+            print(stats.report())
+            return stats
+        finally:
+            self.reindexing.clear()
 
     
     
-    def query(self, question, top_k=3):
+    def _backfill_metrics(self, manifest, jobs):
+        """
+        Extract table metrics for indexed files that are not in the metrics store yet
+        (e.g. indexed before the store existed), from the element cache only.
+        """
+        if not self.element_cache_dir:
+            return
+        known = self.metrics_store.sources()
+        added = 0
+        for job in jobs:
+            key = manifest.key(job.path)
+            entry = manifest.files.get(key)
+            if key in known or not entry or entry.get("error"):
+                continue
+            elements = load_elements(self.element_cache_dir, cache_key(entry["sha256"], PARTITION_PARAMS))
+            if elements is None:
+                continue
+            rows = extract_metrics(elements, job.company, job.year, job.file)
+            self.metrics_store.replace_source(key, rows)
+            added += len(rows)
+        if added:
+            print(f"🔢 Backfilled {added} financial metrics from the element cache")
+
+    def _metric_answer(self, question):
+        if not METRIC_ANSWERS_ENABLED:
+            return None
+        metric = self.metrics_store.answer(question)
+        if metric is None:
+            return None
+        print(f"🔢 Answered from the metrics store: {metric['company']} {metric['metric']} {metric['period']}")
+        return {
+            "answer": metric["answer"],
+            "documents": [[]],
+            "metadatas": [[{"source": os.path.basename(metric["source"]), "company": metric["company"],
+                            "page_number": metric["page"]}]],
+            "metric": metric,
+            "cached": False,
+        }
+
+    def _vector_search(self, query_embedding, top_k, where, include_embeddings=False):
+        kwargs = {"where": where} if where else {}
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        with span("rag.vector_search"):
+            return self.collection.query(
+                query_embeddings=query_embedding,
+                n_results=top_k,
+                include=include,
+                **kwargs
+            )
+
+    def _hybrid_search(self, question, query_embedding, top_k, where, mode, include_embeddings=False):
+        """
+        BM25 and/or vector candidates fused with reciprocal rank fusion, returned in the
+        same shape as collection.query (one list per query).
+        """
+        pool = top_k * 4
+        rankings = []
+        vector = None
+        if mode == "hybrid":
+            vector = self._vector_search(query_embedding, pool, where, include_embeddings)
+            rankings.append(vector["ids"][0])
+        with span("rag.bm25_search"):
+            rankings.append([chunk_id for chunk_id, _ in self.bm25.search(question, pool, where)])
+
+        fused = reciprocal_rank_fusion(rankings, top_k=top_k)
+        ids = [chunk_id for chunk_id, _ in fused]
+
+        known = {}
+        if vector is not None:
+            embeddings = vector.get("embeddings") if include_embeddings else None
+            for i, (chunk_id, doc, meta) in enumerate(zip(vector["ids"][0], vector["documents"][0], vector["metadatas"][0])):
+                known[chunk_id] = (doc, meta, embeddings[0][i] if embeddings is not None else None)
+        missing = [chunk_id for chunk_id in ids if chunk_id not in known]
+        if missing:
+            include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+            fetched = self.collection.get(ids=missing, include=include)
+            embeddings = fetched.get("embeddings") if include_embeddings else None
+            for i, (chunk_id, doc, meta) in enumerate(zip(fetched["ids"], fetched["documents"], fetched["metadatas"])):
+                known[chunk_id] = (doc, meta, embeddings[i] if embeddings is not None else None)
+
+        ids = [chunk_id for chunk_id in ids if chunk_id in known]
+        results = {
+            "ids": [ids],
+            "documents": [[known[chunk_id][0] for chunk_id in ids]],
+            "metadatas": [[known[chunk_id][1] for chunk_id in ids]],
+            "scores": [[score for chunk_id, score in fused if chunk_id in known]],
+        }
+        if include_embeddings:
+            results["embeddings"] = [[known[chunk_id][2] for chunk_id in ids]]
+        return results
+
+    @timed("rag.query")
+    def query(self, question, top_k=3, use_filters=True, mode=None, query_embedding=None,
+              include_embeddings=False):
         
         """
         Perform a semantic search over the vector store using the question embedding.
+
+        Company, fiscal year and form type mentioned in the question are turned into a
+        metadata filter (see query_filters). If a filter matches nothing, it is relaxed
+        step by step down to an unfiltered search.
         
         Args:
             question (str): The user's input question.
             top_k (int): The number of top documents to retrieve.
+            use_filters (bool): Apply the metadata pre-filter.
+            mode (str): "vector", "bm25" or "hybrid" (default: RAG_RETRIEVAL_MODE).
+            query_embedding (list): Pre-computed question embedding ([[...]]), if any.
+            include_embeddings (bool): Also return the stored chunk embeddings ("embeddings").
 
         Returns:
-            dict: A dictionary with keys "documents", "ids", and "metadatas".
+            dict: A dictionary with keys "documents", "ids", "metadatas" and "where"
+                  (the filter that produced the results, None if unfiltered).
         """
-        # Perform query using the collection
-        results = self.collection.query(
-            query_texts=[question],
-            n_results=top_k
-        )
-
+        mode = mode or RETRIEVAL_MODE
+        if mode != "vector" and not len(self.bm25):
+            mode = "vector"
+
+        # Embed once, re-use the vector for every filter candidate
+        if query_embedding is None and mode != "bm25":
+            query_embedding = self.embedding_service.encode([question])
+
+        candidates = [None]
+        if use_filters:
+            filters = extract_query_filters(question)
+            candidates = where_candidates(filters, self.filter_sources)
+
+        for where in candidates:
+            if mode == "vector":
+                results = self._vector_search(query_embedding, top_k, where, include_embeddings)
+            else:
+                results = self._hybrid_search(question, query_embedding, top_k, where, mode, include_embeddings)
+            if results["ids"] and results["ids"][0]:
+                break
+
+        results["where"] = where
+        results["mode"] = mode
         return results
 
     
-    def generate_answer(self, question, top_k=3):
-        results = self.query(question, top_k=top_k)
+    def retrieve_context(self, question, top_k=3, query_embedding=None):
+        """
+        Over-retrieve candidates and pack the best of them into the prompt context.
 
-        # Aggregate relevant chunks
-        context_parts = results["documents"][0]
-        context = "".join(context_parts)
+        Fetches top_k * RAG_CANDIDATE_FACTOR chunks, then lets the ContextBuilder drop
+        near-duplicates, rerank with MMR and fill the token budget (RAG_CONTEXT_TOKENS).
+        At most top_k chunks end up in the context; the budget and MMR only drop chunks.
+
+        Returns:
+            dict: The packed chunks in query() shape plus "context", "context_stats",
+                  "where" and "mode".
+        """
+        if query_embedding is None:
+            query_embedding = self.embedding_service.encode([question])
+        results = self.query(question, top_k=top_k * DEFAULT_CANDIDATE_FACTOR,
+                             query_embedding=query_embedding, include_embeddings=True)
+
+        ids = results["ids"][0] if results["ids"] else []
+        embeddings = results.get("embeddings")
+        embeddings = embeddings[0] if embeddings is not None else None
+        if ids and (embeddings is None or any(e is None for e in embeddings)):
+            stored = self.collection.get(ids=ids, include=["embeddings"])
+            by_id = dict(zip(stored["ids"], stored["embeddings"]))
+            embeddings = [by_id[chunk_id] for chunk_id in ids]
+
+        with span("rag.context_build"):
+            packed = self.context_builder.build(
+                question, query_embedding[0], ids, results["documents"][0] if ids else [],
+                results["metadatas"][0] if ids else [], embeddings, max_chunks=top_k,
+            )
+        packed["where"] = results.get("where")
+        packed["mode"] = results.get("mode")
+        stats = packed["context_stats"]
+        print(f"🧮 Context: {stats['tokens']}/{stats['budget']} tokens, {stats['chunks']} chunks "
+              f"({stats['candidates']} candidates, {stats['duplicates']} duplicates, "
+              f"{stats['truncated']} truncated)")
+        return packed
+
+    def _use_cache(self, use_cache):
+        return use_cache and self.answer_cache is not None and not self.reindexing.is_set()
+
+    def _cache_signature(self, question, top_k):
+        # Only reuse answers for the same retrieval/context params and company/year/form signature
+        return repr((top_k, RETRIEVAL_MODE, self.context_builder.signature(),
+                     sorted(extract_query_filters(question).items())))
+
+    def _build_prompt(self, question, results):
+        # Packed context with source headers (see retrieve_context)
+        context = results.get("context")
+        if context is None:
+            context = "\n\n".join(results["documents"][0])
 
         prompt = f"""You are a helpful assistant with access to corporate documents.
         Use the following context to answer the user's question:
@@ -162,32 +436,181 @@ class RAGAgent:
 
     Question: {question}
     Answer:"""
+        return prompt
 
-        response = self.gemini_model.generate_content(prompt)
-
+    def _format_citations(self, results):
         # Generate citation list from metadata
         citations = []
         for metadata in results["metadatas"][0]:
-            source = metadata.get("source", "Unknown source")
-            company = metadata.get("company", "")
-            year = metadata.get("year", "")
-            citation = f"{source} ({company}, {year})"
-            if citation not in citations:
-                citations.append(citation)
+            # A deduplicated chunk cites every filing that contains it
+            for ref in source_refs(metadata):
+                source = ref.get("source") or "Unknown source"
+                citation = f"{source} ({ref.get('company', '')}, {ref.get('year', '')})"
+                if citation not in citations:
+                    citations.append(citation)
 
         # Format citations
-        citation_text = "Sources:" + " ".join(f"- {c}" for c in citations)
-
-        return {
+        return "Sources:" + " ".join(f"- {c}" for c in citations)
+
+    @timed("rag.generate_answer")
+    def generate_answer(self, question, top_k=3, use_cache=True):
+        answer = self._metric_answer(question)
+        if answer is not None:
+            return answer
+
+        query_embedding = self.embedding_service.encode([question])
+
+        use_cache = self._use_cache(use_cache)
+        if use_cache:
+            # Read once: an answer retrieved during a re-index must not be stored under the new version
+            index_version = self.index_version
+            signature = self._cache_signature(question, top_k)
+            cached = self.answer_cache.get(query_embedding[0], index_version, signature)
+            if cached is not None:
+                return cached
+
+        results = self.retrieve_context(question, top_k=top_k, query_embedding=query_embedding)
+        with span("llm.generate", model="gemini"):
+            response = self.gemini_model.generate_content(self._build_prompt(question, results))
+        citation_text = self._format_citations(results)
+
+        answer = {
             "answer": response.text + citation_text,
             "documents": results["documents"],
-            "metadatas": results["metadatas"]
+            "metadatas": results["metadatas"],
+            "context_stats": results["context_stats"]
         }
+        if use_cache:
+            self.answer_cache.put(question, query_embedding[0], answer, results["ids"][0],
+                                  index_version, signature)
+        return dict(answer, cached=False)
+
+    @timed("rag.generate_answer_stream")
+    def generate_answer_stream(self, question, top_k=3, use_cache=True):
+        """
+        Streaming variant of generate_answer.
+
+        Yields text pieces: the citations first, as soon as retrieval is done, then the
+        answer tokens as Gemini produces them. A cache hit or an answer from the metrics
+        store is yielded in one piece.
+        """
+        answer = self._metric_answer(question)
+        if answer is not None:
+            yield answer["answer"]
+            return
+
+        query_embedding = self.embedding_service.encode([question])
+
+        use_cache = self._use_cache(use_cache)
+        if use_cache:
+            # Read once: an answer retrieved during a re-index must not be stored under the new version
+            index_version = self.index_version
+            signature = self._cache_signature(question, top_k)
+            cached = self.answer_cache.get(query_embedding[0], index_version, signature)
+            if cached is not None:
+                yield cached["answer"]
+                return
+
+        results = self.retrieve_context(question, top_k=top_k, query_embedding=query_embedding)
+        citation_text = self._format_citations(results)
+        yield citation_text + "\n\n"
+
+        parts = []
+        start = time.perf_counter()
+        with span("llm.generate_stream", model="gemini"):
+            for chunk in self.gemini_model.generate_content(self._build_prompt(question, results), stream=True):
+                text = getattr(chunk, "text", "")
+                if text:
+                    if not parts:
+                        observe("llm.first_token", time.perf_counter() - start, model="gemini")
+                    parts.append(text)
+                    yield text
+
+        if use_cache:
+            answer = {
+                "answer": "".join(parts) + citation_text,
+                "documents": results["documents"],
+                "metadatas": results["metadatas"],
+                "context_stats": results["context_stats"]
+            }
+            self.answer_cache.put(question, query_embedding[0], answer, results["ids"][0],
+                                  index_version, signature)
+
 #----------------------------------------------------------------------------------------------------------------------------
+# Process-wide agent registry: the RAGAgent (embedding model, Chroma client, Gemini model)
+# is built once on first use and kept warm for every later tool call.
+_agent = None
+_agent_lock = threading.Lock()
+_last_change_check = None
+# One indexPDF run at a time; held outside _agent_lock so requests keep being served
+_index_lock = threading.Lock()
+_index_thread = None
+
+
+def _reindex(agent, retry_failed=False):
+    with _index_lock:
+        agent.indexPDF(retry_failed=retry_failed)
+
+
+def _reindex_in_background(agent):
+    global _index_thread
+    with _agent_lock:
+        if _index_thread is not None and _index_thread.is_alive():
+            return
+        _index_thread = threading.Thread(target=_reindex, args=(agent,), name="rag-reindex", daemon=True)
+        _index_thread.start()
+
+
+def get_rag_agent(reindex=False):
+    """
+    Return the shared RAGAgent, building it lazily on first use.
+
+    Indexing runs only when `reindex` is True, when the collection is empty, or when the
+    Dataset tree changed. The change check is throttled to once per CHANGE_CHECK_INTERVAL
+    seconds, so the warm path is just retrieval plus generation. A changed Dataset is
+    re-indexed in a background thread while requests are answered from the current
+    index; only an empty collection (nothing to answer from) is indexed in the caller.
+    """
+    global _agent, _last_change_check
+    with _agent_lock:
+        if _agent is None:
+            start = time.perf_counter()
+            _agent = RAGAgent()
+            print(f"🔥 RAGAgent ready in {time.perf_counter() - start:.2f}s")
+            print(_agent.embedding_service.report())
+            _last_change_check = None
+        agent = _agent
+
+        now = time.monotonic()
+        check = not reindex and (_last_change_check is None or now - _last_change_check >= CHANGE_CHECK_INTERVAL)
+        if reindex or check:
+            _last_change_check = now
+
+    if reindex:
+        _reindex(agent, retry_failed=True)
+    elif check and agent.needs_indexing():
+        if agent.collection.count() == 0:
+            print("🔄 Collection is empty, indexing...")
+            _reindex(agent)
+        else:
+            print("🔄 Dataset changed, re-indexing in the background...")
+            _reindex_in_background(agent)
+    return agent
+
+
+def reset_rag_agent():
+    """Drop the shared agent so the next get_rag_agent() call builds a fresh one."""
+    global _agent, _last_change_check
+    with _agent_lock:
+        _agent = None
+        _last_change_check = None
+
+
 def generateAnswerTool(question):
-    print("Generate answer tool test")
-    agent=RAGAgent()
-    agent.indexPDF()
-    return agent.generate_answer(question)
+    return get_rag_agent().generate_answer(question)
+
+
+def generateAnswerStream(question):
+    return get_rag_agent().generate_answer_stream(question)
     
 
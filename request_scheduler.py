@@ -0,0 +1,218 @@
+# request_scheduler.py
+#
+# Bounded, per-agent execution of chat requests for the Gradio app. The coordinator is
+# synchronous (Gemini, NewsAPI, Chroma), so every request runs in a worker thread; each
+# agent type gets its own lane:
+#
+# - its own thread pool (REQUEST_LIMIT_<LANE> workers), so slow RAG questions can only
+#   occupy the RAG lane and a quick price lookup never waits behind them,
+# - a bounded queue (REQUEST_QUEUE_<LANE>): once limit + queue requests are in the lane,
+#   new ones are rejected immediately with Overloaded instead of piling up (backpressure),
+# - a per-request deadline (REQUEST_DEADLINE_<LANE> seconds): the caller gets
+#   DeadlineExceeded; a request that has not started yet is dropped from the queue.
+#   A call that is already running cannot be stopped, so it keeps its slot in the lane
+#   until its thread returns: abandoned calls count against the lane's limit.
+#
+# The async entry points (run / stream) are awaited by the Gradio handlers, so the event
+# loop never blocks on a request.
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# lane -> (workers, queued requests, deadline in seconds)
+DEFAULT_LANES = {
+    "web_agent": (8, 32, 30.0),
+    "analytics_agent": (2, 16, 120.0),
+}
+LATENCY_WINDOW = 1000   # latencies kept per lane for the percentiles
+
+_DONE = object()
+
+
+class Overloaded(Exception):
+    """The lane's workers and queue are full; the request was not accepted."""
+
+
+class DeadlineExceeded(Exception):
+    """The request did not finish within its lane's deadline."""
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of `values` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Lane:
+    def __init__(self, name, workers, max_queue, deadline):
+        """
+        Args:
+            name (str): Agent type ("web_agent", "analytics_agent").
+            workers (int): Requests of this type running at the same time.
+            max_queue (int): Requests allowed to wait for a worker.
+            deadline (float): Seconds a request may take, queueing included.
+        """
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"lane-{name}")
+        self.in_flight = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"accepted": 0, "completed": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.stats["rejected"] += 1
+                raise Overloaded(f"{self.name}: {self.in_flight} requests in flight")
+            self.in_flight += 1
+            self.stats["accepted"] += 1
+
+    def release(self, future=None):
+        """Free the slot taken by acquire(); used as done-callback of the worker's future."""
+        with self._lock:
+            self.in_flight -= 1
+
+    def submit(self, fn, *args):
+        """Start fn(*args) in the lane's pool; its slot is freed when the call has returned."""
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.release()
+            raise
+        future.add_done_callback(self.release)
+        return future
+
+    def record(self, outcome, seconds):
+        with self._lock:
+            self.stats[outcome] += 1
+            if outcome == "completed":
+                self.latencies.append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = list(self.latencies)
+            return dict(self.stats, in_flight=self.in_flight, workers=self.workers, max_queue=self.max_queue,
+                        p50=percentile(latencies, 50), p95=percentile(latencies, 95),
+                        p99=percentile(latencies, 99))
+
+
+class RequestScheduler:
+    def __init__(self, lanes=None):
+        """
+        Args:
+            lanes (dict): lane name -> (workers, max_queue, deadline); default: DEFAULT_LANES,
+                each value overridable via REQUEST_LIMIT_<LANE>, REQUEST_QUEUE_<LANE> and
+                REQUEST_DEADLINE_<LANE> (lane name upper-cased, e.g. REQUEST_LIMIT_WEB_AGENT).
+        """
+        self.lanes = {}
+        for name, (workers, max_queue, deadline) in (lanes or DEFAULT_LANES).items():
+            key = name.upper()
+            self.lanes[name] = Lane(
+                name,
+                int(os.getenv(f"REQUEST_LIMIT_{key}", workers)),
+                int(os.getenv(f"REQUEST_QUEUE_{key}", max_queue)),
+                float(os.getenv(f"REQUEST_DEADLINE_{key}", deadline)),
+            )
+
+    def _lane(self, name):
+        if name not in self.lanes:
+            raise ValueError(f"Unknown lane: {name}")
+        return self.lanes[name]
+
+    async def run(self, lane_name, fn, *args, deadline=None):
+        """
+        Run fn(*args) in the lane's thread pool and await the result.
+
+        Raises:
+            Overloaded: The lane is full (raised before anything runs).
+            DeadlineExceeded: No result within `deadline` (default: the lane's deadline).
+        """
+        lane = self._lane(lane_name)
+        lane.acquire()
+        start = time.perf_counter()
+        future = lane.submit(fn, *args)
+        outcome = "errors"
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), deadline or lane.deadline)
+            outcome = "completed"
+            return result
+        except asyncio.TimeoutError:
+            outcome = "timeouts"
+            future.cancel()   # only succeeds while still queued
+            raise DeadlineExceeded(f"{lane_name}: no answer after {deadline or lane.deadline:g}s") from None
+        finally:
+            lane.record(outcome, time.perf_counter() - start)
+
+    async def stream(self, lane_name, gen_fn, *args, deadline=None):
+        """
+        Run the generator gen_fn(*args) in the lane's thread pool and yield its items.
+
+        The generator is driven by a single worker thread from start to end; items are
+        handed over to the event loop as they are produced. The deadline applies to the
+        whole stream. Raises like run().
+        """
+        lane = self._lane(lane_name)
+        lane.acquire()
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            try:
+                for item in gen_fn(*args):
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+                loop.call_soon_threadsafe(items.put_nowait, _DONE)
+            except BaseException as e:
+                loop.call_soon_threadsafe(items.put_nowait, e)
+
+        future = lane.submit(produce)
+        limit = deadline or lane.deadline
+        outcome = "errors"
+        try:
+            while True:
+                remaining = limit - (time.perf_counter() - start)
+                try:
+                    item = await asyncio.wait_for(items.get(), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    outcome = "timeouts"
+                    raise DeadlineExceeded(f"{lane_name}: no answer after {limit:g}s") from None
+                if item is _DONE:
+                    outcome = "completed"
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+            future.cancel()
+            lane.record(outcome, time.perf_counter() - start)
+
+    def stats(self):
+        """Per lane: accepted / completed / rejected / timeouts / errors, in flight, p50/p95/p99 seconds."""
+        return {name: lane.snapshot() for name, lane in self.lanes.items()}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide RequestScheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
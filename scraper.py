@@ -0,0 +1,195 @@
+# scraper.py
+#
+# Concurrent scraping engine for the headline sources in SCRAPING_SOURCES.
+# All sources are fetched in parallel with a per-source deadline, headlines are extracted
+# with the fastest available HTML backend (selectolax > BeautifulSoup+lxml >
+# BeautifulSoup+html.parser), deduplicated across sources, and the engine stops waiting
+# as soon as enough articles have been collected.
+
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+
+from http_client import http_get
+
+SCRAPE_DEADLINE = float(os.getenv("SCRAPE_DEADLINE", "6"))
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    try:
+        # selectolax < 0.3.13 only ships the modest backend
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+
+try:
+    import lxml  # noqa: F401 - only checks that the BeautifulSoup "lxml" backend is usable
+    _BS4_FEATURES = "lxml"
+except ImportError:
+    _BS4_FEATURES = "html.parser"
+
+# Headline sources; a source may also set its own "deadline" in seconds
+SCRAPING_SOURCES = {
+    "CNBC": {
+        "base_url": "https://www.cnbc.com/search/?query={query}",
+        "item_selector": "a.Card-title",
+        "title_selector": "a.Card-title",
+        "link_prefix": ""
+    },
+    "Yahoo": {
+        "base_url": "https://finance.yahoo.com/quote/{query}/news",
+        "item_selector": "li.js-stream-content h3 a",
+        "title_selector": "li.js-stream-content h3 a",
+        "link_prefix": "https://finance.yahoo.com"
+    },
+    "MarketWatch": {
+        "base_url": "https://www.marketwatch.com/search?q={query}",
+        "item_selector": "h3.article__headline a",
+        "title_selector": "h3.article__headline a",
+        "link_prefix": ""
+    }
+}
+
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="scrape")
+
+
+def available_backends():
+    backends = []
+    if HTMLParser is not None:
+        backends.append("selectolax")
+    if _BS4_FEATURES == "lxml":
+        backends.append("bs4-lxml")
+    backends.append("bs4-html.parser")
+    return backends
+
+
+DEFAULT_BACKEND = available_backends()[0]
+
+
+def _extract_selectolax(html, config, max_articles):
+    results = []
+    tree = HTMLParser(html)
+    for item in tree.css(config["item_selector"]):
+        # item and title selectors are usually the same anchor
+        tag = item if config["title_selector"] == config["item_selector"] else item.css_first(config["title_selector"])
+        if tag is None:
+            continue
+        title = tag.text(strip=True)
+        if title:
+            results.append((title, tag.attributes.get("href") or "#"))
+            if len(results) >= max_articles:
+                break
+    return results
+
+
+def _extract_bs4(html, config, max_articles, features):
+    from bs4 import BeautifulSoup
+    results = []
+    soup = BeautifulSoup(html, features)
+    for item in soup.select(config["item_selector"], limit=max_articles * 3):
+        tag = item if config["title_selector"] == config["item_selector"] else item.select_one(config["title_selector"])
+        if tag is None:
+            continue
+        title = tag.get_text(strip=True)
+        if title:
+            results.append((title, tag.get("href", "#")))
+            if len(results) >= max_articles:
+                break
+    return results
+
+
+def extract_headlines(html, config, max_articles=3, backend=None):
+    """
+    Headlines from one page.
+
+    Returns:
+        list[tuple[str, str]]: (title, absolute link)
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend == "selectolax":
+        pairs = _extract_selectolax(html, config, max_articles)
+    elif backend == "bs4-lxml":
+        pairs = _extract_bs4(html, config, max_articles, "lxml")
+    else:
+        pairs = _extract_bs4(html, config, max_articles, "html.parser")
+    return [
+        (title, link if link.startswith("http") else config["link_prefix"] + link)
+        for title, link in pairs
+    ]
+
+
+def scrape_source(source_name, config, query, max_articles=3, deadline=SCRAPE_DEADLINE):
+    url = config["base_url"].format(query=query)
+    response = http_get(url, provider="scrape", retries=0, timeout=deadline)
+    return extract_headlines(response.text, config, max_articles)
+
+
+def _headline_key(title):
+    return re.sub(r"\W+", " ", title.lower()).strip()
+
+
+def scrape_sources(sources, query, max_articles=3, total_limit=None, deadline=SCRAPE_DEADLINE):
+    """
+    Scrape every source in parallel.
+
+    Args:
+        sources (dict): SCRAPING_SOURCES-style config.
+        query (str): Search term.
+        max_articles (int): Headlines per source.
+        total_limit (int): Stop waiting once this many unique headlines are collected.
+        deadline (float): Default per-source deadline; a source config may set its own "deadline".
+
+    Returns:
+        dict: source name -> list[(title, link)], an Exception, "timeout" (missed the
+              deadline) or "skipped" (total_limit was reached first), in `sources` order.
+              A headline several sources return is kept for the first of them in `sources`
+              order, whichever answered first.
+    """
+    start = time.monotonic()
+    overall = max([config.get("deadline", deadline) for config in sources.values()] or [deadline])
+    futures = {
+        _pool.submit(scrape_source, name, config, query, max_articles, config.get("deadline", deadline)): name
+        for name, config in sources.items()
+    }
+    results = {name: "timeout" for name in sources}
+    # Keys seen so far only decide when to stop; the dedup itself runs in `sources` order
+    # below, so which source keeps a shared headline does not depend on response order
+    arrived = set()
+    pending_marker = "timeout"
+    try:
+        for future in as_completed(futures, timeout=overall):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+                continue
+            arrived.update(_headline_key(title) for title, _ in results[name])
+            if total_limit and len(arrived) >= total_limit:
+                pending_marker = "skipped"
+                break
+    except FutureTimeout:
+        pass
+
+    for future, name in futures.items():
+        if results[name] == "timeout":
+            results[name] = pending_marker
+            future.cancel()
+
+    seen = set()
+    collected = 0
+    for name, headlines in results.items():
+        if not isinstance(headlines, list):
+            continue
+        unique = []
+        for title, link in headlines:
+            key = _headline_key(title)
+            if key not in seen:
+                seen.add(key)
+                unique.append((title, link))
+        results[name] = unique
+        collected += len(unique)
+    print(f"🕸️ Scraped {len(sources)} sources in {time.monotonic() - start:.2f}s, {collected} headlines")
+    return results
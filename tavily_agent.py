@@ -1,19 +1,29 @@
 # tavily_agent.py
 
-from langchain_tavily import TavilySearch
 from datetime import datetime
 from dotenv import load_dotenv
+from ttl_cache import ttl_cached, is_ok_result, ErrorText, DISK_DIR as CACHE_DIR, STALE_WHILE_REVALIDATE
+from lazy_init import lazy
 import os
 
 load_dotenv()
 
-web_search = TavilySearch(max_results=5)
 
+def _build_web_search():
+    from langchain_tavily import TavilySearch
+    return TavilySearch(max_results=5)
+
+
+# The Tavily client is created on the first search, not on import
+web_search = lazy("tavily_client", _build_web_search)
+
+@ttl_cached("tavily", float(os.getenv("TAVILY_CACHE_TTL", "1800")), max_entries=128, disk_dir=CACHE_DIR,
+            stale_while_revalidate=STALE_WHILE_REVALIDATE, should_cache=is_ok_result)
 def tavily_search_with_date(query):
     try:
-        results = web_search.invoke(query)
+        results = web_search.get().invoke(query)
     except Exception as e:
-        return [f"❌ Fehler bei TavilySearch: {e}"]
+        return [ErrorText(f"❌ Fehler bei TavilySearch: {e}")]
 
     output = []
     for r in results.get("results", []):
@@ -32,4 +42,4 @@ def tavily_search_with_date(query):
 
         output.append(f"[Tavily] {title}\n📆 {date_str}\n{url}\n{content}")
     
-    return output if output else ["❌ Keine Tavily-Ergebnisse."]
\ No newline at end of file
+    return output if output else [ErrorText("❌ Keine Tavily-Ergebnisse.")]
\ No newline at end of file
@@ -0,0 +1,50 @@
+import json
+import threading
+
+import numpy as np
+
+from answer_cache import SemanticAnswerCache
+
+
+def _vector(i, dim=16):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i % dim] = 1.0
+    vector[(i * 7 + 3) % dim] += 0.5
+    return vector
+
+
+def test_put_does_not_write_until_flush(tmp_path):
+    path = tmp_path / "answer_cache.json"
+    cache = SemanticAnswerCache(str(path), flush_interval=0)
+    cache.put("q", _vector(0), {"answer": "a"}, ["c1"], "v1", "sig")
+    assert not path.exists()
+
+    cache.flush()
+    assert len(json.loads(path.read_text())["entries"]) == 1
+
+
+def test_concurrent_puts_and_saves_keep_a_valid_file(tmp_path):
+    path = tmp_path / "answer_cache.json"
+    cache = SemanticAnswerCache(str(path), max_entries=10000, flush_interval=0.01)
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(50):
+                cache.put(f"q{n}-{i}", _vector(n * 50 + i), {"answer": str(i)}, [f"c{i}"], "v1", "sig")
+                if i % 10 == 0:
+                    cache.save()
+        except Exception as e:   # e.g. FileNotFoundError from a shared tmp file
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    cache.flush()
+
+    assert errors == []
+    assert len(json.loads(path.read_text())["entries"]) == 400
+    assert [p.name for p in tmp_path.iterdir()] == ["answer_cache.json"]
+    assert len(SemanticAnswerCache(str(path), max_entries=10000, flush_interval=0)) == 400
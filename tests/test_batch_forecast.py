@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import batch_forecast
+
+
+class _Engine:
+    def seed(self, *args):
+        pass
+
+
+def _history(ticker):
+    return pd.DataFrame({"ds": pd.bdate_range("2024-01-01", periods=20), "y": range(1, 21)})
+
+
+def _task(fail=()):
+    def forecast_task(ticker, model_type, df, horizons):
+        if model_type in fail:
+            raise RuntimeError("fit failed")
+        ds = pd.bdate_range(df["ds"].iloc[-1], periods=max(horizons) + 1)[1:]
+        forecast = pd.DataFrame({"ds": ds, "yhat": float(len(fail))})
+        return {"forecast": forecast, "blob": b"", "fit_seconds": 0.1, "mape": {h: 1.0 for h in horizons}}
+    return forecast_task
+
+
+def test_failed_cells_keep_their_previous_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_forecast, "BATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(batch_forecast, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(batch_forecast, "load_price_history", _history)
+    monkeypatch.setattr(batch_forecast, "get_forecast_engine", _Engine)
+
+    monkeypatch.setattr(batch_forecast, "forecast_task", _task())
+    batch_forecast.run_batch(["AAPL", "MSFT"], ["Prophet", "ARIMA"], [5], workers=2)
+    monkeypatch.setattr(batch_forecast, "forecast_task", _task(fail=("ARIMA",)))
+    metrics = batch_forecast.run_batch(["AAPL"], ["Prophet", "ARIMA"], [5], workers=2)
+
+    stale = {(r.ticker, r.model): r.stale for r in metrics.itertuples()}
+    assert stale == {("AAPL", "Prophet"): False, ("AAPL", "ARIMA"): True,
+                     ("MSFT", "Prophet"): False, ("MSFT", "ARIMA"): False}
+    forecasts = pd.read_parquet(tmp_path / batch_forecast.FORECASTS_FILE)
+    yhat = forecasts.groupby(["ticker", "model"])["yhat"].unique()
+    # The refitted cell has the new forecast, the failed one still has the previous run's
+    assert list(yhat[("AAPL", "Prophet")]) == [1.0] and list(yhat[("AAPL", "ARIMA")]) == [0.0]
+    assert len(forecasts) == 4 * 5
+    assert sorted(pd.read_parquet(tmp_path / batch_forecast.HISTORY_FILE)["ticker"].unique()) == ["AAPL", "MSFT"]
@@ -0,0 +1,24 @@
+import numpy as np
+
+from context_builder import ContextBuilder
+
+
+def _candidates(n, dim=16):
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((n, dim)).astype(np.float32)
+    ids = [f"c{i}" for i in range(n)]
+    documents = [f"Chunk {i} about revenue and operating income in fiscal 2023." for i in range(n)]
+    metadatas = [{"source": f"f{i}.pdf", "company": "Apple", "year": "2023"} for i in range(n)]
+    return ids, documents, metadatas, embeddings
+
+
+def test_top_k_caps_the_packed_chunks():
+    ids, documents, metadatas, embeddings = _candidates(12)
+    builder = ContextBuilder(max_chunks=8)
+
+    packed = builder.build("revenue", embeddings[0], ids, documents, metadatas, embeddings, max_chunks=3)
+    assert packed["context_stats"]["chunks"] == 3 and len(packed["ids"][0]) == 3
+
+    # The per-call cap never raises the builder's own limit
+    packed = builder.build("revenue", embeddings[0], ids, documents, metadatas, embeddings, max_chunks=20)
+    assert packed["context_stats"]["chunks"] == 8
@@ -0,0 +1,54 @@
+from batch_writer import BatchWriter
+from dedup_index import DedupIndex
+
+BOILERPLATE = ("This report contains forward-looking statements within the meaning of the Private "
+               "Securities Litigation Reform Act of 1995 that involve risks and uncertainties.")
+
+
+class _Model:
+    def encode(self, documents, batch_size=None):
+        return [[float(len(d)), 1.0] for d in documents]
+
+
+class _Collection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.ids = []
+
+    def add(self, ids, documents, embeddings, metadatas):
+        if self.fail:
+            raise RuntimeError("disk full")
+        self.ids.extend(ids)
+
+
+def _make_id(text):
+    return str(hash(text))
+
+
+def test_duplicates_are_scoped_to_company_and_year():
+    index = DedupIndex()
+    first, new = index.assign(BOILERPLATE, "Apple/2023/10-Q-2023-apple.pdf", _make_id)
+    same_year, same_year_new = index.assign(BOILERPLATE, "Apple/2023/10-Q-Q2-2023-apple.pdf", _make_id)
+    other_year, other_year_new = index.assign(BOILERPLATE, "Apple/2024/10-Q-2024-apple.pdf", _make_id)
+
+    assert new and not same_year_new and same_year == first
+    assert other_year_new and other_year != first
+    assert index.metadata(first)["year"] == "2023"
+    assert index.metadata(other_year)["year"] == "2024"
+
+
+def test_signatures_are_committed_only_after_a_successful_write():
+    index = DedupIndex()
+    writer = BatchWriter(_Collection(fail=True), _Model(), listeners=[index])
+    chunk_id, _ = index.assign(BOILERPLATE, "Apple/2023/10-Q-2023-apple.pdf", _make_id)
+    writer.add(ids=[chunk_id], documents=[BOILERPLATE], metadatas=[index.metadata(chunk_id)])
+    writer.close()
+
+    assert chunk_id in writer.failed_ids and len(index) == 0
+    # The retried file writes the chunk again instead of referencing the lost one
+    assert index.assign(BOILERPLATE, "Apple/2023/10-Q-2023-apple.pdf", _make_id) == (chunk_id, True)
+
+    writer = BatchWriter(_Collection(), _Model(), listeners=[index])
+    writer.add(ids=[chunk_id], documents=[BOILERPLATE], metadatas=[index.metadata(chunk_id)])
+    writer.close()
+    assert len(index) == 1 and not index.pending
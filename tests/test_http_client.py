@@ -0,0 +1,93 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_client
+from http_client import RateLimited, TokenBucket, http_get
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, so pooled connections can be reused
+
+    def do_GET(self):
+        server = self.server
+        status, headers = server.script.pop(0) if server.script else (200, {})
+        server.seen.append((time.monotonic(), self.client_address[1], status))
+        body = b'{"ok": true}' if status == 200 else b'{"error": "busy"}'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.script, server.seen = [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/v2/everything"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    def install(capacity, period):
+        monkeypatch.setitem(http_client._buckets, "stub", TokenBucket(capacity, period))
+    return install
+
+
+def test_retry_after_is_honored_on_a_pooled_connection(stub):
+    server, url = stub
+    server.script = [(503, {"Retry-After": "0.3"})]
+
+    start = time.monotonic()
+    response = http_get(url, retries=2)
+
+    assert response.status_code == 200 and response.json() == {"ok": True}
+    assert [status for _, _, status in server.seen] == [503, 200]
+    assert server.seen[1][0] - server.seen[0][0] >= 0.3
+    assert time.monotonic() - start < 2
+    # Both attempts went over the same keep-alive connection
+    assert server.seen[0][1] == server.seen[1][1]
+
+
+def test_429_retry_waits_for_a_rate_limit_token(stub, bucket):
+    server, url = stub
+    server.script = [(429, {"Retry-After": "0"})]
+    bucket(1, 0.5)   # one token, the next one after 0.5s
+
+    response = http_get(url, provider="stub", retries=1, max_wait=2)
+
+    assert response.status_code == 200
+    assert [status for _, _, status in server.seen] == [429, 200]
+    assert server.seen[1][0] - server.seen[0][0] >= 0.4
+
+
+def test_retry_gives_up_when_no_token_arrives_in_time(stub, bucket):
+    server, url = stub
+    server.script = [(429, {"Retry-After": "0"})]
+    bucket(1, 60)
+
+    with pytest.raises(RateLimited):
+        http_get(url, provider="stub", retries=1, max_wait=0.1)
+    assert [status for _, _, status in server.seen] == [429]
+
+
+def test_retries_are_limited(stub):
+    server, url = stub
+    server.script = [(503, {"Retry-After": "0"})] * 3
+
+    response = http_get(url, retries=1)
+
+    assert response.status_code == 503
+    assert len(server.seen) == 2
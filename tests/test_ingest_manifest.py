@@ -0,0 +1,29 @@
+from ingest_manifest import IngestManifest
+
+
+class _Job:
+    def __init__(self, path, chunk_ids=()):
+        self.path = path
+        self.size = self.mtime = self.sha256 = None
+        self.chunk_ids = list(chunk_ids)
+
+
+def test_failed_file_keeps_its_chunks_until_it_is_retried(tmp_path):
+    folder = tmp_path / "Dataset" / "Apple" / "2023"
+    folder.mkdir(parents=True)
+    path = folder / "10-K-2023-apple.pdf"
+    path.write_bytes(b"%PDF-1.4\n")
+    manifest = IngestManifest(str(tmp_path / "store"), str(tmp_path / "Dataset"))
+
+    job = _Job(str(path))
+    manifest.plan([job])
+    job.chunk_ids = ["written-1", "written-2"]   # first batch written, the second one failed
+    manifest.record_failure(job, "write: batch write failed")
+    key = manifest.key(str(path))
+    assert manifest.files[key]["chunk_ids"] == ["written-1", "written-2"]
+
+    # Without retry_failed the file is left alone, with it the partial chunks are stale
+    assert manifest.plan([_Job(str(path))]).unchanged
+    plan = manifest.plan([_Job(str(path))], retry_failed=True)
+    assert [manifest.key(j.path) for j in plan.changed] == [key]
+    assert manifest.stale_chunk_ids([key]) == ["written-1", "written-2"]
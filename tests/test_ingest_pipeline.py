@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+pytest.importorskip("unstructured.staging.base")
+
+from unstructured.staging.base import elements_from_dicts
+
+from dedup_index import DedupIndex
+from element_cache import cache_key, store_elements
+from ingest_manifest import file_sha256
+from ingest_pipeline import PARTITION_PARAMS, run_ingestion
+
+
+class _Abort(BaseException):
+    pass
+
+
+class _Model:
+    def __init__(self, abort=False):
+        self.abort = abort
+
+    def encode(self, documents, batch_size=None):
+        if self.abort:
+            raise _Abort()
+        return [[float(len(d)), 1.0] for d in documents]
+
+
+class _Collection:
+    def __init__(self):
+        self.ids = []
+
+    def add(self, ids, documents, embeddings, metadatas):
+        self.ids.extend(ids)
+
+
+def _workspace(tmp_path, n_files=6):
+    data_dir = tmp_path / "Dataset"
+    cache_dir = tmp_path / "element_cache"
+    for i in range(n_files):
+        folder = data_dir / "Apple" / str(2020 + i)
+        folder.mkdir(parents=True)
+        path = folder / f"10-K-{2020 + i}-apple.pdf"
+        path.write_bytes(f"%PDF-1.4\n% {i}\n".encode())
+        elements = elements_from_dicts([
+            {"type": "Title", "text": f"Item {i}. Business", "metadata": {"page_number": 1}},
+            {"type": "NarrativeText", "metadata": {"page_number": 1},
+             "text": f"Apple designs, manufactures and markets smartphones, report number {i}, in detail."},
+        ])
+        store_elements(str(cache_dir), cache_key(file_sha256(str(path)), PARTITION_PARAMS), elements)
+    return str(data_dir), str(cache_dir)
+
+
+def _run(target):
+    # A pipeline that does not wind down would block here instead of failing the test run
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=target()), daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive(), "run_ingestion did not return"
+    return result.get("value")
+
+
+def test_failing_make_id_only_fails_its_file(tmp_path):
+    data_dir, cache_dir = _workspace(tmp_path)
+
+    def make_id(text):
+        if "number 2" in text:
+            raise ValueError("bad chunk")
+        return str(hash(text))
+
+    collection = _Collection()
+    stats = _run(lambda: run_ingestion(collection, data_dir, _Model(), make_id, workers=1, queue_size=1,
+                                       cache_dir=cache_dir, dedup=DedupIndex()))
+    assert [path.split("/")[-1] for path, _, _ in stats.files_failed] == ["10-K-2022-apple.pdf"]
+    assert stats.files_indexed == 5 and len(collection.ids) == 5
+
+
+def test_aborted_run_stops_every_stage(tmp_path):
+    data_dir, cache_dir = _workspace(tmp_path)
+    dedup = DedupIndex()
+
+    def ingest():
+        try:
+            run_ingestion(_Collection(), data_dir, _Model(abort=True), lambda text: str(hash(text)),
+                          workers=1, queue_size=1, batch_size=1, cache_dir=cache_dir, dedup=dedup)
+        except _Abort:
+            return "aborted"
+
+    assert _run(ingest) == "aborted"
+    assert len(dedup) == 0 and not dedup.pending
@@ -0,0 +1,51 @@
+import pytest
+
+from metrics_store import MetricsStore, _period_date
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MetricsStore(str(tmp_path / "metrics.sqlite"))
+    rows = [
+        {"company": "Apple", "year": "2023", "period": "2023", "period_type": "FY", "form": "10-K",
+         "quarter": "", "metric": "revenue", "value": 383285.0, "unit": "USD millions", "page": 28,
+         "label": "total net sales"},
+        {"company": "Apple", "year": "2023", "period": "2023", "period_type": "FY", "form": "10-K",
+         "quarter": "", "metric": "operating_income", "value": 114301.0, "unit": "USD millions", "page": 28,
+         "label": "operating income"},
+    ]
+    store.replace_source("Apple/2023/10-K-2023-apple.pdf", rows)
+    return store
+
+
+@pytest.mark.parametrize("question", [
+    "What is revenue of Apple 2023?",
+    "How much revenue did Apple report in FY23?",
+    "Wie hoch war der Umsatz von Apple im Geschäftsjahr 2023?",
+])
+def test_plain_lookup_is_answered(store, question):
+    assert store.answer(question)["value"] == 383285.0
+
+
+@pytest.mark.parametrize("question", [
+    "What was Apple's iPhone revenue in 2023?",
+    "What was Apple's services revenue in 2023?",
+    "Why did Apple's revenue decline in 2023?",
+    "Explain Apple's revenue 2023",
+    "What was Apple's profit in 2023?",
+])
+def test_qualified_or_explanatory_questions_are_declined(store, question):
+    assert store.answer(question) is None
+
+
+def test_operating_profit_maps_to_operating_income(store):
+    answer = store.answer("What was Apple's operating profit in 2023?")
+    assert answer["metric"] == "operating_income" and answer["value"] == 114301.0
+
+
+def test_period_dates_follow_the_fiscal_year():
+    assert _period_date("2023", "FY", "Apple") == "2023-09-30"
+    assert _period_date("2023-Q1", "Q", "Apple") == "2022-12-31"
+    assert _period_date("2023-Q1", "Q", "Microsoft") == "2022-09-30"
+    assert _period_date("2024-Q1", "Q", "Nvidia") == "2023-04-30"
+    assert _period_date("2023-Q2", "Q", "Meta") == "2023-06-30"
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from request_scheduler import DeadlineExceeded, Overloaded, RequestScheduler
+
+
+def test_timed_out_call_keeps_its_slot_until_it_returns():
+    scheduler = RequestScheduler({"rag": (1, 0, 0.05)})
+    lane = scheduler.lanes["rag"]
+    finish = threading.Event()
+    done = threading.Event()
+
+    def slow():
+        finish.wait(5)
+        done.set()
+        return "late"
+
+    async def scenario():
+        with pytest.raises(DeadlineExceeded):
+            await scheduler.run("rag", slow)
+        # The worker is still busy with the abandoned call: no room for another one
+        assert lane.in_flight == 1
+        with pytest.raises(Overloaded):
+            await scheduler.run("rag", lambda: "next")
+
+        finish.set()
+        done.wait(5)
+        await asyncio.sleep(0.05)
+        assert lane.in_flight == 0
+        assert await scheduler.run("rag", lambda: "next") == "next"
+
+    asyncio.run(scenario())
+    stats = scheduler.stats()["rag"]
+    assert (stats["timeouts"], stats["rejected"], stats["completed"]) == (1, 1, 1)
+
+
+def test_stream_releases_its_slot_when_the_generator_stops():
+    scheduler = RequestScheduler({"web": (1, 0, 5.0)})
+
+    def tokens():
+        yield from ("a", "b", "c")
+
+    async def scenario():
+        return [item async for item in scheduler.stream("web", tokens)]
+
+    assert asyncio.run(scenario()) == ["a", "b", "c"]
+    # The slot is freed by the worker thread once the generator has returned
+    deadline = time.monotonic() + 2
+    while scheduler.lanes["web"].in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert scheduler.lanes["web"].in_flight == 0
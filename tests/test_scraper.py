@@ -0,0 +1,28 @@
+import time
+
+import scraper
+
+SOURCES = {"CNBC": {}, "Yahoo": {}, "MarketWatch": {}}
+
+
+def test_shared_headlines_stay_with_the_first_source_in_config_order(monkeypatch):
+    pages = {
+        "CNBC": (0.2, [("Apple beats estimates", "https://cnbc/1"), ("iPhone sales up", "https://cnbc/2")]),
+        "Yahoo": (0.0, [("Apple Beats Estimates!", "https://yahoo/1"), ("Services grow", "https://yahoo/2")]),
+        "MarketWatch": (0.1, [("iPhone sales up", "https://mw/1")]),
+    }
+
+    def scrape_source(name, config, query, max_articles=3, deadline=None):
+        delay, headlines = pages[name]
+        time.sleep(delay)
+        return headlines
+
+    monkeypatch.setattr(scraper, "scrape_source", scrape_source)
+    results = scraper.scrape_sources(SOURCES, "AAPL", deadline=2)
+
+    # Yahoo and MarketWatch answered first, CNBC still keeps the headlines it shares with them
+    assert results == {
+        "CNBC": [("Apple beats estimates", "https://cnbc/1"), ("iPhone sales up", "https://cnbc/2")],
+        "Yahoo": [("Services grow", "https://yahoo/2")],
+        "MarketWatch": [],
+    }
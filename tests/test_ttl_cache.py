@@ -0,0 +1,38 @@
+import threading
+
+from ttl_cache import ErrorText, TTLCache, is_ok_result
+
+
+def test_an_error_anywhere_in_a_list_is_not_cached():
+    assert is_ok_result(["- Apple beats estimates", "- Fehler im Chip-Design behoben"])
+    assert not is_ok_result(["- Apple beats estimates", ErrorText("Fehler bei NewsAPI: timeout")])
+    assert not is_ok_result(ErrorText("Keine Daten für AAPL."))
+    assert not is_ok_result([])
+
+    cache = TTLCache("test-partial", 60, should_cache=is_ok_result)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return ["- first", ErrorText("Fehler bei NewsAPI: timeout")]
+
+    cache.get_or_load("k", loader)
+    cache.get_or_load("k", loader)
+    assert len(calls) == 2 and cache.stats()["not_cached"] == 2
+
+
+def test_stats_count_every_concurrent_lookup():
+    cache = TTLCache("test-stats", 60)
+    cache.get_or_load("k", lambda: "v")
+
+    def worker():
+        for _ in range(2000):
+            cache.get_or_load("k", lambda: "v")
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (8 * 2000, 1)
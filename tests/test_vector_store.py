@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+import vector_store
+from vector_store import FaissStore
+
+COMPANIES = ("Apple", "Meta", "Nvidia")
+
+
+def _corpus(n, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"c{i}" for i in range(n)]
+    metadatas = [{"company": COMPANIES[i % 3], "year": str(2022 + i % 2), "source": f"f{i % 7}.pdf"}
+                 for i in range(n)]
+    return ids, vectors, metadatas
+
+
+@pytest.fixture(params=["HNSW16,SQfp16", "HNSW16,SQ8"])
+def built(tmp_path, monkeypatch, request):
+    monkeypatch.setattr(vector_store, "FAISS_MMAP", True)
+    ids, vectors, metadatas = _corpus(1200)
+    store = FaissStore(str(tmp_path), spec=request.param)
+    store.add(ids=ids, embeddings=vectors.tolist(), documents=[f"doc {i}" for i in ids], metadatas=metadatas)
+    store.save()
+    return str(tmp_path), ids, vectors
+
+
+def test_delete_after_reopen_keeps_the_index(built):
+    path, ids, vectors = built
+    store = FaissStore(path)
+    assert store.mapped and store.count() == 1200
+
+    store.delete(ids=ids[:10])
+    store.save()
+
+    reopened = FaissStore(path)
+    assert reopened.count() == 1190
+    result = reopened.query(query_embeddings=[vectors[500].tolist()], n_results=1)
+    assert result["ids"] == [[ids[500]]]
+    assert reopened.get(ids=[ids[0]])["ids"] == []
+
+
+def test_compaction_after_reopen(built):
+    path, ids, vectors = built
+    store = FaissStore(path)
+    store.delete(ids=ids[:600])   # above FAISS_COMPACT_RATIO: save() rebuilds the index
+    store.save()
+
+    reopened = FaissStore(path)
+    assert reopened.count() == 600
+    result = reopened.query(query_embeddings=[vectors[900].tolist()], n_results=1, where={"company": COMPANIES[0]})
+    assert result["ids"] == [[ids[900]]]
+
+
+def test_add_after_reopen_is_saved(built):
+    path, ids, vectors = built
+    store = FaissStore(path)
+    store.add(ids=["new"], embeddings=[vectors[3].tolist()], documents=["new doc"],
+              metadatas=[{"company": "Apple", "year": "2024", "source": "x.pdf"}])
+    store.save()
+
+    reopened = FaissStore(path)
+    assert reopened.count() == 1201
+    assert reopened.get(ids=["new"])["documents"] == ["new doc"]
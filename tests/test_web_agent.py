@@ -0,0 +1,32 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import web_agent
+
+
+def test_queued_provider_is_not_reported_as_late(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(web_agent, "_provider_pool", pool)
+    monkeypatch.setitem(web_agent.PROVIDER_DEADLINES, "Slow", 0.3)
+    monkeypatch.setitem(web_agent.PROVIDER_DEADLINES, "Fast", 0.2)
+    monkeypatch.setitem(web_agent.PROVIDER_DEADLINES, "Waiting", 0.1)
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "slow"
+
+    def fast():
+        time.sleep(0.15)
+        return "fast"
+
+    blocker = pool.submit(slow)     # occupies the only worker for a while
+    threading.Timer(0.15, release.set).start()
+    results = web_agent.fetch_providers([("Fast", fast, ()), ("Waiting", lambda: "never", ())])
+
+    # Fast waited 0.15s for a worker and then ran 0.15s: within its 0.2s deadline from call start
+    assert results["Fast"] == ("ok", "fast")
+    assert results["Waiting"] == ("queued", None)
+    assert blocker.result() == "slow"
+    pool.shutdown()
@@ -0,0 +1,220 @@
+# ttl_cache.py
+#
+# TTL cache for the web agent's data sources (yfinance, Alpha Vantage, NewsAPI, Tavily).
+# A daily close or a news search doesn't change within minutes, so repeated questions are
+# served from memory instead of spending rate-limited API quota.
+#
+# - per-source TTL, bounded in-memory LRU tier, optional on-disk tier (pickle per key)
+# - optional stale-while-revalidate: an expired entry is returned immediately while a
+#   background thread refreshes it
+# - hit/miss/stale/eviction statistics per source
+
+import functools
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+_caches = {}
+
+
+DISK_DIR = os.getenv("WEB_CACHE_DIR") or None
+STALE_WHILE_REVALIDATE = os.getenv("WEB_CACHE_SWR", "0") == "1"
+
+
+class ErrorText(str):
+    """
+    Error / empty message of a web helper. The helpers report problems as text instead of
+    raising; it is shown like any other text but never cached (see is_ok_result).
+    """
+
+
+def is_ok_result(result):
+    """False for empty results and for results containing an ErrorText, in any list element."""
+    items = result if isinstance(result, list) else [result]
+    return bool(items) and all(item and not isinstance(item, ErrorText) for item in items)
+
+
+class TTLCache:
+    def __init__(self, name, ttl, max_entries=256, disk_dir=None, stale_while_revalidate=False,
+                 stale_ttl=None, should_cache=None):
+        """
+        Args:
+            name (str): Source name, used for stats and the disk sub-directory.
+            ttl (float): Seconds an entry is fresh.
+            max_entries (int): Capacity of the in-memory tier (LRU).
+            disk_dir (str): Directory for the on-disk tier; None disables it.
+            stale_while_revalidate (bool): Serve expired entries while refreshing in the background.
+            stale_ttl (float): How long past `ttl` an entry may still be served stale (default: ttl).
+            should_cache (callable): result -> bool; results failing it (e.g. error texts) are not stored.
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_ttl = ttl if stale_ttl is None else stale_ttl
+        self.should_cache = should_cache or (lambda result: True)
+
+        self._memory = OrderedDict()   # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._refreshing = set()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.errors = 0
+        _caches[name] = self
+
+    # -- storage tiers ----------------------------------------------------------------
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode()).hexdigest() + ".pkl")
+
+    def _read(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry, False
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    entry = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                return None, False
+            self._remember(key, entry)
+            return entry, True
+        return None, False
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    def _write(self, key, value):
+        entry = (time.time(), value)
+        self._remember(key, entry)
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                path = self._disk_path(key)
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"⚠️ Cache {self.name}: could not write to disk: {e}")
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    # -- public API -------------------------------------------------------------------
+
+    def _load(self, key, loader):
+        value = loader()
+        if self.should_cache(value):
+            self._write(key, value)
+        else:
+            self._count("errors")
+        return value
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._load(key, loader)
+                self._count("refreshes")
+            except Exception as e:
+                print(f"⚠️ Cache {self.name}: background refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"cache-refresh-{self.name}", daemon=True).start()
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for `key`, calling `loader()` on a miss."""
+        entry, from_disk = self._read(key)
+        now = time.time()
+        if entry is not None:
+            age = now - entry[0]
+            if age <= self.ttl:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += from_disk
+                return entry[1]
+            if self.stale_while_revalidate and age <= self.ttl + self.stale_ttl:
+                self._count("stale_hits")
+                self._refresh_in_background(key, loader)
+                return entry[1]
+
+        # Single-flight: concurrent misses for the same key share one upstream call
+        with self._key_lock(key):
+            entry, _ = self._read(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl:
+                self._count("hits")
+                return entry[1]
+            self._count("misses")
+            return self._load(key, loader)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "ttl": self.ttl,
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+                "refreshes": self.refreshes,
+                "evictions": self.evictions,
+                "not_cached": self.errors,
+            }
+
+
+def ttl_cached(name, ttl, **cache_kwargs):
+    """
+    Decorator caching a function's result per (args, kwargs) in a TTLCache called `name`.
+    The cache is reachable as `func.cache`.
+    """
+    def decorator(func):
+        cache = TTLCache(name, ttl, **cache_kwargs)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = repr((args, sorted(kwargs.items())))
+            return cache.get_or_load(key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def cache_stats():
+    """Statistics of every TTLCache in the process, by source name."""
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -0,0 +1,510 @@
+# vector_store.py
+#
+# Pluggable vector store behind RAGAgent. A store implements the part of Chroma's Collection
+# API that RAGAgent, BatchWriter and the BM25 / dedup rebuilds use (count, add, upsert, get,
+# query, update, delete), so the ingestion and retrieval code does not change per backend.
+#
+#   VECTOR_STORE=chroma   the persistent `sec_filings` collection (default, float32 HNSW)
+#   VECTOR_STORE=faiss    FaissStore: quantized FAISS index + SQLite id -> metadata sidecar
+#
+# FaissStore keeps persist_store/faiss/:
+#   index.faiss       FAISS_INDEX=hnsw: HNSW graph over int8 / float16 scalar-quantized
+#                     vectors (FAISS_STORAGE=int8|float16). FAISS_INDEX=ivfpq: IVF lists of
+#                     PQ codes (FAISS_PQ_M bytes per vector), candidates re-ranked on int8 /
+#                     float16 vectors (FAISS_STORAGE=pq: codes only, smallest, least exact).
+#                     Opened memory-mapped (FAISS_MMAP).
+#   sidecar.sqlite    position -> chunk id, document, metadata; company / year / source are
+#                     also held in memory, so `where` filters become a bitmap for the search
+#   pending.npy       float32 vectors added before the quantizer had enough training data
+#                     (searched exactly; a small corpus never leaves this stage)
+#
+# Deletes are tombstones excluded by the search bitmap; save() compacts the index once
+# FAISS_COMPACT_RATIO of it is dead. Distances are squared L2, like Chroma's default space.
+
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from bm25_index import matches_where
+
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+COLLECTION_NAME = "sec_filings"
+FAISS_DIR = "faiss"
+FAISS_INDEX = os.getenv("FAISS_INDEX", "hnsw")              # "hnsw" or "ivfpq"
+FAISS_STORAGE = os.getenv("FAISS_STORAGE", "int8")          # "int8", "float16" (ivfpq also "pq")
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "256"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))            # 384 dims -> 48 sub-vectors of 8 dims, 48 bytes
+FAISS_REFINE_K = int(os.getenv("FAISS_REFINE_K", "4"))      # ivfpq: PQ candidates per result to re-rank
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") != "0"
+FAISS_COMPACT_RATIO = 0.25
+# Filters that leave at most this many chunks scan the int8 / float16 codes instead of the graph
+EXACT_FILTER_LIMIT = int(os.getenv("FAISS_EXACT_FILTER_LIMIT", "4096"))
+STORE_VERSION = 1
+
+_FILTER_FIELDS = ("company", "year", "source")
+_SQ_TYPES = {"int8": "SQ8", "float16": "SQfp16"}
+
+
+def index_spec(kind=FAISS_INDEX, storage=FAISS_STORAGE, dim=384):
+    """faiss.index_factory string for the configured index type."""
+    if kind == "ivfpq":
+        m = next(m for m in range(min(FAISS_PQ_M, dim), 0, -1) if dim % m == 0)
+        spec = f"IVF{FAISS_NLIST},PQ{m}x8np"   # np: no polysemous training (6x slower, unused here)
+        return spec if storage == "pq" else f"{spec},Refine({_sq_type(storage)})"
+    if kind == "hnsw":
+        return f"HNSW{FAISS_HNSW_M},{_sq_type(storage)}"
+    raise ValueError(f"FAISS_INDEX must be 'hnsw' or 'ivfpq', got {kind!r}")
+
+
+def _sq_type(storage):
+    if storage not in _SQ_TYPES:
+        raise ValueError(f"FAISS_STORAGE must be one of {sorted(_SQ_TYPES)}, got {storage!r}")
+    return _SQ_TYPES[storage]
+
+
+def train_size(spec):
+    """Vectors needed before an index of `spec` is trained (faiss wants ~39 per centroid)."""
+    if spec.startswith("IVF"):
+        return 39 * max(FAISS_NLIST, 256)
+    if spec.endswith("SQ8"):
+        return 1000     # per-dimension min / max of the int8 quantizer
+    return 0
+
+
+class FaissStore:
+    def __init__(self, path, spec=None):
+        """
+        Args:
+            path (str): Directory holding index.faiss, sidecar.sqlite and pending.npy.
+            spec (str): faiss.index_factory string; default from FAISS_INDEX / FAISS_STORAGE.
+                A store that already exists keeps the spec it was built with.
+        """
+        import faiss
+        self._faiss = faiss
+        self.path = path
+        self.index_file = os.path.join(path, "index.faiss")
+        self.pending_file = os.path.join(path, "pending.npy")
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        self._conn = sqlite3.connect(os.path.join(path, "sidecar.sqlite"), check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                pos INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                alive INTEGER NOT NULL DEFAULT 1,
+                company TEXT, year TEXT, source TEXT,
+                document TEXT,
+                metadata TEXT
+            );
+            CREATE INDEX IF NOT EXISTS chunks_id ON chunks (id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        if meta and int(meta.get("version", 0)) != STORE_VERSION:
+            raise RuntimeError(f"{path} was written by an incompatible FaissStore version")
+        self.spec = meta.get("spec") or spec
+        self.dim = int(meta["dim"]) if meta.get("dim") else None
+        if spec and self.spec != spec:
+            print(f"⚠️ FAISS store {path} is built as {self.spec}; rebuild it to switch to {spec}")
+        self.dirty = False
+        self._load()
+
+    # -- state ------------------------------------------------------------------------
+
+    def _load(self):
+        rows = self._conn.execute("SELECT pos, id, alive, company, year, source FROM chunks ORDER BY pos").fetchall()
+        self.index = None
+        self.mapped = False
+        if os.path.exists(self.index_file):
+            self.index = self._read_index(mmap=FAISS_MMAP)
+        indexed = self.index.ntotal if self.index is not None else 0
+        self.pending = np.load(self.pending_file) if os.path.exists(self.pending_file) else \
+            np.zeros((0, self.dim or 0), dtype=np.float32)
+
+        stored = indexed + len(self.pending)
+        if len(rows) != stored:
+            # Sidecar rows are committed per write, vectors on save(): drop rows without a vector
+            print(f"⚠️ FAISS store {self.path}: {len(rows) - stored} chunks were not saved; re-index to restore them")
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks WHERE pos >= ?", (stored,))
+            rows = rows[:stored]
+
+        self.ids = [row[1] for row in rows]                    # position -> chunk id
+        self.alive = np.array([row[2] for row in rows], dtype=bool)
+        self.id_to_pos = {row[1]: row[0] for row in rows if row[2]}
+        self.columns = {}                                      # field -> (codes, values, lookup)
+        for i, field in enumerate(_FILTER_FIELDS):
+            values, lookup = [], {}
+            codes = np.empty(len(rows), dtype=np.int32)
+            for pos, row in enumerate(rows):
+                codes[pos] = self._intern(values, lookup, row[3 + i])
+            self.columns[field] = [codes, values, lookup]
+
+    @staticmethod
+    def _intern(values, lookup, value):
+        value = "" if value is None else str(value)
+        if value not in lookup:
+            lookup[value] = len(values)
+            values.append(value)
+        return lookup[value]
+
+    def _read_index(self, mmap):
+        faiss = self._faiss
+        flags = 0
+        if mmap:
+            # IO_FLAG_MMAP_IFC maps flat codes (HNSW storage, re-rank vectors) in place; plain
+            # IVF-PQ lists use IO_FLAG_MMAP. The two flags cannot be combined.
+            flat = "HNSW" in self.spec or "Refine" in self.spec
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) if flat else faiss.IO_FLAG_MMAP
+        index = faiss.read_index(self.index_file, flags)
+        self.mapped = bool(flags)
+        return index
+
+    def _writable(self):
+        """The index, copied into memory if it is memory-mapped (mapped indexes are read-only)."""
+        if self.mapped:
+            # clone_index() would keep viewing the mapped codes, so read a private copy
+            self.index = self._read_index(mmap=False)
+            self.dirty = True
+        return self.index
+
+    def _set_meta(self, **values):
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                   [(k, str(v)) for k, v in values.items()])
+
+    def count(self):
+        with self._lock:
+            return len(self.id_to_pos)
+
+    def __len__(self):
+        return self.count()
+
+    # -- writes -----------------------------------------------------------------------
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        """Store new chunks; ids that are already stored are ignored, like collection.add."""
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+        with self._lock:
+            keep, seen = [], set()
+            for i, chunk_id in enumerate(ids):
+                if chunk_id not in self.id_to_pos and chunk_id not in seen:
+                    seen.add(chunk_id)
+                    keep.append(i)
+            if not keep:
+                return
+            vectors = np.asarray([embeddings[i] for i in keep], dtype=np.float32)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.spec = self.spec or index_spec(dim=self.dim)
+                self.pending = np.zeros((0, self.dim), dtype=np.float32)
+                self._set_meta(version=STORE_VERSION, spec=self.spec, dim=self.dim)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({self.dim})")
+
+            start = len(self.ids)
+            rows = []
+            for offset, i in enumerate(keep):
+                pos, chunk_id, metadata = start + offset, ids[i], metadatas[i] or {}
+                self.ids.append(chunk_id)
+                self.id_to_pos[chunk_id] = pos
+                rows.append((pos, chunk_id, *(self._column_value(f, metadata) for f in _FILTER_FIELDS),
+                             documents[i], json.dumps(metadata, ensure_ascii=False)))
+            self.alive = np.concatenate([self.alive, np.ones(len(keep), dtype=bool)])
+            for field in _FILTER_FIELDS:
+                codes, values, lookup = self.columns[field]
+                new = [self._intern(values, lookup, (metadatas[i] or {}).get(field)) for i in keep]
+                self.columns[field][0] = np.concatenate([codes, np.asarray(new, dtype=np.int32)])
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO chunks (pos, id, company, year, source, document, metadata) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+            if self.index is not None:
+                self._writable().add(vectors)
+            else:
+                self.pending = np.concatenate([self.pending, vectors])
+                if len(self.pending) >= max(train_size(self.spec), 1):
+                    self._train()
+            self.dirty = True
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        with self._lock:
+            self.delete(ids=[chunk_id for chunk_id in ids if chunk_id in self.id_to_pos])
+            self.add(ids, embeddings, documents, metadatas)
+
+    def _train(self):
+        faiss = self._faiss
+        print(f"🧭 Training FAISS index {self.spec} on {len(self.pending)} vectors")
+        index = faiss.index_factory(self.dim, self.spec, faiss.METRIC_L2)
+        index.train(self.pending)
+        index.add(self.pending)
+        if hasattr(index, "make_direct_map"):
+            index.make_direct_map()   # IVF: reconstruct() for exact filtered search and get(embeddings)
+        self.index, self.mapped = index, False
+        self.pending = np.zeros((0, self.dim), dtype=np.float32)
+
+    def delete(self, ids):
+        with self._lock:
+            positions = [self.id_to_pos.pop(chunk_id) for chunk_id in ids if chunk_id in self.id_to_pos]
+            if not positions:
+                return
+            self.alive[positions] = False
+            with self._conn:
+                self._conn.executemany("UPDATE chunks SET alive = 0, document = NULL, metadata = NULL WHERE pos = ?",
+                                       [(pos,) for pos in positions])
+            self.dirty = True
+
+    def update(self, ids, metadatas):
+        """Replace the metadata of stored chunks (vectors and documents are kept)."""
+        with self._lock:
+            rows = []
+            for chunk_id, metadata in zip(ids, metadatas):
+                pos = self.id_to_pos.get(chunk_id)
+                if pos is None:
+                    continue
+                metadata = metadata or {}
+                for field in _FILTER_FIELDS:
+                    codes, values, lookup = self.columns[field]
+                    codes[pos] = self._intern(values, lookup, metadata.get(field))
+                rows.append((*(self._column_value(f, metadata) for f in _FILTER_FIELDS),
+                             json.dumps(metadata, ensure_ascii=False), pos))
+            with self._conn:
+                self._conn.executemany("UPDATE chunks SET company = ?, year = ?, source = ?, metadata = ? "
+                                       "WHERE pos = ?", rows)
+
+    @staticmethod
+    def _column_value(field, metadata):
+        value = metadata.get(field)
+        return None if value is None else str(value)
+
+    # -- reads ------------------------------------------------------------------------
+
+    def _rows(self, positions):
+        if not positions:
+            return {}
+        rows = {}
+        for i in range(0, len(positions), 900):   # SQLite host parameter limit
+            batch = positions[i:i + 900]
+            marks = ",".join("?" * len(batch))
+            for pos, document, metadata in self._conn.execute(
+                    f"SELECT pos, document, metadata FROM chunks WHERE pos IN ({marks})", batch):
+                rows[pos] = (document, json.loads(metadata) if metadata else {})
+        return rows
+
+    def _vectors(self, positions):
+        """Decoded (for quantized storage: approximate) vectors at `positions`."""
+        positions = np.asarray(positions, dtype=np.int64)
+        out = np.empty((len(positions), self.dim or 0), dtype=np.float32)
+        indexed = self.index.ntotal if self.index is not None else 0
+        in_index = positions < indexed
+        if in_index.any():
+            out[in_index] = self.index.reconstruct_batch(positions[in_index])
+        if (~in_index).any():
+            out[~in_index] = self.pending[positions[~in_index] - indexed]
+        return out
+
+    def _result(self, positions, include, extra=None):
+        rows = self._rows([int(p) for p in positions]) if {"documents", "metadatas"} & set(include) else {}
+        result = {"ids": [self.ids[p] for p in positions]}
+        if "documents" in include:
+            result["documents"] = [rows[p][0] for p in positions]
+        if "metadatas" in include:
+            result["metadatas"] = [rows[p][1] for p in positions]
+        if "embeddings" in include:
+            result["embeddings"] = [v.tolist() for v in self._vectors(positions)] if len(positions) else []
+        result.update(extra or {})
+        return result
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit=None, offset=None, where=None):
+        """Chunks by id (missing ids are left out) or, without ids, a page of all chunks in insertion order."""
+        with self._lock:
+            if ids is not None:
+                positions = [self.id_to_pos[chunk_id] for chunk_id in ids if chunk_id in self.id_to_pos]
+            else:
+                mask = self._mask(where)
+                positions = np.flatnonzero(mask).tolist()
+                positions = positions[offset or 0:(offset or 0) + limit if limit else None]
+            return self._result(positions, include)
+
+    def _field_mask(self, field, allowed):
+        codes, _, lookup = self.columns[field]
+        wanted = [lookup[str(v)] for v in allowed if str(v) in lookup]
+        return np.isin(codes, wanted) if wanted else np.zeros(len(codes), dtype=bool)
+
+    def _where_mask(self, where):
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                masks = [self._where_mask(c) for c in condition]
+                combined = np.logical_and.reduce(masks) if key == "$and" else np.logical_or.reduce(masks)
+                mask &= combined if masks else (key == "$and")
+            elif key in self.columns:
+                if isinstance(condition, dict):
+                    if "$in" in condition:
+                        mask &= self._field_mask(key, condition["$in"])
+                    if "$eq" in condition:
+                        mask &= self._field_mask(key, [condition["$eq"]])
+                else:
+                    mask &= self._field_mask(key, [condition])
+            else:
+                # Field without an in-memory column: evaluate on the sidecar metadata
+                positions = np.flatnonzero(mask & self.alive).tolist()
+                rows = self._rows(positions)
+                keep = [pos for pos in positions if matches_where({key: condition}, rows[pos][1])]
+                mask = np.zeros(len(self.ids), dtype=bool)
+                mask[keep] = True
+        return mask
+
+    def _mask(self, where):
+        return self.alive & self._where_mask(where) if where else self.alive.copy()
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        """
+        Nearest chunks per query embedding, in collection.query's shape (one list per query).
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dim or 1)
+        results = {"ids": [], "distances": []}
+        for field in ("documents", "metadatas", "embeddings"):
+            if field in include:
+                results[field] = []
+        with self._lock:
+            if where or not self.alive.all():
+                mask = self._mask(where)
+                allowed = int(mask.sum())
+            else:
+                mask, allowed = None, len(self.ids)
+            for query in queries:
+                if not allowed:
+                    positions, distances = [], []
+                else:
+                    positions, distances = self._search(query, n_results, mask, allowed)
+                found = self._result(positions, include)
+                for field in results:
+                    results[field].append(distances if field == "distances" else found[field])
+        return results
+
+    def _exact(self, query, positions, k):
+        distances = ((self._vectors(positions) - query) ** 2).sum(axis=1)
+        order = np.argsort(distances, kind="stable")[:k]
+        return positions[order].tolist(), distances[order].tolist()
+
+    def _flat(self):
+        """Flat index over the stored int8 / float16 codes (HNSW storage, IVF-PQ re-rank vectors)."""
+        if "HNSW" in self.spec:
+            return self._faiss.downcast_index(self.index.storage)
+        if "Refine" in self.spec:
+            return self._faiss.downcast_index(self.index.refine_index)
+        return None
+
+    def _search(self, query, k, mask, allowed):
+        faiss = self._faiss
+        hits = []
+        indexed = self.index.ntotal if self.index is not None else 0
+        if indexed:
+            exact = mask is not None and allowed <= EXACT_FILTER_LIMIT
+            index = self._flat() if exact else None
+            if index is not None:
+                params = faiss.SearchParameters()   # scan of the codes; the bitmap skips all but `allowed`
+            elif "HNSW" in self.spec:
+                # A selective filter needs a wider beam to still find k allowed neighbours
+                index = self.index
+                ef = max(FAISS_EF_SEARCH, 2 * k, int(k * len(self.ids) / allowed) if mask is not None else 0)
+                params = faiss.SearchParametersHNSW(efSearch=min(ef, 4096))
+            else:
+                # Plain IVF-PQ has no flat codes: a selective filter probes every list instead
+                index = self.index
+                params = faiss.SearchParametersIVF(nprobe=FAISS_NLIST if exact else FAISS_NPROBE)
+            if mask is not None:
+                bitmap = np.packbits(mask[:indexed], bitorder="little")
+                params.sel = faiss.IDSelectorBitmap(indexed, faiss.swig_ptr(bitmap))
+            if index is self.index and "Refine" in self.spec:
+                params = faiss.IndexRefineSearchParameters(k_factor=FAISS_REFINE_K, base_index_params=params)
+            distances, positions = index.search(query[None, :], k, params=params)
+            hits = [(float(d), int(p)) for d, p in zip(distances[0], positions[0]) if p >= 0]
+        if len(self.pending):
+            pending = np.arange(indexed, len(self.ids))
+            if mask is not None:
+                pending = pending[mask[indexed:]]
+            if len(pending):
+                positions, distances = self._exact(query, pending, k)
+                hits.extend(zip(distances, positions))
+        hits.sort()
+        return [p for _, p in hits[:k]], [d for d, _ in hits[:k]]
+
+    # -- persistence ------------------------------------------------------------------
+
+    def save(self):
+        """Write the index and pending vectors; compacts first if enough of the index is dead."""
+        with self._lock:
+            if not self.dirty:
+                return
+            dead = len(self.ids) - len(self.id_to_pos)
+            if dead and dead >= FAISS_COMPACT_RATIO * len(self.ids):
+                self.compact()
+            if self.index is not None:
+                # Copy a mapped index into memory first: its pages belong to the file replaced here
+                tmp = self.index_file + ".tmp"
+                self._faiss.write_index(self._writable(), tmp)
+                os.replace(tmp, self.index_file)
+            elif os.path.exists(self.index_file):
+                os.remove(self.index_file)   # compacted below the training size: all vectors are pending
+            tmp = self.pending_file + ".tmp.npy"
+            np.save(tmp, self.pending)
+            os.replace(tmp, self.pending_file)
+            self.dirty = False
+            if self.index is not None and FAISS_MMAP:
+                self.index = self._read_index(mmap=True)   # release the in-memory copy
+
+    def compact(self):
+        """Rebuild index and sidecar from the live chunks (renumbers positions)."""
+        with self._lock:
+            live = np.flatnonzero(self.alive)
+            vectors = self._vectors(live) if len(live) else np.zeros((0, self.dim or 0), dtype=np.float32)
+            print(f"🧹 Compacting FAISS store: {len(self.ids) - len(live)} deleted chunks")
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks WHERE alive = 0")
+                self._conn.executemany("UPDATE chunks SET pos = ? WHERE pos = ?",
+                                       [(new, int(old)) for new, old in enumerate(live)])
+            self.index, self.mapped = None, False
+            self.pending = vectors
+            if len(self.pending) >= max(train_size(self.spec), 1):
+                self._train()
+            self.ids = [self.ids[p] for p in live]
+            self.alive = np.ones(len(live), dtype=bool)
+            self.id_to_pos = {chunk_id: pos for pos, chunk_id in enumerate(self.ids)}
+            for field in _FILTER_FIELDS:
+                self.columns[field][0] = self.columns[field][0][live]
+            self.dirty = True
+
+
+def open_vector_store(persist_dir, backend=VECTOR_STORE, embedding_function=None, client=None):
+    """
+    The vector store RAGAgent writes chunks to and searches.
+
+    Args:
+        persist_dir (str): persist_store directory.
+        backend (str): "chroma" or "faiss".
+        embedding_function: Chroma embedding function (chroma backend only).
+        client: Existing chromadb client (chroma backend only; created if None).
+
+    Returns:
+        Chroma Collection | FaissStore
+    """
+    if backend == "chroma":
+        if client is None:
+            import chromadb
+            from chromadb.config import Settings
+            client = chromadb.PersistentClient(path=persist_dir, settings=Settings(allow_reset=True))
+        return client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=embedding_function)
+    if backend == "faiss":
+        return FaissStore(os.path.join(persist_dir, FAISS_DIR))
+    raise ValueError(f"VECTOR_STORE must be 'chroma' or 'faiss', got {backend!r}")
@@ -1,18 +1,27 @@
 # web_agent.py
 
 import os
-import requests
-import yfinance as yf
-from bs4 import BeautifulSoup
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from tavily_agent import tavily_search_with_date
-from langchain_core.tools import Tool
-from langgraph.prebuilt import create_react_agent
-from langchain.chat_models import init_chat_model
+from scraper import scrape_source, scrape_sources, SCRAPING_SOURCES, SCRAPE_DEADLINE
+from http_client import http_get, PROVIDER_URLS, DEFAULT_TIMEOUT as REQUEST_TIMEOUT
+from ttl_cache import ttl_cached, cache_stats, is_ok_result, ErrorText, DISK_DIR as CACHE_DIR, STALE_WHILE_REVALIDATE
+from lazy_init import lazy
+from instrumentation import observe, timed
 from dotenv import load_dotenv
 
 load_dotenv()
 
-gemini_model = init_chat_model("gemini-2.0-flash", model_provider="google_genai")
+
+def _build_gemini_model():
+    from langchain.chat_models import init_chat_model
+    return init_chat_model("gemini-2.0-flash", model_provider="google_genai")
+
+
+# Chat model and agent graph are built on first use (see get_web_agent)
+gemini_model_component = lazy("gemini_chat_model", _build_gemini_model)
 
 COMPANIES = {
     "apple": "AAPL",
@@ -22,58 +31,66 @@ COMPANIES = {
     "meta": "META"
 }
 
-SCRAPING_SOURCES = {
-    "CNBC": {
-        "base_url": "https://www.cnbc.com/search/?query={query}",
-        "item_selector": "a.Card-title",
-        "title_selector": "a.Card-title",
-        "link_prefix": ""
-    },
-    "Yahoo": {
-        "base_url": "https://finance.yahoo.com/quote/{query}/news",
-        "item_selector": "li.js-stream-content h3 a",
-        "title_selector": "li.js-stream-content h3 a",
-        "link_prefix": "https://finance.yahoo.com"
-    },
-    "MarketWatch": {
-        "base_url": "https://www.marketwatch.com/search?q={query}",
-        "item_selector": "h3.article__headline a",
-        "title_selector": "h3.article__headline a",
-        "link_prefix": ""
-    }
+# Deadline per provider in handle_company_news (seconds)
+PROVIDER_DEADLINES = {
+    "NewsAPI": float(os.getenv("NEWSAPI_DEADLINE", "6")),
+    "Tavily": float(os.getenv("TAVILY_DEADLINE", "8")),
+    "Yahoo Finance": float(os.getenv("YAHOO_DEADLINE", "6")),
+    "Alpha Vantage": float(os.getenv("ALPHA_VANTAGE_DEADLINE", "6")),
+    # One second on top of the scraper's own per-source deadline, for its timeout markers
+    "Scraper": float(os.getenv("SCRAPER_PROVIDER_DEADLINE", str(SCRAPE_DEADLINE + 1))),
 }
 
+# Cache TTLs per source (seconds)
+CACHE_TTLS = {
+    "newsapi": float(os.getenv("NEWSAPI_CACHE_TTL", "600")),
+    "yahoo": float(os.getenv("YAHOO_CACHE_TTL", "900")),
+    "alphavantage": float(os.getenv("ALPHA_VANTAGE_CACHE_TTL", "3600")),
+}
+
+# Shared pool for the provider fan-out, one worker per provider for every request the app
+# serves at once (APP_CONCURRENCY, see app.py). A provider that overruns its deadline keeps
+# its thread until the request times out.
+APP_CONCURRENCY = int(os.getenv("APP_CONCURRENCY", "16"))
+_provider_pool = ThreadPoolExecutor(
+    max_workers=APP_CONCURRENCY * len(PROVIDER_DEADLINES), thread_name_prefix="web-provider"
+)
+_provider_stats = {}
+_provider_stats_lock = threading.Lock()
+
+def _format_scrape_result(source_name, result):
+    if result == "timeout":
+        return [(None, f"[{source_name}] Zeitüberschreitung.")]
+    if result == "skipped":
+        return []
+    if isinstance(result, Exception):
+        return [(None, f"Fehler beim Scraping von {source_name}: {result}")]
+    if not result:
+        return [(None, f"[{source_name}] Keine Ergebnisse.")]
+    return [(None, f"[{source_name}] {title} ({link})") for title, link in result]
+
 def generic_scrape(source_name, config, query, max_articles=3):
-    headers = {"User-Agent": "Mozilla/5.0"}
-    url = config["base_url"].format(query=query)
     try:
-        response = requests.get(url, headers=headers)
-        soup = BeautifulSoup(response.text, "html.parser")
-        items = soup.select(config["item_selector"])[:max_articles]
-        results = []
-        for item in items:
-            tag = item.select_one(config["title_selector"])
-            if tag and tag.text.strip():
-                title = tag.text.strip()
-                link = tag.get("href", "#")
-                full_link = link if link.startswith("http") else config["link_prefix"] + link
-                results.append((None, f"[{source_name}] {title} ({full_link})"))
-        return results if results else [(None, f"[{source_name}] Keine Ergebnisse.")]
+        return _format_scrape_result(source_name, scrape_source(source_name, config, query, max_articles))
     except Exception as e:
         return [(None, f"Fehler beim Scraping von {source_name}: {e}")]
 
-def scrape_all_sources(query, max_articles=3):
+def scrape_all_sources(query, max_articles=3, total_limit=None):
+    # Alle Quellen parallel; Schlagzeilen, die mehrere Quellen liefern, erscheinen nur einmal
     all_results = []
-    for name, config in SCRAPING_SOURCES.items():
-        all_results += generic_scrape(name, config, query, max_articles)
+    results = scrape_sources(SCRAPING_SOURCES, query, max_articles, total_limit=total_limit)
+    for name, result in results.items():
+        all_results += _format_scrape_result(name, result)
     return all_results
 
+@ttl_cached("newsapi", CACHE_TTLS["newsapi"], max_entries=128, disk_dir=CACHE_DIR,
+            stale_while_revalidate=STALE_WHILE_REVALIDATE, should_cache=is_ok_result)
 def get_latest_news(query, ticker, max_articles=5):
     api_key = os.getenv("NEWS_API_KEY")
     if not api_key:
-        return ["NEWS_API_KEY fehlt."]
+        return [ErrorText("NEWS_API_KEY fehlt.")]
     
-    url = "https://newsapi.org/v2/everything"
+    url = PROVIDER_URLS["newsapi"]
     params = {
         "q": query, 
         "apiKey": api_key, 
@@ -81,7 +98,7 @@ def get_latest_news(query, ticker, max_articles=5):
         "sortBy": "publishedAt"
     }
     try:
-        response = requests.get(url, params=params)
+        response = http_get(url, provider="newsapi", params=params)
         articles = response.json().get("articles", [])
         results = []
         for a in articles[:max_articles]:
@@ -90,38 +107,138 @@ def get_latest_news(query, ticker, max_articles=5):
             source = a.get("source", {}).get("name", "")
             url = a.get("url", "")
             results.append(f"- {title}\n {description}\n ({source})\n {url}\n")
-        return results if results else ["Keine relevanten Artikel gefunden."]    
+        return results if results else [ErrorText("Keine relevanten Artikel gefunden.")]    
     except Exception as e:
-        return [f"Fehler bei NewsAPI: {e}"]
+        return [ErrorText(f"Fehler bei NewsAPI: {e}")]
 
+@ttl_cached("yahoo", CACHE_TTLS["yahoo"], max_entries=64, disk_dir=CACHE_DIR,
+            stale_while_revalidate=STALE_WHILE_REVALIDATE, should_cache=is_ok_result)
 def get_stock_price_yahoo(ticker):
     try:
+        import yfinance as yf
         ticker_data = yf.Ticker(ticker)
         hist = ticker_data.history(period="5d")
         if hist.empty:
-            return f"Keine Daten für {ticker}."
+            return ErrorText(f"Keine Daten für {ticker}.")
         last = hist.iloc[-1]
         return f"Schlusskurs am {last.name.date()}: {round(last['Close'], 2)} USD"
     except Exception as e:
-        return f"Yahoo Finance Fehler: {e}"
+        return ErrorText(f"Yahoo Finance Fehler: {e}")
 
+@ttl_cached("alphavantage", CACHE_TTLS["alphavantage"], max_entries=64, disk_dir=CACHE_DIR,
+            stale_while_revalidate=STALE_WHILE_REVALIDATE, should_cache=is_ok_result)
 def get_alpha_vantage_data(symbol):
     api_key = os.getenv("ALPHA_VANTAGE_API_KEY")
     if not api_key:
-        return "ALPHA_VANTAGE_API_KEY fehlt."
-    url = "https://www.alphavantage.co/query"
-    params = {"function": "TIME_SERIES_DAILY", "symbol": symbol, "apikey": api_key}
+        return ErrorText("ALPHA_VANTAGE_API_KEY fehlt.")
+    url = PROVIDER_URLS["alphavantage"]
+    # compact = last 100 days only, we read a single close
+    params = {"function": "TIME_SERIES_DAILY", "symbol": symbol, "outputsize": "compact", "apikey": api_key}
     try:
-        response = requests.get(url, params=params)
+        response = http_get(url, provider="alphavantage", params=params)
         data = response.json().get("Time Series (Daily)", {})
         if not data:
-            return "Keine Daten von Alpha Vantage."
+            return ErrorText("Keine Daten von Alpha Vantage.")
         latest_date = sorted(data.keys())[-1]
         close_price = data[latest_date]["4. close"]
         return f"{symbol} Schlusskurs am {latest_date}: {close_price} USD"
     except Exception as e:
-        return f"Alpha Vantage Fehler: {e}"
+        return ErrorText(f"Alpha Vantage Fehler: {e}")
+
+def _record_provider(name, seconds, status):
+    with _provider_stats_lock:
+        stats = _provider_stats.setdefault(
+            name, {"calls": 0, "ok": 0, "late": 0, "queued": 0, "failed": 0, "total_s": 0.0, "max_s": 0.0, "last_s": 0.0}
+        )
+        stats["calls"] += 1
+        stats[status] += 1
+        stats["total_s"] += seconds
+        stats["max_s"] = max(stats["max_s"], seconds)
+        stats["last_s"] = seconds
+
+
+def get_provider_stats():
+    """Per-provider call counts and latencies (seconds) of handle_company_news."""
+    with _provider_stats_lock:
+        return {
+            name: dict(stats, avg_s=round(stats["total_s"] / stats["calls"], 3) if stats["calls"] else 0.0)
+            for name, stats in _provider_stats.items()
+        }
+
+
+def _timed(name, call, func, *args):
+    # The deadline clock starts here, not at submit time: waiting for a worker is not the provider's fault
+    start = time.monotonic()
+    call["start"] = start
+    call["started"].set()
+    try:
+        result = func(*args)
+    except Exception:
+        seconds = time.monotonic() - start
+        _record_provider(name, seconds, "failed")
+        observe("web.provider", seconds, provider=name, status="failed")
+        raise
+    seconds = time.monotonic() - start
+    status = "late" if seconds > call["deadline"] else "ok"
+    _record_provider(name, seconds, status)
+    observe("web.provider", seconds, provider=name, status=status)
+    return result
+
+
+def fetch_providers(providers):
+    """
+    Run providers concurrently, each with its own deadline.
 
+    The deadline of a provider counts from the moment its call starts. A provider
+    that is still waiting for a worker thread when its deadline has passed is
+    cancelled and reported as "queued" instead of "late".
+
+    Args:
+        providers (list): (name, func, args) tuples.
+
+    Returns:
+        dict: name -> (status, result), status is "ok", "late", "queued" or "failed".
+    """
+    start = time.monotonic()
+    calls = {}
+    for name, func, args in providers:
+        call = {"deadline": PROVIDER_DEADLINES.get(name, REQUEST_TIMEOUT), "started": threading.Event()}
+        call["future"] = _provider_pool.submit(_timed, name, call, func, *args)
+        calls[name] = call
+
+    results = {}
+    for name, call in calls.items():
+        future = call["future"]
+        queue_deadline = start + call["deadline"]
+        call["started"].wait(max(0.0, queue_deadline - time.monotonic()))
+        cancelled = future.cancel()
+        if not cancelled:
+            call["started"].wait()   # running or done, so the start time is (about to be) set
+        if cancelled or call["start"] >= queue_deadline:
+            # Never got a worker within its deadline; a late start's result is dropped
+            waited = (time.monotonic() if cancelled else call["start"]) - start
+            _record_provider(name, waited, "queued")
+            observe("web.provider", waited, provider=name, status="queued")
+            results[name] = ("queued", None)
+            continue
+        try:
+            timeout = max(0.0, call["start"] + call["deadline"] - time.monotonic())
+            results[name] = ("ok", future.result(timeout=timeout))
+        except FutureTimeout:
+            results[name] = ("late", None)
+        except Exception as e:
+            results[name] = ("failed", e)
+
+    stats = get_provider_stats()
+    timings = ", ".join(
+        f"{name}={results[name][0]}" if results[name][0] in ("late", "queued") else f"{name}={stats[name]['last_s']:.2f}s"
+        for name in calls
+    )
+    print(f"⏱️ Provider fan-out in {time.monotonic() - start:.2f}s ({timings})")
+    return results
+
+
+@timed("web.company_news")
 def handle_company_news(query: str) -> str:
     lines = []
     ticker = None
@@ -138,44 +255,83 @@ def handle_company_news(query: str) -> str:
 
     lines.append(f"📊 Daten für {name.capitalize()} ({ticker})")
 
-    lines.append("\n🔎 Aktuelle Nachrichten via NewsAPI:")
-    lines.extend(get_latest_news(name, ticker))
+    # All providers are queried at once; the answer is built from whatever is back in time
+    results = fetch_providers([
+        ("NewsAPI", get_latest_news, (name, ticker)),
+        ("Tavily", tavily_search_with_date, (query,)),
+        ("Yahoo Finance", get_stock_price_yahoo, (ticker,)),
+        ("Alpha Vantage", get_alpha_vantage_data, (ticker,)),
+        ("Scraper", scrape_all_sources, (ticker, 3, 6)),
+    ])
+    sections = [
+        ("NewsAPI", "\n🔎 Aktuelle Nachrichten via NewsAPI:"),
+        ("Tavily", "\n🌍 Tavily (mit Datum):"),
+        ("Yahoo Finance", "\n💰 Yahoo Finance:"),
+        ("Alpha Vantage", "\n📈 Alpha Vantage:"),
+        ("Scraper", "\n📰 Schlagzeilen (CNBC, Yahoo, MarketWatch):"),
+    ]
+    for provider, title in sections:
+        lines.append(title)
+        status, result = results[provider]
+        if status == "late":
+            lines.append(f"⏱️ {provider} hat nicht rechtzeitig geantwortet (> {PROVIDER_DEADLINES[provider]:.0f}s).")
+        elif status == "queued":
+            lines.append(f"⏳ {provider} wurde nicht rechtzeitig gestartet (alle Verbindungen belegt).")
+        elif status == "failed":
+            lines.append(f"❌ {provider} Fehler: {result}")
+        elif isinstance(result, list):
+            # scrape_all_sources returns (None, text) pairs
+            lines.extend(item[1] if isinstance(item, tuple) else item for item in result)
+        else:
+            lines.append(result)
 
-    lines.append("\n🌍 Tavily (mit Datum):")
-    lines.extend(tavily_search_with_date(query))
+    return "\n".join(lines)
 
-    lines.append("\n💰 Yahoo Finance:")
-    lines.append(get_stock_price_yahoo(ticker))
+WEB_AGENT_PROMPT = (
+    "Du bist ein spezialisierter Assistent für Finanzmärkte und Unternehmensnachrichten.\n"
+    "Deine Aufgabe ist es, auf Deutsch präzise und aktuelle Informationen über börsennotierte Unternehmen bereitzustellen.\n\n"
+    "Wenn ein Benutzer eine Frage zu einem Unternehmen stellt (z. B. Apple, Microsoft, Nvidia usw.),\n"
+    "verwende das Tool `get_company_news`, um aktuelle Finanzdaten, Aktienkurse und Nachrichtenartikel abzurufen.\n\n"
+    "Antworten sollten klar, strukturiert und informativ sein – idealerweise mit:\n"
+    "• 📈 Letztem Schlusskurs (z. B. über Yahoo Finance oder Alpha Vantage)\n"
+    "• 🗞 Aktuelle Nachrichten (NewsAPI oder Tavily)\n"
+    "• 📝 Quellenangabe, falls möglich\n\n"
+    "Wenn die Firma nicht erkannt wurde, weise höflich auf die verfügbaren Optionen hin.\n"
+    "Wenn du eine Anfrage bekommst, extrahiere nur den Firmennamen (z.B. Apple, Microsoft) aus der Nutzerfrage und rufe das Tool `get_company_news` mit genau diesem Firmennamen als Argument auf."
+    "Wenn der Benutzer eine Frage zu einem Unternehmen stellt, rufe sofort das Tool `get_company_news` mit dem Unternehmensnamen als Argument auf und liefere das Ergebnis ohne weitere Rückfragen."
+)
 
-    lines.append("\n📈 Alpha Vantage:")
-    lines.append(get_alpha_vantage_data(ticker))
 
-    return "\n".join(lines)
+def _build_web_agent():
+    from langchain_core.tools import Tool
+    from langgraph.prebuilt import create_react_agent
 
-web_news_tool = Tool(
-    name="get_company_news",
-    func=handle_company_news,
-    description="Aktuelle Nachrichten & Finanzdaten zu einem Unternehmen abrufen (Name eingeben)"
-)
+    web_news_tool = Tool(
+        name="get_company_news",
+        func=handle_company_news,
+        description="Aktuelle Nachrichten & Finanzdaten zu einem Unternehmen abrufen (Name eingeben)"
+    )
 
-web_agent = create_react_agent(
-    model=gemini_model,
-    tools=[web_news_tool],
-    name="web_agent",
-    prompt=(
-        "Du bist ein spezialisierter Assistent für Finanzmärkte und Unternehmensnachrichten.\n"
-        "Deine Aufgabe ist es, auf Deutsch präzise und aktuelle Informationen über börsennotierte Unternehmen bereitzustellen.\n\n"
-        "Wenn ein Benutzer eine Frage zu einem Unternehmen stellt (z. B. Apple, Microsoft, Nvidia usw.),\n"
-        "verwende das Tool `get_company_news`, um aktuelle Finanzdaten, Aktienkurse und Nachrichtenartikel abzurufen.\n\n"
-        "Antworten sollten klar, strukturiert und informativ sein – idealerweise mit:\n"
-        "• 📈 Letztem Schlusskurs (z. B. über Yahoo Finance oder Alpha Vantage)\n"
-        "• 🗞 Aktuelle Nachrichten (NewsAPI oder Tavily)\n"
-        "• 📝 Quellenangabe, falls möglich\n\n"
-        "Wenn die Firma nicht erkannt wurde, weise höflich auf die verfügbaren Optionen hin.\n"
-        "Wenn du eine Anfrage bekommst, extrahiere nur den Firmennamen (z.B. Apple, Microsoft) aus der Nutzerfrage und rufe das Tool `get_company_news` mit genau diesem Firmennamen als Argument auf."
-        "Wenn der Benutzer eine Frage zu einem Unternehmen stellt, rufe sofort das Tool `get_company_news` mit dem Unternehmensnamen als Argument auf und liefere das Ergebnis ohne weitere Rückfragen."
-
-        
+    return create_react_agent(
+        model=gemini_model_component.get(),
+        tools=[web_news_tool],
+        name="web_agent",
+        prompt=WEB_AGENT_PROMPT
     )
-)
 
+
+web_agent_component = lazy("web_agent", _build_web_agent)
+
+
+def get_web_agent():
+    """The web ReAct agent, built on first use."""
+    return web_agent_component.get()
+
+
+def __getattr__(name):
+    # `from web_agent import web_agent` / `gemini_model` keep working, but build lazily
+    if name == "web_agent":
+        return web_agent_component.get()
+    if name == "gemini_model":
+        return gemini_model_component.get()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")